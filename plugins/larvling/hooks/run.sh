@@ -0,0 +1,25 @@
+#!/bin/sh
+# Launch one Larvling hook: sh run.sh <hook>  (see scripts/larvling_hook.py)
+#
+# Runs larvling_hook.py with the first python3.1x/python3/python on PATH.
+# That name (never a path) is cached per user in
+# ${CLAUDE_PLUGIN_DATA:-~/.cache/larvling}/python, outside any project a
+# clone could plant a file in, and a cached value is used only while it is
+# one of the probed names and still resolves on PATH.
+
+C="${CLAUDE_PLUGIN_DATA:-$HOME/.cache/larvling}/python"
+{ read -r PY < "$C"; } 2>/dev/null
+case "$PY" in
+  python3.13|python3.12|python3.11|python3.10|python3|python)
+    command -v "$PY" >/dev/null 2>&1 || PY= ;;
+  *) PY= ;;
+esac
+if [ -z "$PY" ]; then
+  for p in python3.13 python3.12 python3.11 python3.10 python3 python; do
+    if command -v "$p" >/dev/null 2>&1; then PY=$p; break; fi
+  done
+  [ -n "$PY" ] && mkdir -p "${C%/*}" && printf '%s\n' "$PY" > "$C.$$" && mv -f "$C.$$" "$C"
+fi
+
+ROOT="${CLAUDE_PLUGIN_ROOT:-$(cd "$(dirname "$0")/.." && pwd)}"
+PYTHONPATH="$ROOT/scripts" exec "${PY:-python}" "$ROOT/scripts/larvling_hook.py" "$@"
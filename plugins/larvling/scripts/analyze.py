@@ -1,27 +1,37 @@
 """
 Unified exchange analysis — Stop command hook.
 
-Reads the transcript, parses the last exchange, calls Sonnet (via sdk.py)
-to identify knowledge, session tags, and tasks in a single
-SDK call, then writes results to SQLite.
+Analyzes the exchanges the Stop hook queues: workers.py coalesces a
+session's pending exchanges into one batch, and analyze_batch() calls Sonnet
+(via sdk.py) to identify knowledge, session tags, and tasks in a single SDK
+call, then writes the results to SQLite and marks the batch done in the same
+transaction. Run as the Stop hook's second step, it only makes sure the
+supervisor is running.
 """
 
-import asyncio
 import json
 import os
+import re
 import sys
+import time
+from collections import Counter
 
+import eventlog
 from config import get_config
 from db import (
     open_db,
+    fts_query,
+    cache_analysis,
+    cached_analysis,
+    complete_analysis,
     has_table,
+    skip_analysis,
     ensure_session,
     record_message,
+    release_analysis,
     log,
 )
-from hooks_util import run_detached_or_inline
-from sdk import call_model
-from transcript import parse_last_user_text, parse_last_turn, wait_for_transcript_stable
+from hooks_util import read_hook_payload
 
 
 # ---------------------------------------------------------------------------
@@ -49,13 +59,18 @@ VALID_STATUS = {"open", "done", "dropped"}
 EXTRACTION_PROMPT = """\
 Analyze this conversation exchange and extract structured data.
 
-USER said: {user_text}
+{exchanges}
 
-AGENT responded: {agent_text}
+## Existing records most likely to overlap
+
+Retrieved locally by full-text match and vector similarity against the \
+exchange text (all task statuses included):
+
+{candidates}
 
 ## Database access
 
-Query the database to check for existing data before deciding actions:
+Only needed when the records above are not enough to decide:
 
 {python} "{query_script}" "<SQL>" --read-only
 
@@ -67,6 +82,9 @@ Six tables in 3 parent→child pairs:
 - `sessions` (id TEXT PK, started_at, ended_at, duration_min, title, agent_summary, exchange_count, summary_at, summary_msg_count, tags)
 - `messages` (id INTEGER PK, session_id TEXT FK, timestamp, role, content, metadata)
 
+Full-text indexes (FTS5, rowid = source row id): `statements_fts(claim)`, \
+`topics_fts(title, tags)`, `tasks_fts(title)`, `messages_fts(content)`.
+
 ## Workflow — follow these three phases in order
 
 ### Phase 1 — Identify candidates
@@ -88,26 +106,27 @@ work leaves the open list instead of lingering until the next tidy.
 
 ### Phase 2 — Dedup check (mandatory)
 
-For EACH knowledge candidate, run at least one query against topics and statements \
-to check for overlap. Use LIKE queries on title and claim columns.
+Check EACH knowledge candidate against the topics and statements listed under \
+"Existing records", and EACH task candidate against the tasks and their updates \
+listed there. The list already holds the closest full-text matches, so in most cases \
+you can decide without running any query. Query the database only when a candidate \
+plausibly overlaps something the list does not show (e.g. it is phrased very \
+differently); prefer the FTS indexes, ranked by bm25, over LIKE scans — e.g. \
+`SELECT s.id, s.topic_id, s.claim FROM statements_fts JOIN statements s ON s.id = statements_fts.rowid \
+WHERE statements_fts MATCH 'deploy* OR docker*' ORDER BY bm25(statements_fts) LIMIT 10`.
 
-For EACH task candidate, run at least one query against tasks and their updates \
-to check for overlap — and query ALL statuses, not just open ones \
-(e.g. `SELECT id, title, status FROM tasks WHERE title LIKE '%...%'`). A task with \
-`status='dropped'` was deliberately retired, and one with `status='done'` is already \
-complete: treat both as tombstones. If a candidate resembles a dropped or done task, \
-`skip` it — never recreate or reopen retired work unless the user explicitly asked for \
-it again in this exchange.
+A task with `status='dropped'` was deliberately retired, and one with `status='done'` \
+is already complete: treat both as tombstones. If a candidate resembles a dropped or \
+done task, `skip` it — never recreate or reopen retired work unless the user explicitly \
+asked for it again in this exchange.
 
-For session tags, query the current session's tags:
-`SELECT tags FROM sessions WHERE id = '{session_id}'`
+For session tags, start from the current session tags listed under "Existing records".
 
-This step is mandatory — skipping it creates duplicates. You must run the queries \
-before proceeding to Phase 3.
+This step is mandatory — skipping it creates duplicates.
 
 ### Phase 3 — Decide actions
 
-Based on your query results from Phase 2, assign an action for each candidate.
+Based on your dedup check in Phase 2, assign an action for each candidate.
 
 **Knowledge actions:**
 - **add_topic**: no existing overlap — create a new topic with its first statement
@@ -207,12 +226,188 @@ EXTRACTION_SCHEMA = {
 }
 
 
-def build_extraction_prompt(user_text, agent_text, session_id=""):
-    """Format the extraction prompt with the exchange text."""
+def format_exchanges(exchanges):
+    """Render queued exchanges (oldest first) for the extraction prompt."""
+    def one(e):
+        return f"USER said: {e['user_text'] or ''}\n\nAGENT responded: {e['agent_text'] or ''}"
+
+    if len(exchanges) == 1:
+        return one(exchanges[0])
+    parts = [
+        f"These are {len(exchanges)} consecutive exchanges from one session, oldest "
+        "first. Extract from all of them together; where a later exchange revises "
+        "an earlier one, the later one wins."
+    ]
+    for i, e in enumerate(exchanges, 1):
+        parts.append(f"### Exchange {i}\n\n{one(e)}")
+    return "\n\n".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Candidate retrieval — the dedup context embedded in the prompt
+# ---------------------------------------------------------------------------
+
+CANDIDATE_TERMS = 48  # distinct exchange words used as the FTS query
+CANDIDATE_STATEMENTS = 15
+CANDIDATE_TOPICS = 8
+CANDIDATE_TASKS = 10
+CANDIDATE_UPDATES = 2  # latest updates shown per task
+CANDIDATE_CLAIM_CHARS = 200
+CANDIDATE_SIMILAR = 5  # nearest statements by vector, per exchange side
+CANDIDATE_MIN_SIMILARITY = 0.3
+
+_STOPWORDS = frozenset("""
+    about above after again against also because been before being below between
+    both but can could did does doing down during each few for from further had
+    has have having her here hers herself him himself his how into its itself just
+    let like more most much must not now off once only other our ours out over own
+    same she should some such than that the their theirs them then there these they
+    this those through too under until use used using very was way were what when
+    where which while who whom why will with would you your yours yourself
+    all and any are get got make need one see want yes
+""".split())
+
+
+def _candidate_terms(exchanges):
+    """The exchange's most frequent distinctive words, as an FTS MATCH query."""
+    counts = {}
+    for e in exchanges:
+        text = f"{e['user_text'] or ''} {e['agent_text'] or ''}".lower()
+        for w in re.findall(r"[^\W\d_]\w{2,}", text):
+            if w not in _STOPWORDS:
+                counts[w] = counts.get(w, 0) + 1
+    top = sorted(counts, key=counts.get, reverse=True)[:CANDIDATE_TERMS]
+    return fts_query(" ".join(top)) if top else None
+
+
+def _add_statement_row(topics, r):
+    """Group a statement+topic row under its topic in *topics* (id -> dict)."""
+    topic = topics.setdefault(r["topic_id"], {
+        "id": r["topic_id"], "title": r["title"], "domain": r["domain"],
+        "tags": r["tags"], "statements": [],
+    })
+    topic["statements"].append({"id": r["id"], "claim": r["claim"]})
+
+
+def find_candidates(conn, exchanges, session_id=""):
+    """Rank existing topics, statements and tasks against the exchange text.
+
+    Uses the FTS5 indexes (bm25), plus the nearest statements by vector
+    similarity (vectors.py), so the model gets the likely dedup matches up
+    front instead of querying for them. Returns
+    {"topics": [...], "tasks": [...], "session_tags": str|None}; each topic
+    carries its matched statements.
+    """
+    found = {"topics": [], "tasks": [], "session_tags": None}
+    if session_id:
+        row = conn.execute("SELECT tags FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        found["session_tags"] = row["tags"] if row else None
+
+    q = _candidate_terms(exchanges)
+    if not q:
+        return found
+
+    topics = {}
+    for r in conn.execute(
+        "SELECT t.id, t.title, t.domain, t.tags FROM topics_fts "
+        "JOIN topics t ON t.id = topics_fts.rowid "
+        "WHERE topics_fts MATCH ? ORDER BY bm25(topics_fts) LIMIT ?",
+        (q, CANDIDATE_TOPICS),
+    ):
+        topics[r["id"]] = dict(r, statements=[])
+    for r in conn.execute(
+        "SELECT s.id, s.claim, t.id AS topic_id, t.title, t.domain, t.tags "
+        "FROM statements_fts JOIN statements s ON s.id = statements_fts.rowid "
+        "JOIN topics t ON t.id = s.topic_id "
+        "WHERE statements_fts MATCH ? ORDER BY bm25(statements_fts) LIMIT ?",
+        (q, CANDIDATE_STATEMENTS),
+    ):
+        _add_statement_row(topics, r)
+    _add_similar(conn, exchanges, topics)
+    found["topics"] = list(topics.values())
+
+    tasks = conn.execute(
+        "SELECT k.id, k.title, k.status, k.priority, k.horizon FROM tasks_fts "
+        "JOIN tasks k ON k.id = tasks_fts.rowid "
+        "WHERE tasks_fts MATCH ? ORDER BY bm25(tasks_fts) LIMIT ?",
+        (q, CANDIDATE_TASKS),
+    ).fetchall()
+    for k in tasks:
+        updates = conn.execute(
+            "SELECT content FROM updates WHERE task_id = ? ORDER BY id DESC LIMIT ?",
+            (k["id"], CANDIDATE_UPDATES),
+        ).fetchall()
+        found["tasks"].append(dict(k, updates=[u["content"] for u in updates]))
+    return found
+
+
+def _add_similar(conn, exchanges, topics):
+    """Add statements whose vectors are close to the exchange (paraphrases FTS misses)."""
+    import vectors
+
+    vectors.sync(conn)
+    texts = [t for e in exchanges for t in (e["user_text"], e["agent_text"]) if t]
+    seen = {st["id"] for t in topics.values() for st in t["statements"]}
+    ids = []
+    for hits in vectors.search_many(conn, texts, "statement", CANDIDATE_SIMILAR, CANDIDATE_MIN_SIMILARITY):
+        ids.extend(sid for sid, _ in hits if sid not in seen and sid not in ids)
+    if not ids:
+        return
+    placeholders = ",".join("?" * len(ids))
+    for r in conn.execute(
+        f"SELECT s.id, s.claim, t.id AS topic_id, t.title, t.domain, t.tags "
+        f"FROM statements s JOIN topics t ON t.id = s.topic_id WHERE s.id IN ({placeholders})",
+        ids,
+    ):
+        _add_statement_row(topics, r)
+
+
+def format_candidates(found):
+    """Render find_candidates() output as a compact, ID-tagged block."""
+    def clip(text):
+        text = " ".join((text or "").split())
+        if len(text) > CANDIDATE_CLAIM_CHARS:
+            return text[: CANDIDATE_CLAIM_CHARS - 3] + "..."
+        return text
+
+    lines = []
+    if found["topics"]:
+        lines.append("Topics and statements:")
+        for t in found["topics"]:
+            lines.append(f"- [topic_id={t['id']}] {t['title']} ({t['domain']}) — tags: {t['tags']}")
+            for st in t["statements"]:
+                lines.append(f"  - [statement_id={st['id']}] {clip(st['claim'])}")
+    else:
+        lines.append("Topics and statements: no matches.")
+    if found["tasks"]:
+        lines.append("Tasks:")
+        for k in found["tasks"]:
+            lines.append(
+                f"- [task_id={k['id']}] {k['title']} "
+                f"(status={k['status']}, priority={k['priority']}, horizon={k['horizon']})"
+            )
+            for u in k["updates"]:
+                lines.append(f"  - update: {clip(u)}")
+    else:
+        lines.append("Tasks: no matches.")
+    lines.append(f"Current session tags: {found['session_tags'] or '(none)'}")
+    return "\n".join(lines)
+
+
+def build_extraction_prompt(exchanges, session_id="", candidates=None):
+    """Format the extraction prompt with the queued exchanges' text.
+
+    *candidates* is find_candidates() output; omitted, the block says so and
+    the model falls back to querying.
+    """
     query_script = os.path.join(os.path.dirname(__file__), "query.py")
+    if candidates is None:
+        block = "(not available — query the database for dedup)"
+    else:
+        block = format_candidates(candidates)
     return EXTRACTION_PROMPT.format(
-        user_text=user_text,
-        agent_text=agent_text,
+        exchanges=format_exchanges(exchanges),
+        candidates=block,
         session_id=session_id or "",
         query_script=query_script.replace("\\", "/"),
         python=os.path.basename(sys.executable),
@@ -229,152 +424,216 @@ def _skip(session_id, action, reason, **extra):
     log("extraction_skipped", session_id, action=action, reason=reason, **extra)
 
 
-def _parse_id(value, field_name, action, session_id):
-    """Parse an integer ID field. Returns int or None (with logging)."""
+def _parse_id(value, field_name, action, skip):
+    """Parse an integer ID field. Returns int or None (after calling
+    skip(action, reason, **extra))."""
     if value is None:
-        _skip(session_id, action, f"missing {field_name}")
+        skip(action, f"missing {field_name}")
         return None
     try:
         return int(value)
     except (ValueError, TypeError):
-        _skip(session_id, action, f"invalid {field_name}", value=str(value))
+        skip(action, f"invalid {field_name}", value=str(value))
         return None
 
 
+IN_CHUNK = 500  # values per IN (...) list, well under SQLite's variable limit
+_COUNTED_STATUSES = ("open", "dropped", "done")  # add_task title dedup, see below
+
+
+def _select_in(conn, sql, values):
+    """Rows of *sql*, whose ``{marks}`` is an IN list, over all of *values*."""
+    values = list(values)
+    rows = []
+    for i in range(0, len(values), IN_CHUNK):
+        chunk = values[i : i + IN_CHUNK]
+        rows.extend(conn.execute(sql.format(marks=",".join("?" * len(chunk))), chunk))
+    return rows
+
+
+def _next_id(conn, table):
+    """The id the next INSERT into AUTOINCREMENT *table* will get."""
+    return 1 + conn.execute(
+        f"SELECT MAX(COALESCE((SELECT MAX(id) FROM {table}), 0), "
+        f"COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0))",
+        (table,),
+    ).fetchone()[0]
+
+
+def _insert_many(conn, sql, rows, first_id):
+    """executemany() an INSERT; return a function mapping the provisional
+    ids handed out from *first_id* to the ids the rows actually got.
+
+    They only differ if another connection inserted in between: one
+    executemany under the write lock gets consecutive ids.
+    """
+    conn.executemany(sql, rows)
+    offset = conn.execute("SELECT last_insert_rowid()").fetchone()[0] - len(rows) + 1 - first_id
+    return lambda i: i + offset if i >= first_id else i
+
+
+def _same(i):
+    return i
+
+
 def process_knowledge(conn, knowledge_list, session_id=None):
     """Process extracted knowledge into topics+statements tables.
 
     Handles 4 actions: add_topic, add_statement, update_statement, update_topic.
     Never deletes data — retirement is done via updates, not removal.
     Returns (topics_inserted, stmts_inserted, stmts_updated, topics_updated).
+
+    Set-based: fields are validated up front, referenced topics and
+    statements are resolved with one query per table, dedup runs against
+    the prefetched claims, and the writes go out with executemany. Results,
+    skips and counters match applying the items one by one, in order.
     """
     if not knowledge_list or not has_table(conn, "topics"):
         return 0, 0, 0, 0
 
-    topics_inserted = 0
-    stmts_inserted = 0
-    stmts_updated = 0
-    topics_updated = 0
+    # Pass 1: checks that need no database, in each action's original order.
+    items = []
+
+    def skip(action, reason, **extra):
+        # Logged in pass 3, so skips come out in item order.
+        items.append(("skip", None, (action, reason, extra)))
 
     for item in knowledge_list:
         action = item.get("action", "").strip().lower()
-        if action not in (
-            "add_topic",
-            "add_statement",
-            "update_statement",
-            "update_topic",
-        ):
-            continue
-
         if action == "update_topic":
-            topic_id = _parse_id(item.get("topic_id"), "topic_id", action, session_id)
+            topic_id = _parse_id(item.get("topic_id"), "topic_id", action, skip)
             if topic_id is None:
                 continue
-            if not conn.execute(
-                "SELECT 1 FROM topics WHERE id = ?", (topic_id,)
-            ).fetchone():
-                _skip(session_id, action, "topic not found", topic_id=topic_id)
+            items.append((action, topic_id, (
+                item.get("topic_title", "").strip(),
+                item.get("domain", "").strip().lower(),
+                item.get("tags", "").strip(),
+            )))
+        elif action in ("update_statement", "add_statement"):
+            field = "statement_id" if action == "update_statement" else "topic_id"
+            ref_id = _parse_id(item.get(field), field, action, skip)
+            if ref_id is None:
                 continue
-            title = item.get("topic_title", "").strip()
-            domain = item.get("domain", "").strip().lower()
-            if domain and domain not in VALID_DOMAINS:
-                _skip(session_id, action, "invalid domain", domain=domain)
-                continue
-            tags = item.get("tags", "").strip()
-            if title:
-                conn.execute(
-                    "UPDATE topics SET title = ?, domain = COALESCE(?, domain), "
-                    "tags = COALESCE(?, tags), updated = datetime('now') WHERE id = ?",
-                    (title, domain or None, tags or None, topic_id),
-                )
-                topics_updated += 1
-            continue
-
-        if action == "update_statement":
-            stmt_id = _parse_id(
-                item.get("statement_id"), "statement_id", action, session_id
-            )
-            if stmt_id is None:
+            claim = item.get("claim", "").strip()
+            if not claim:
+                skip(action, "missing claim")
                 continue
+            items.append((action, ref_id, claim))
+        elif action == "add_topic":
             claim = item.get("claim", "").strip()
             if not claim:
-                _skip(session_id, action, "missing claim")
+                skip(action, "missing claim")
                 continue
-            if not conn.execute(
-                "SELECT 1 FROM statements WHERE id = ?", (stmt_id,)
-            ).fetchone():
-                _skip(session_id, action, "statement not found", statement_id=stmt_id)
+            topic_title = item.get("topic_title", "").strip()
+            if not topic_title:
+                skip(action, "missing topic_title")
                 continue
-            conn.execute(
-                "UPDATE statements SET claim = ?, updated = datetime('now') WHERE id = ?",
-                (claim, stmt_id),
-            )
-            stmts_updated += 1
-            continue
-
-        if action == "add_statement":
-            topic_id = _parse_id(item.get("topic_id"), "topic_id", action, session_id)
-            if topic_id is None:
+            domain = item.get("domain", "").strip().lower()
+            if not domain or domain not in VALID_DOMAINS:
+                skip(action, "invalid domain", domain=domain)
                 continue
-            claim = item.get("claim", "").strip()
-            if not claim:
-                _skip(session_id, action, "missing claim")
+            tags = item.get("tags", "").strip()
+            if not tags:
+                skip(action, "missing tags")
+                continue
+            items.append((action, None, (topic_title, domain, tags, claim)))
+
+    # Pass 2: one query per table for every id and claim the items touch.
+    topic_ids = {ref for action, ref, _ in items if action in ("update_topic", "add_statement")}
+    topics = {r[0] for r in _select_in(
+        conn, "SELECT id FROM topics WHERE id IN ({marks})", topic_ids
+    )}
+    stmt_ids = {ref for action, ref, _ in items if action == "update_statement"}
+    claims = {
+        value if action == "add_statement" else value[3]
+        for action, _, value in items if action in ("add_statement", "add_topic")
+    }
+    stmts = {}  # id -> (topic_id, claim), as the writes so far leave them
+    for r in _select_in(conn, "SELECT id, topic_id, claim FROM statements WHERE id IN ({marks})", stmt_ids):
+        stmts[r[0]] = (r[1], r[2])
+    for r in _select_in(conn, "SELECT id, topic_id, claim FROM statements WHERE claim IN ({marks})", claims):
+        stmts[r[0]] = (r[1], r[2])
+    pairs = Counter(stmts.values())
+    claim_count = Counter(claim for _, claim in stmts.values())
+
+    # Pass 3: decide each item against the running state. New rows get
+    # provisional ids, so later items can refer to them as they could when
+    # every item was written on its own.
+    next_topic, next_stmt = _next_id(conn, "topics"), _next_id(conn, "statements")
+    topic_updates, stmt_updates, new_topics, new_stmts = [], [], [], []
+
+    def add_statement(topic_id, claim):
+        stmts[next_stmt + len(new_stmts)] = (topic_id, claim)
+        pairs[(topic_id, claim)] += 1
+        claim_count[claim] += 1
+        new_stmts.append((topic_id, claim))
+
+    for action, ref_id, value in items:
+        if action == "skip":
+            _skip(session_id, value[0], value[1], **value[2])
+        elif action == "update_topic":
+            title, domain, tags = value
+            if ref_id not in topics:
+                _skip(session_id, action, "topic not found", topic_id=ref_id)
                 continue
-            if not conn.execute(
-                "SELECT 1 FROM topics WHERE id = ?", (topic_id,)
-            ).fetchone():
-                _skip(session_id, action, "topic not found", topic_id=topic_id)
+            if domain and domain not in VALID_DOMAINS:
+                _skip(session_id, action, "invalid domain", domain=domain)
+                continue
+            if title:
+                topic_updates.append((title, domain or None, tags or None, ref_id))
+        elif action == "update_statement":
+            if ref_id not in stmts:
+                _skip(session_id, action, "statement not found", statement_id=ref_id)
+                continue
+            topic_id, old = stmts[ref_id]
+            pairs[(topic_id, old)] -= 1
+            claim_count[old] -= 1
+            stmts[ref_id] = (topic_id, value)
+            pairs[(topic_id, value)] += 1
+            claim_count[value] += 1
+            stmt_updates.append((value, ref_id))
+        elif action == "add_statement":
+            if ref_id not in topics:
+                _skip(session_id, action, "topic not found", topic_id=ref_id)
                 continue
             # Exact-match dedup safety net
-            if conn.execute(
-                "SELECT 1 FROM statements WHERE topic_id = ? AND claim = ?",
-                (topic_id, claim),
-            ).fetchone():
+            if not pairs[(ref_id, value)]:
+                add_statement(ref_id, value)
+        else:
+            topic_title, domain, tags, claim = value
+            # Exact-match dedup on claim
+            if claim_count[claim]:
                 continue
-            conn.execute(
-                "INSERT INTO statements (topic_id, claim) VALUES (?, ?)",
-                (topic_id, claim),
-            )
-            stmts_inserted += 1
-            continue
-
-        # add_topic: new topic + first statement
-        claim = item.get("claim", "").strip()
-        if not claim:
-            _skip(session_id, action, "missing claim")
-            continue
-        topic_title = item.get("topic_title", "").strip()
-        if not topic_title:
-            _skip(session_id, action, "missing topic_title")
-            continue
-        domain = item.get("domain", "").strip().lower()
-        if not domain or domain not in VALID_DOMAINS:
-            _skip(session_id, action, "invalid domain", domain=domain)
-            continue
-        tags = item.get("tags", "").strip()
-        if not tags:
-            _skip(session_id, action, "missing tags")
-            continue
-
-        # Exact-match dedup on claim
-        if conn.execute(
-            "SELECT 1 FROM statements WHERE claim = ?", (claim,)
-        ).fetchone():
-            continue
-
-        cur = conn.execute(
-            "INSERT INTO topics (title, domain, tags) VALUES (?, ?, ?)",
-            (topic_title, domain, tags),
+            topic_id = next_topic + len(new_topics)
+            topics.add(topic_id)
+            new_topics.append((topic_title, domain, tags))
+            add_statement(topic_id, claim)
+
+    # Pass 4: the writes — inserts first, so updates can reach new rows too.
+    topic_ids = stmt_ids = _same
+    if new_topics:
+        topic_ids = _insert_many(
+            conn, "INSERT INTO topics (title, domain, tags) VALUES (?, ?, ?)",
+            new_topics, next_topic,
+        )
+    if new_stmts:
+        stmt_ids = _insert_many(
+            conn, "INSERT INTO statements (topic_id, claim) VALUES (?, ?)",
+            [(topic_ids(t), claim) for t, claim in new_stmts], next_stmt,
+        )
+    if topic_updates:
+        conn.executemany(
+            "UPDATE topics SET title = ?, domain = COALESCE(?, domain), "
+            "tags = COALESCE(?, tags), updated = datetime('now') WHERE id = ?",
+            [(*u[:3], topic_ids(u[3])) for u in topic_updates],
         )
-        topic_id = cur.lastrowid
-        conn.execute(
-            "INSERT INTO statements (topic_id, claim) VALUES (?, ?)",
-            (topic_id, claim),
+    if stmt_updates:
+        conn.executemany(
+            "UPDATE statements SET claim = ?, updated = datetime('now') WHERE id = ?",
+            [(claim, stmt_ids(i)) for claim, i in stmt_updates],
         )
-        topics_inserted += 1
-        stmts_inserted += 1
 
-    return topics_inserted, stmts_inserted, stmts_updated, topics_updated
+    return len(new_topics), len(new_stmts), len(stmt_updates), len(topic_updates)
 
 
 def process_tasks(conn, tasks_list, session_id=None):
@@ -382,150 +641,170 @@ def process_tasks(conn, tasks_list, session_id=None):
 
     Handles 3 actions: add_task, add_update, update_task.
     Returns (tasks_inserted, updates_inserted, tasks_updated).
+
+    Set-based like process_knowledge(): one query per table resolves the
+    referenced tasks, titles and update texts, and the writes go out with
+    executemany.
     """
     if not tasks_list or not has_table(conn, "tasks"):
         return 0, 0, 0
 
-    tasks_inserted = 0
-    updates_inserted = 0
-    tasks_updated = 0
+    # Pass 1: checks that need no database, in each action's original order.
+    items = []
+
+    def skip(action, reason, **extra):
+        # Logged in pass 3, so skips come out in item order.
+        items.append(("skip", None, (action, reason, extra), None))
 
     for task in tasks_list:
         action = task.get("action", "").strip().lower()
-        if action not in ("add_task", "add_update", "update_task"):
-            continue
-
-        if action == "add_update":
-            task_id = _parse_id(task.get("task_id"), "task_id", action, session_id)
+        if action in ("add_update", "update_task"):
+            task_id = _parse_id(task.get("task_id"), "task_id", action, skip)
             if task_id is None:
                 continue
             content = task.get("content", "").strip()
-            if not content:
-                _skip(session_id, action, "missing content")
+            if action == "add_update" and not content:
+                skip(action, "missing content")
                 continue
-            if not conn.execute(
-                "SELECT 1 FROM tasks WHERE id = ?", (task_id,)
-            ).fetchone():
-                _skip(session_id, action, "task not found", task_id=task_id)
+            items.append((action, task_id, content, task))
+        elif action == "add_task":
+            title = task.get("title", "").strip()
+            if not title:
+                skip(action, "missing title")
                 continue
-            # Exact-match dedup safety net
-            if conn.execute(
-                "SELECT 1 FROM updates WHERE task_id = ? AND content = ?",
-                (task_id, content),
-            ).fetchone():
+            domain = task.get("domain", "").strip().lower()
+            if not domain or domain not in VALID_DOMAINS:
+                skip(action, "invalid domain", domain=domain)
                 continue
-            conn.execute(
-                "INSERT INTO updates (task_id, content) VALUES (?, ?)",
-                (task_id, content),
-            )
-            updates_inserted += 1
+            priority = task.get("priority", "").strip().lower()
+            if not priority or priority not in VALID_PRIORITY:
+                skip(action, "invalid priority", priority=priority)
+                continue
+            horizon = task.get("horizon", "").strip().lower()
+            if not horizon or horizon not in VALID_HORIZON:
+                skip(action, "invalid horizon", horizon=horizon)
+                continue
+            items.append((action, None, (title, domain, priority, horizon), task))
+
+    # Pass 2: one query per table for every id, title and update text.
+    task_ids = {task_id for action, task_id, _, _ in items if task_id is not None}
+    titles = {value[0] for action, _, value, _ in items if action == "add_task"}
+    tasks = {}  # id -> (title, status), as the writes so far leave them
+    for r in _select_in(conn, "SELECT id, title, status FROM tasks WHERE id IN ({marks})", task_ids):
+        tasks[r[0]] = (r[1], r[2])
+    for r in _select_in(conn, "SELECT id, title, status FROM tasks WHERE title IN ({marks})", titles):
+        tasks[r[0]] = (r[1], r[2])
+    title_count = Counter(t for t, status in tasks.values() if status in _COUNTED_STATUSES)
+    contents = {
+        content for action, _, content, _ in items
+        if action in ("add_update", "update_task") and content
+    }
+    existing_updates = {
+        (r[0], r[1]) for r in _select_in(
+            conn, "SELECT task_id, content FROM updates WHERE content IN ({marks})", contents
+        )
+    }
+
+    # Pass 3: decide each item against the running state (new tasks get
+    # provisional ids, as in process_knowledge()).
+    next_task = _next_id(conn, "tasks")
+    task_updates, new_updates, new_tasks = [], [], []
+
+    def add_update(task_id, content):
+        # Exact-match dedup safety net
+        if (task_id, content) not in existing_updates:
+            existing_updates.add((task_id, content))
+            new_updates.append((task_id, content))
+
+    for action, task_id, value, task in items:
+        if action == "skip":
+            _skip(session_id, value[0], value[1], **value[2])
             continue
 
-        if action == "update_task":
-            task_id = _parse_id(task.get("task_id"), "task_id", action, session_id)
-            if task_id is None:
-                continue
-            content = task.get("content", "").strip()
-            if not conn.execute(
-                "SELECT 1 FROM tasks WHERE id = ?", (task_id,)
-            ).fetchone():
+        if action == "add_update":
+            if task_id not in tasks:
                 _skip(session_id, action, "task not found", task_id=task_id)
                 continue
-
-            # Build SET clause — skip invalid enum values
-            sets = []
-            params = []
-            status = task.get("status", "").strip().lower()
-            if status:
-                if status not in VALID_STATUS:
-                    _skip(session_id, action, "invalid status", status=status)
-                    continue
-                sets.append("status = ?")
-                params.append(status)
-            priority = task.get("priority", "").strip().lower()
-            if priority:
-                if priority not in VALID_PRIORITY:
-                    _skip(session_id, action, "invalid priority", priority=priority)
-                    continue
-                sets.append("priority = ?")
-                params.append(priority)
-            horizon = task.get("horizon", "").strip().lower()
-            if horizon:
-                if horizon not in VALID_HORIZON:
-                    _skip(session_id, action, "invalid horizon", horizon=horizon)
-                    continue
-                sets.append("horizon = ?")
-                params.append(horizon)
-            title = task.get("title", "").strip()
-            if title:
-                sets.append("title = ?")
-                params.append(title)
-
-            if sets:
-                sets.append("updated = datetime('now')")
-                params.append(task_id)
-                conn.execute(
-                    f"UPDATE tasks SET {', '.join(sets)} WHERE id = ?",
-                    params,
-                )
-                tasks_updated += 1
-
-            # Record the reason as an update entry
-            if content:
-                # Exact-match dedup safety net
-                if not conn.execute(
-                    "SELECT 1 FROM updates WHERE task_id = ? AND content = ?",
-                    (task_id, content),
-                ).fetchone():
-                    conn.execute(
-                        "INSERT INTO updates (task_id, content) VALUES (?, ?)",
-                        (task_id, content),
-                    )
-                    updates_inserted += 1
+            add_update(task_id, value)
             continue
 
-        # add_task: new task
-        title = task.get("title", "").strip()
-        if not title:
-            _skip(session_id, action, "missing title")
-            continue
-        domain = task.get("domain", "").strip().lower()
-        if not domain or domain not in VALID_DOMAINS:
-            _skip(session_id, action, "invalid domain", domain=domain)
-            continue
-        priority = task.get("priority", "").strip().lower()
-        if not priority or priority not in VALID_PRIORITY:
-            _skip(session_id, action, "invalid priority", priority=priority)
-            continue
-        horizon = task.get("horizon", "").strip().lower()
-        if not horizon or horizon not in VALID_HORIZON:
-            _skip(session_id, action, "invalid horizon", horizon=horizon)
+        if action == "update_task":
+            if task_id not in tasks:
+                _skip(session_id, action, "task not found", task_id=task_id)
+                continue
+            # Skip invalid enum values
+            fields = {}
+            for name, valid in (
+                ("status", VALID_STATUS),
+                ("priority", VALID_PRIORITY),
+                ("horizon", VALID_HORIZON),
+            ):
+                v = task.get(name, "").strip().lower()
+                if v and v not in valid:
+                    _skip(session_id, action, f"invalid {name}", **{name: v})
+                    break
+                fields[name] = v or None
+            else:
+                fields["title"] = task.get("title", "").strip() or None
+                if any(fields.values()):
+                    task_updates.append((
+                        fields["status"], fields["priority"], fields["horizon"],
+                        fields["title"], task_id,
+                    ))
+                    old_title, old_status = tasks[task_id]
+                    new = (fields["title"] or old_title, fields["status"] or old_status)
+                    if old_status in _COUNTED_STATUSES:
+                        title_count[old_title] -= 1
+                    if new[1] in _COUNTED_STATUSES:
+                        title_count[new[0]] += 1
+                    tasks[task_id] = new
+                # Record the reason as an update entry
+                if value:
+                    add_update(task_id, value)
             continue
 
-        # Dedup: skip if a task with this title exists in ANY status. An open match
-        # is a duplicate; a 'dropped' or 'done' match is a tombstone — re-adding it
-        # would resurrect retired work. Reopening must go through update_task, never
-        # an automatic insert. (Prompt enforces this fuzzily; this is the hard floor.)
-        if conn.execute(
-            "SELECT 1 FROM tasks WHERE title = ? AND status IN ('open', 'dropped', 'done')",
-            (title,),
-        ).fetchone():
+        # add_task. Dedup: skip if a task with this title exists in ANY status.
+        # An open match is a duplicate; a 'dropped' or 'done' match is a
+        # tombstone — re-adding it would resurrect retired work. Reopening
+        # must go through update_task, never an automatic insert. (Prompt
+        # enforces this fuzzily; this is the hard floor.)
+        title = value[0]
+        if title_count[title]:
             continue
+        title_count[title] += 1
+        tasks[next_task + len(new_tasks)] = (title, "open")
+        new_tasks.append(value)
 
+    # Pass 4: the writes — inserts first, so updates can reach new tasks too.
+    task_ids = _same
+    if new_tasks:
         if session_id:
             metadata = json.dumps({"source_session_id": session_id})
-            conn.execute(
+            task_ids = _insert_many(
+                conn,
                 "INSERT INTO tasks (title, domain, priority, horizon, metadata) VALUES (?, ?, ?, ?, ?)",
-                (title, domain, priority, horizon, metadata),
+                [(*t, metadata) for t in new_tasks], next_task,
             )
         else:
-            conn.execute(
+            task_ids = _insert_many(
+                conn,
                 "INSERT INTO tasks (title, domain, priority, horizon) VALUES (?, ?, ?, ?)",
-                (title, domain, priority, horizon),
+                new_tasks, next_task,
             )
-        tasks_inserted += 1
+    if task_updates:
+        conn.executemany(
+            "UPDATE tasks SET status = COALESCE(?, status), priority = COALESCE(?, priority), "
+            "horizon = COALESCE(?, horizon), title = COALESCE(?, title), "
+            "updated = datetime('now') WHERE id = ?",
+            [(*u[:4], task_ids(u[4])) for u in task_updates],
+        )
+    if new_updates:
+        conn.executemany(
+            "INSERT INTO updates (task_id, content) VALUES (?, ?)",
+            [(task_ids(t), content) for t, content in new_updates],
+        )
 
-    return tasks_inserted, updates_inserted, tasks_updated
+    return len(new_tasks), len(new_updates), len(task_updates)
 
 
 def store_tags(conn, session_id, tags):
@@ -556,31 +835,82 @@ def store_tags(conn, session_id, tags):
 # ---------------------------------------------------------------------------
 
 
-def _run(data):
-    """Detached worker — called by run_detached_or_inline after payload parsing."""
-    if data.get("stop_hook_active"):
-        return  # Prevent recursive hook firing
+def cache_key(prompt):
+    """Hash of a rendered extraction prompt, the schema and the model.
 
-    cfg = get_config()
-    if not cfg["analysis"]:
-        return
+    The prompt holds the batch's text and every existing record it shows the
+    model (ids, claims, task statuses and updates, session tags), so a cached
+    result is only replayed against the state it was computed from: a merged,
+    edited or closed candidate changes the key. Editing the prompt or schema,
+    or switching models, changes every key — no version number to bump.
+    """
+    import hashlib
 
-    session_id = data.get("session_id")
-    transcript_path = data.get("transcript_path")
+    from sdk import MODEL
 
-    # Wait for transcript to finish writing before parsing
-    wait_for_transcript_stable(transcript_path)
+    h = hashlib.sha256()
+    for part in (MODEL, json.dumps(EXTRACTION_SCHEMA, sort_keys=True), prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
 
-    # Get user text and agent text
-    user_text = parse_last_user_text(transcript_path)
-    agent_text, _ = parse_last_turn(transcript_path)
 
-    if not user_text and not agent_text:
-        log("extraction_skipped", session_id, reason="no text found")
-        return
+# Result field -> (candidate kind, actions that read it).
+_REFERENCES = {
+    "knowledge": (
+        ("topic_id", "topic", ("add_statement", "update_topic")),
+        ("statement_id", "statement", ("update_statement",)),
+    ),
+    "tasks": (("task_id", "task", ("add_update", "update_task")),),
+}
+
+
+def _cacheable(result, candidates):
+    """True if every id *result* acts on was shown in *candidates*.
 
+    An id the model found by querying the database lies outside what
+    cache_key() covers, so such results are not cached.
+    """
+    if candidates is None:
+        return False
+    shown = {
+        "topic": {t["id"] for t in candidates["topics"]},
+        "statement": {st["id"] for t in candidates["topics"] for st in t["statements"]},
+        "task": {k["id"] for k in candidates["tasks"]},
+    }
+    for section, fields in _REFERENCES.items():
+        items = result.get(section)
+        for item in items if isinstance(items, list) else ():
+            if not isinstance(item, dict):
+                continue
+            action = str(item.get("action", "")).strip().lower()
+            for field, kind, actions in fields:
+                if action not in actions or item.get(field) is None:
+                    continue
+                try:
+                    if int(item[field]) not in shown[kind]:
+                        return False
+                except (ValueError, TypeError):
+                    continue  # process_*() skips it either way
+    return True
+
+
+def _extract(session_id, claim, prompt):
+    """Call the model with *prompt*. Returns (result, model_ms), or None
+    after releasing the claim when the call failed."""
+    # The SDK call can run long or be killed by its timeout; get everything
+    # logged so far onto disk first.
+    eventlog.flush()
+
+    error = None
     try:
-        prompt = build_extraction_prompt(user_text, agent_text, session_id)
+        # Imported here: the Stop hand-off and the supervisor import this
+        # module but never call the model.
+        import asyncio
+
+        from sdk import call_model
+
+        started = time.monotonic()
         result, usage_info = asyncio.run(
             call_model(
                 prompt,
@@ -590,18 +920,94 @@ def _run(data):
         )
     except Exception as e:
         log("extraction_error", session_id, context="SDK call", error=str(e))
-        return
+        error = e
+    else:
+        if not isinstance(result, dict):
+            log(
+                "extraction_error",
+                session_id,
+                context="unexpected type",
+                error=str(type(result)),
+            )
+            error = f"unexpected type {type(result).__name__}"
+    if error is not None:
+        with open_db() as conn:
+            release_analysis(conn, claim, error)
+        return None
+    return result, round((time.monotonic() - started) * 1000)
 
-    if not isinstance(result, dict):
-        log(
-            "extraction_error",
-            session_id,
-            context="unexpected type",
-            error=str(type(result)),
-        )
-        return
+
+def _triage(conn, session_id, claim, rows, cfg):
+    """Mark the batch's low-value exchanges skipped; return the rest."""
+    from triage import triage
+
+    keep, skipped = triage(conn, rows, cfg["analysis_triage_threshold"])
+    if skipped:
+        skip_analysis(conn, claim, [row["id"] for row, _, _ in skipped])
+        for row, score, why in skipped:
+            log("analysis_triaged", session_id, turn_start=row["turn_start"],
+                score=round(score, 3), reason=why)
+    return keep
+
+
+def analyze_batch(session_id, claim, rows, cfg):
+    """Run one extraction call over a claimed batch and store the results.
+
+    Called by an analysis worker (see workers.py). Exchanges triage.py rates
+    below analysis_triage_threshold are marked skipped first; if none are
+    left there is no call. A prompt seen before (same exchanges, same
+    candidate records, same model) replays its cached result instead of
+    calling the model. Returns False when the call failed and the batch went
+    back to the queue.
+    """
+    try:
+        with open_db() as conn:
+            rows = _triage(conn, session_id, claim, rows, cfg)
+    except Exception as e:
+        log("triage_error", session_id, error=str(e))
+    if not rows:
+        return True
+
+    try:
+        with open_db() as conn:
+            candidates = find_candidates(conn, rows, session_id)
+    except Exception as e:
+        log("candidates_error", session_id, error=str(e))
+        candidates = None
+    prompt = build_extraction_prompt(rows, session_id, candidates)
+
+    key = cache_key(prompt) if cfg["analysis_cache_max"] and candidates is not None else None
+    result = None
+    if key:
+        with open_db() as conn:
+            result = cached_analysis(conn, key)
+            conn.commit()
+    if result is not None:
+        log("analysis_cache_hit", session_id, exchanges=len(rows))
+        model_ms = None
+    else:
+        result = _extract(session_id, claim, prompt)
+        if result is None:
+            return False
+        result, model_ms = result
+        if key and _cacheable(result, candidates):
+            # Stored right away, not with the results: if this claim was
+            # requeued meanwhile (superseded below) or the worker dies before
+            # committing, the retry of the same batch replays it.
+            with open_db() as conn:
+                cache_analysis(conn, key, result, cfg["analysis_cache_max"])
+                conn.commit()
 
     with open_db() as conn:
+        # Mark the batch done in the same transaction as its results. A short
+        # count means the claim went stale and was requeued: another worker
+        # owns these exchanges now, so drop this result instead.
+        share = None if model_ms is None else model_ms // len(rows)
+        if complete_analysis(conn, claim, share) != len(rows):
+            conn.rollback()
+            log("analysis_superseded", session_id, exchanges=len(rows))
+            return True
+
         # Ensure session row exists before writing session-scoped data
         if session_id:
             ensure_session(conn, session_id)
@@ -683,8 +1089,31 @@ def _run(data):
     if result.get("tasks"):
         analysis_data["tasks"] = len(result["tasks"])
 
+    analysis_data["exchanges"] = len(rows)
+    if model_ms is not None:
+        analysis_data["model_ms"] = model_ms
     log("analysis", session_id, **analysis_data)
+    return True
+
+
+def _run(data):
+    """Stop hand-off: make sure the analysis supervisor is draining the queue.
+
+    stop.py has already queued the exchange; the supervisor (workers.py)
+    batches it and runs the extraction in a bounded worker pool.
+    """
+    if data.get("stop_hook_active"):
+        return  # Prevent recursive hook firing
+
+    if not get_config()["analysis"]:
+        return
+
+    import workers
+
+    workers.ensure_supervisor()
 
 
 if __name__ == "__main__":
-    run_detached_or_inline(__file__, _run)
+    data = read_hook_payload()
+    if data:
+        _run(data)
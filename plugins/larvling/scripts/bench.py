@@ -0,0 +1,357 @@
+"""
+Larvling Bench - microbenchmarks for hook hot paths.
+
+Usage:
+    python bench.py transcript [--mb N]   # last-turn parse: full read vs reverse block reader (default 200 MB)
+    python bench.py vectors [--n N]       # cosine top-k over N statement vectors: pure Python vs NumPy (default 100000)
+    python bench.py db [--hooks N]        # per-hook DB cost: connection per open_db vs cached connection (default 500)
+    python bench.py imports [--runs N]    # -X importtime per hook (larvling_hook.py) vs IMPORT_BUDGETS_MS; exits 1 when over (default 3)
+
+Benchmarks build their own synthetic data (in a temp directory or an
+in-memory database) and never touch the project's larvling.db.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from db import reconfigure_stdout
+
+
+def _arg(name, default):
+    """Read an integer ``--name N`` option from argv."""
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        if idx + 1 < len(sys.argv):
+            return int(sys.argv[idx + 1])
+    return default
+
+
+def _measure(fn, *args):
+    """Run fn once for wall time, once under tracemalloc for peak memory."""
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def _report(rows):
+    """Print (label, seconds, peak_bytes) rows as an aligned table."""
+    print(f"{'variant':<24}{'time':>12}{'peak mem':>14}")
+    for label, secs, peak in rows:
+        print(f"{label:<24}{secs * 1000:>10.1f}ms{peak / 1e6:>12.1f}MB")
+    base = rows[0][1]
+    for label, secs, _ in rows[1:]:
+        print(f"{label}: {base / secs:.0f}x faster than {rows[0][0]}")
+
+
+# ---------------------------------------------------------------------------
+# transcript
+# ---------------------------------------------------------------------------
+
+
+def _write_transcript(path, target_bytes):
+    """Write a synthetic transcript of ~target_bytes: many tool-heavy turns."""
+    filler = "lorem ipsum dolor sit amet " * 40
+    turn = "".join(
+        json.dumps(e) + "\n"
+        for e in (
+            {"type": "user", "message": {"role": "user", "content": "please look at db.py"}},
+            {"type": "assistant", "message": {"content": [
+                {"type": "tool_use", "name": "Read", "input": {"file_path": "scripts/db.py"}}]}},
+            {"type": "user", "message": {"content": [{"type": "tool_result", "content": filler}]}},
+            {"type": "assistant", "message": {"content": [{"type": "text", "text": filler}]}},
+        )
+    )
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target_bytes:
+            f.write(turn)
+            written += len(turn)
+
+
+def _full_read_last_turn(transcript_path):
+    """The pre-reverse-reader algorithm: load every line, walk back, parse."""
+    from transcript import _collect_turn, is_real_user_message
+
+    lines = []
+    with open(transcript_path, "r", encoding="utf-8") as f:
+        for raw in f:
+            raw = raw.strip()
+            if raw:
+                lines.append(raw)
+    turn_start = 0
+    for i in range(len(lines) - 1, -1, -1):
+        try:
+            entry = json.loads(lines[i])
+        except json.JSONDecodeError:
+            continue
+        if is_real_user_message(entry):
+            turn_start = i + 1
+            break
+    return _collect_turn(lines[turn_start:])[:2]
+
+
+def bench_transcript():
+    from transcript import parse_last_turn
+
+    mb = _arg("--mb", 200)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "transcript.jsonl")
+        print(f"Writing {mb} MB synthetic transcript...")
+        _write_transcript(path, mb * 1024 * 1024)
+
+        old, t_old, m_old = _measure(_full_read_last_turn, path)
+        new, t_new, m_new = _measure(parse_last_turn, path)
+        if old != new:
+            print("MISMATCH: reverse reader disagrees with full read", file=sys.stderr)
+            sys.exit(1)
+        _report([("full read", t_old, m_old), ("reverse block reader", t_new, m_new)])
+
+
+# ---------------------------------------------------------------------------
+# vectors
+# ---------------------------------------------------------------------------
+
+
+def bench_vectors():
+    import sqlite3
+
+    import vectors
+    from db import create_schema
+
+    n = _arg("--n", 100000)
+    conn = sqlite3.connect(":memory:")
+    create_schema(conn)
+    words = ("docker deploy python sqlite cache index schema session task topic "
+             "review budget latency worker queue vector search prompt daemon").split()
+    print(f"Embedding {n} synthetic statements...")
+    conn.executemany(
+        "INSERT INTO embeddings (kind, ref_id, vec) VALUES ('statement', ?, ?)",
+        (
+            (i, vectors.embed(" ".join(words[(i * k) % len(words)] for k in range(1, 9)) + f" #{i}").tobytes())
+            for i in range(n)
+        ),
+    )
+    query = "how do we deploy the docker worker"
+    batch = [query] * 32
+
+    def cold():
+        vectors._cache.clear()
+        return vectors.search(conn, query)
+
+    rows = []
+    numpy = vectors.np
+    vectors.np = None
+    _, t, m = _measure(cold)
+    rows.append(("pure python", t, m))
+    vectors.np = numpy
+    if numpy is None:
+        print("NumPy not installed; only the fallback was measured.")
+    else:
+        _, t, m = _measure(cold)
+        rows.append(("numpy (cold load)", t, m))
+        vectors.search(conn, query)
+        _, t, m = _measure(vectors.search, conn, query)
+        rows.append(("numpy (warm)", t, m))
+        _, t, m = _measure(vectors.search_many, conn, batch)
+        rows.append(("numpy x32 batched", t / len(batch), m))
+    _report(rows)
+
+
+# ---------------------------------------------------------------------------
+# db
+# ---------------------------------------------------------------------------
+
+OPENS_PER_HOOK = 3  # session_start opens the DB this many times
+
+
+def _hook_queries(conn, sid):
+    """The reads and one write a prompt hook makes, against *conn*."""
+    from db import get_counts, get_state, record_message
+
+    get_counts(conn, "topics", "statements")
+    get_state(conn, "context_counts", {})
+    conn.execute(
+        "SELECT summary_msg_count, agent_summary, summary_offered, "
+        "user_count + assistant_count AS msg_count FROM sessions WHERE id = ?",
+        (sid,),
+    ).fetchone()
+    conn.execute(
+        "SELECT id, agent_summary, title FROM sessions ORDER BY started_at DESC LIMIT 5"
+    ).fetchall()
+    record_message(conn, sid, "user", "bench prompt")
+    conn.commit()
+
+
+def bench_db():
+    import sqlite3
+
+    import db
+
+    hooks = _arg("--hooks", 500)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "larvling.db")
+        conn = db.get_db(path)
+        db.create_schema(conn)
+        conn.executemany(
+            "INSERT INTO sessions (id, started_at) VALUES (?, datetime('now'))",
+            ((f"s{i}",) for i in range(1000)),
+        )
+        conn.commit()
+        conn.close()
+
+        def legacy():
+            # The previous get_db(): connect and three PRAGMAs per open_db().
+            for h in range(hooks):
+                for _ in range(OPENS_PER_HOOK):
+                    c = sqlite3.connect(path)
+                    c.execute("PRAGMA journal_mode=WAL")
+                    c.execute("PRAGMA foreign_keys=ON")
+                    c.execute("PRAGMA busy_timeout=5000")
+                    c.row_factory = sqlite3.Row
+                    _hook_queries(c, f"s{h % 1000}")
+                    c.close()
+
+        def per_open(profile):
+            def run():
+                for h in range(hooks):
+                    for _ in range(OPENS_PER_HOOK):
+                        c = db.get_db(path, profile)
+                        _hook_queries(c, f"s{h % 1000}")
+                        c.close()
+            return run
+
+        def cached(profile):
+            # One connection per process: connect once, then reuse.
+            def run():
+                for h in range(hooks):
+                    c = db.get_db(path, profile)
+                    for _ in range(OPENS_PER_HOOK):
+                        _hook_queries(c, f"s{h % 1000}")
+                    c.close()
+            return run
+
+        print(f"{hooks} simulated hooks x {OPENS_PER_HOOK} open_db() calls each")
+        rows = []
+        for label, fn in (
+            ("connect per open_db", legacy),
+            ("  + balanced PRAGMAs", per_open("balanced")),
+            ("cached, safe", cached("safe")),
+            ("cached, balanced", cached("balanced")),
+        ):
+            _, t, m = _measure(fn)
+            rows.append((label, t / hooks, m))
+        _report(rows)
+
+
+# ---------------------------------------------------------------------------
+# imports
+# ---------------------------------------------------------------------------
+
+# Import budget per hook (see larvling_hook.HOOKS), in ms of -X importtime
+# self time beyond what a bare interpreter imports at startup: roughly twice
+# what each measured once the fast paths went lazy. session_start and stop
+# start subprocesses (git, the analysis hand-off), which costs them
+# subprocess and tempfile. A hook that blows through its budget has grown an
+# eager import on its fast path.
+IMPORT_BUDGETS_MS = {
+    "session_start": 70,
+    "prompt": 40,
+    "stop": 70,
+    "session_end": 40,
+}
+
+BENCH_PAYLOADS = {
+    "session_start": {"session_id": "bench", "source": "startup"},
+    "prompt": {"session_id": "bench", "prompt": "hello from bench.py"},
+    "stop": {"session_id": "bench"},
+    "session_end": {"session_id": "bench"},
+}
+
+
+def _importtime(args, stdin=b"", env=None, cwd=None):
+    """{module: self-time in microseconds} from one ``python -X importtime`` run."""
+    import subprocess
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        input=stdin, capture_output=True, env=env, cwd=cwd,
+    )
+    mods = {}
+    for line in proc.stderr.decode("utf-8", "replace").splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        mods[name.strip()] = mods.get(name.strip(), 0) + int(self_us)
+    return mods
+
+
+def bench_imports():
+    from larvling_hook import HOOKS
+
+    runs = _arg("--runs", 3)
+    entry = os.path.join(os.path.dirname(os.path.abspath(__file__)), "larvling_hook.py")
+    with tempfile.TemporaryDirectory() as project:
+        # A throwaway project: analysis off (no supervisor is started) and
+        # fresh network caches (no refresh is spawned).
+        os.makedirs(os.path.join(project, ".claude"))
+        with open(os.path.join(project, ".claude", "larvling.config.json"), "w") as f:
+            json.dump({"analysis": False}, f)
+        with open(os.path.join(project, ".claude", "larvling-cache.json"), "w") as f:
+            now = time.time()
+            json.dump({k: {"ts": now, "data": None} for k in ("geolocation", "update_check")}, f)
+        env = dict(os.environ, CLAUDE_PROJECT_DIR=project)
+        env.pop("LARVLING_INTERNAL", None)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure cached bytecode, as hooks see it
+
+        baseline = set(_importtime(["-c", "pass"], env=env))
+        print(f"{'hook':<16}{'imports':>10}{'budget':>10}  heaviest")
+        over = []
+        for hook in HOOKS:
+            payload = json.dumps(BENCH_PAYLOADS.get(hook, {})).encode("utf-8")
+            best = None
+            for _ in range(runs):
+                mods = _importtime([entry, hook], payload, env, project)
+                extra = {m: us for m, us in mods.items() if m not in baseline}
+                if best is None or sum(extra.values()) < sum(best.values()):
+                    best = extra
+            ms = sum(best.values()) / 1000
+            budget = IMPORT_BUDGETS_MS.get(hook)
+            heavy = sorted(best.items(), key=lambda kv: -kv[1])[:3]
+            print(
+                f"{hook:<16}{ms:>8.1f}ms{budget:>8}ms  "
+                + ", ".join(f"{m} {us / 1000:.1f}ms" for m, us in heavy)
+            )
+            if budget is not None and ms > budget:
+                over.append(hook)
+    if over:
+        print(f"OVER BUDGET: {', '.join(over)}", file=sys.stderr)
+        sys.exit(1)
+
+
+BENCHMARKS = {
+    "transcript": bench_transcript,
+    "vectors": bench_vectors,
+    "db": bench_db,
+    "imports": bench_imports,
+}
+
+
+def main():
+    reconfigure_stdout()
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]]()
+
+
+if __name__ == "__main__":
+    main()
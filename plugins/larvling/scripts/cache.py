@@ -0,0 +1,186 @@
+"""
+Larvling cache — stale-while-revalidate store for slow network lookups.
+
+Usage:
+    python cache.py refresh KEY [KEY ...]   # fetch KEYs now (what get() spawns)
+
+.claude/larvling-cache.json maps each key in SOURCES to {"ts", "data"}.
+get() always answers from the file, however old the entry; when it is past
+its TTL (or missing) get() claims the refresh and spawns a detached
+`cache.py refresh` to fetch a new value, so callers never wait on the
+network. A cold key therefore reads as None until its first refresh lands.
+
+Every read-modify-write holds an exclusive lock on larvling-cache.json.lock
+and replaces the file atomically, so concurrent sessions cannot interleave
+writes or observe a half-written file. A claimed refresh is not retried
+for REFRESH_RETRY seconds, which also rate-limits lookups while offline.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from db import PROJECT_ROOT, log
+
+CACHE_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling-cache.json")
+LOCK_PATH = CACHE_PATH + ".lock"
+FETCH_TIMEOUT = 5  # seconds per request in the refresh process
+REFRESH_RETRY = 300  # seconds before a claimed-but-unfinished refresh is retried
+
+GITHUB_REPO = "athrael-soju/Larvling"
+RELEASES_URL = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+
+
+def _fetch_json(url, accept="application/json"):
+    import urllib.request  # pulls in ssl; only the refresh process needs it
+
+    req = urllib.request.Request(url, headers={"Accept": accept, "User-Agent": "larvling"})
+    with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT) as resp:
+        return json.loads(resp.read().decode("utf-8"))
+
+
+def fetch_geolocation():
+    """Approximate location of this machine from a free IP-geolocation API."""
+    return _fetch_json("https://ipinfo.io/json")
+
+
+def fetch_latest_release():
+    """Version string of the latest GitHub release, e.g. "1.4.0"."""
+    data = _fetch_json(RELEASES_URL, accept="application/vnd.github+json")
+    return data.get("tag_name", "").lstrip("v") or None
+
+
+# key -> (TTL in seconds, fetch function returning a JSON-serializable value)
+SOURCES = {
+    "geolocation": (86400, fetch_geolocation),
+    "update_check": (86400, fetch_latest_release),
+}
+
+
+@contextmanager
+def _locked():
+    """Hold an exclusive cross-process lock on LOCK_PATH."""
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    with open(LOCK_PATH, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)  # retries for ~10s
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _load():
+    try:
+        with open(CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _save(cache):
+    """Write *cache* to a temp file and rename it over CACHE_PATH."""
+    tmp = f"{CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, CACHE_PATH)
+
+
+@contextmanager
+def _transaction():
+    """Yield the cache dict under the lock; changes are saved on exit."""
+    with _locked():
+        cache = _load()
+        yield cache
+        _save(cache)
+
+
+def _expired(entry, ttl, now):
+    return not entry or "data" not in entry or now - entry.get("ts", 0) >= ttl
+
+
+def get(key):
+    """Return the cached value for *key* (None if never fetched), immediately.
+
+    If the entry is past its TTL, a background refresh is started unless
+    one was already claimed within REFRESH_RETRY seconds.
+    """
+    ttl = SOURCES[key][0]
+    entry = _load().get(key)
+    now = time.time()
+    if _expired(entry, ttl, now) and _claim(key, ttl, now):
+        _spawn_refresh([key])
+    return entry.get("data") if entry else None
+
+
+def _claim(key, ttl, now):
+    """Mark *key* as being refreshed; False if it is fresh or already claimed."""
+    try:
+        with _transaction() as cache:
+            entry = cache.setdefault(key, {})
+            if not _expired(entry, ttl, now) or now - entry.get("claimed", 0) < REFRESH_RETRY:
+                return False
+            entry["claimed"] = now
+            return True
+    except OSError:
+        return False
+
+
+def _spawn_refresh(keys):
+    from hooks_util import spawn_background
+
+    try:
+        spawn_background([os.path.abspath(__file__), "refresh", *keys])
+    except OSError as e:
+        log("cache_refresh", keys=keys, error=f"spawn failed: {e}")
+
+
+def put(key, data):
+    """Store *data* for *key* with the current timestamp."""
+    with _transaction() as cache:
+        cache[key] = {"ts": time.time(), "data": data}
+
+
+def refresh(keys):
+    """Fetch each of *keys* from its source and store the result.
+
+    A failed fetch leaves the old value (and its claim) in place, so the
+    next get() after REFRESH_RETRY tries again.
+    """
+    for key in keys:
+        if key not in SOURCES:
+            continue
+        start = time.time()
+        try:
+            data = SOURCES[key][1]()
+        except Exception as e:
+            log("cache_refresh", key=key, error=str(e)[:200])
+            continue
+        put(key, data)
+        log("cache_refresh", key=key, ms=round((time.time() - start) * 1000))
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] != "refresh":
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    refresh(sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,33 @@
 import json
 import os
 
-CONFIG_PATH = os.path.join(
-    os.environ.get("CLAUDE_PROJECT_DIR") or os.getcwd(),
-    ".claude", "larvling.config.json",
-)
+
+def _find_project_root():
+    """Discover the project root where .claude/larvling.db lives.
+
+    Priority: CLAUDE_PROJECT_DIR env → walk up from cwd → cwd fallback.
+    Every module (db, daemon, config) uses this one result, so a hook and the
+    daemon always agree on the database.
+    """
+    env_root = os.environ.get("CLAUDE_PROJECT_DIR")
+    if env_root:
+        return env_root
+
+    # Walk up from cwd looking for .claude/larvling.db
+    d = os.path.abspath(os.getcwd())
+    for _ in range(20):  # safety bound
+        if os.path.exists(os.path.join(d, ".claude", "larvling.db")):
+            return d
+        parent = os.path.dirname(d)
+        if parent == d:
+            break
+        d = parent
+
+    return os.getcwd()
+
+
+PROJECT_ROOT = _find_project_root()
+CONFIG_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling.config.json")
 
 DEFAULTS = {
     "analysis": True,
@@ -16,11 +39,50 @@ DEFAULTS = {
     "summary_hints": True,
     "session_tags": True,
     "geolocation": False,
+    "daemon": False,
+    # Queued analysis: exchanges per extraction call, and seconds the oldest
+    # queued exchange may wait for more to coalesce with.
+    "analysis_batch_max": 5,
+    "analysis_max_delay": 20,
+    # Analysis worker pool (workers.py): concurrent extraction calls, and
+    # seconds before a worker is killed and its batch requeued; 0 = no limit.
+    "analysis_workers": 2,
+    "analysis_job_timeout": 600,
+    # Exchanges scoring below this (0-1, see triage.py) skip the model call; 0 = analyze all.
+    "analysis_triage_threshold": 0.2,
+    # Extraction results replayed for an identical prompt (same exchanges and
+    # candidate records; least recently used evicted first); 0 disables the cache.
+    "analysis_cache_max": 1000,
+    # Concurrent model calls for `summarize.py --stale`.
+    "summary_workers": 4,
+    # SessionStart context size limit in estimated tokens; 0 = unlimited.
+    "context_budget": 2000,
+    # SQLite PRAGMA profile: "safe", "balanced" or "fast" (see db.DB_PROFILES).
+    "db_profile": "balanced",
+    # Event log (.claude/larvling.jsonl) rotation and retention; 0 disables a limit.
+    "log_max_mb": 5,
+    "log_max_age_days": 30,
+    "log_archives": 5,
 }
 
 
+def _coerce(value, default):
+    """Coerce a user value to the type of its default; fall back on bad input."""
+    if isinstance(default, bool):
+        return bool(value)
+    if isinstance(default, str):
+        return value if isinstance(value, str) else default
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return default
+    return max(0, value)
+
+
 def get_config():
-    """Load config with defaults. Missing keys use defaults. Missing file = all defaults."""
+    """Load config with defaults. Missing keys use defaults. Missing file = all defaults.
+
+    Values are coerced to the type of their default (flags to bool, limits to
+    non-negative numbers, names to str).
+    """
     config = dict(DEFAULTS)
     try:
         with open(CONFIG_PATH, "r", encoding="utf-8") as f:
@@ -28,7 +90,7 @@ def get_config():
         if isinstance(user, dict):
             for key in DEFAULTS:
                 if key in user:
-                    config[key] = bool(user[key])
+                    config[key] = _coerce(user[key], DEFAULTS[key])
     except (FileNotFoundError, json.JSONDecodeError, OSError):
         pass
     return config
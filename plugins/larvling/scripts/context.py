@@ -0,0 +1,111 @@
+"""Budgeted context assembly for injected hook output.
+
+Callers describe context as pinned lines (always emitted) plus scored
+sections; render() keeps the best-scoring lines that fit the budget, emits
+them in their original order, and reports what it dropped — so injected
+context stays bounded no matter how large the database grows.
+
+A line's score is its section's weight times its own score; selection is
+greedy by score, and a section's header is charged with its first line.
+Costs are estimated tokens (UTF-8 bytes / 4) unless a cost function is given.
+"""
+
+REPORT_RESERVE = 40  # budget held back for the "omitted" note
+
+
+def estimate_tokens(text):
+    """Rough token count: ~4 bytes of UTF-8 per token, plus the newline."""
+    return (len(text.encode("utf-8")) + 3) // 4 + 1
+
+
+def clip(text, limit):
+    """Collapse whitespace and cut *text* to *limit* characters (for previews
+    of raw message text; section lines are otherwise kept verbatim)."""
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+class Section:
+    """A titled group of scored lines. *name* labels it in reports."""
+
+    def __init__(self, title, weight=1.0, name=None):
+        self.title = title
+        self.name = name or title.lstrip("# ")
+        self.weight = weight
+        self.lines = []  # (text, score)
+
+    def add(self, text, score=1.0):
+        self.lines.append((text, score))
+        return self
+
+
+class ContextBuilder:
+    """Collects pinned lines and sections, then renders within a budget.
+
+    A budget of 0 (or None) means unlimited.
+    """
+
+    def __init__(self, budget, cost=estimate_tokens):
+        self.budget = budget or 0
+        self.cost = cost
+        self.pinned = []
+        self.sections = []
+
+    def pin(self, text):
+        self.pinned.append(text)
+
+    def section(self, title, weight=1.0, name=None):
+        sec = Section(title, weight, name)
+        self.sections.append(sec)
+        return sec
+
+    def render(self):
+        """Return (text, report).
+
+        report = {"budget", "used", "dropped": {section name: lines}}.
+        """
+        chosen = [set() for _ in self.sections]
+        used = sum(self.cost(p) for p in self.pinned)
+
+        if not self.budget:
+            for si, sec in enumerate(self.sections):
+                chosen[si].update(range(len(sec.lines)))
+        else:
+            remaining = self.budget - REPORT_RESERVE - used
+            ranked = sorted(
+                (
+                    (-sec.weight * score, si, li)
+                    for si, sec in enumerate(self.sections)
+                    for li, (_, score) in enumerate(sec.lines)
+                ),
+            )
+            for _, si, li in ranked:
+                sec = self.sections[si]
+                c = self.cost(sec.lines[li][0])
+                if not chosen[si]:
+                    c += self.cost(sec.title) + self.cost("")
+                if c <= remaining:
+                    chosen[si].add(li)
+                    remaining -= c
+
+        out = list(self.pinned)
+        dropped = {}
+        for si, sec in enumerate(self.sections):
+            if len(chosen[si]) < len(sec.lines):
+                dropped[sec.name] = len(sec.lines) - len(chosen[si])
+            if not chosen[si]:
+                continue
+            out.append(sec.title)
+            out.extend(text for li, (text, _) in enumerate(sec.lines) if li in chosen[si])
+            out.append("")
+
+        if dropped:
+            omitted = ", ".join(f"{name} ({n})" for name, n in dropped.items())
+            out.append(f"_Context trimmed to ~{self.budget} tokens; omitted lines: {omitted}._")
+
+        text = "\n".join(out)
+        return text, {
+            "budget": self.budget,
+            "used": sum(self.cost(line) for line in out),
+            "dropped": dropped,
+        }
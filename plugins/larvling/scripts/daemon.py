@@ -0,0 +1,462 @@
+"""
+Larvling daemon — serves hook events from one warm process per project.
+
+Usage:
+    python daemon.py start    # spawn a detached daemon for this project
+    python daemon.py stop     # ask the running daemon to exit
+    python daemon.py status   # report whether a daemon is serving this project
+    python daemon.py serve    # run in the foreground (what `start` spawns)
+
+Hooks enter through larvling_hook.py, which forwards the raw stdin payload
+of each of the hook's events over a Unix socket and prints the reply. The
+daemon keeps every Larvling module imported and larvling.db open, so an
+event costs one socket round-trip instead of an interpreter import + connect
++ PRAGMA sequence. With no daemon listening, larvling_hook.py runs the hook
+scripts in-process instead.
+
+Set "daemon": true in .claude/larvling.config.json to have larvling_hook.py
+use the daemon and start it on demand; otherwise hooks never touch the
+socket. The socket lives in a per-user 0700 directory and clients refuse one
+they don't own. The daemon exits on its own after an idle period, or as soon
+as any plugin script changes on disk (a plugin update).
+"""
+
+import json
+import os
+import sys
+import time
+
+from config import PROJECT_ROOT
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PID_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling-daemon.pid")
+
+# Hook event -> script, relative to the scripts directory.
+HOOK_SCRIPTS = {
+    "preflight": "preflight.py",
+    "session_start": os.path.join("hooks", "session_start.py"),
+    "prompt": os.path.join("hooks", "prompt.py"),
+    "stop": os.path.join("hooks", "stop.py"),
+    "analyze": "analyze.py",
+    "session_end": os.path.join("hooks", "session_end.py"),
+}
+
+CONNECT_TIMEOUT = 0.25  # seconds; a live daemon accepts immediately
+REPLY_TIMEOUT = 30  # seconds; hooks.json timeouts kill the client first anyway
+IDLE_TIMEOUT = 1800  # seconds without a request before the daemon exits
+
+
+def _private_dir(path):
+    """True if *path* is a real directory owned by this user and closed to others."""
+    import stat
+
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def _socket_dir():
+    """This user's private (0700) directory for daemon sockets, or None.
+
+    $XDG_RUNTIME_DIR when it qualifies, else <tmp>/larvling-<uid>, created
+    0700 and re-checked so a directory planted by another user is refused.
+    """
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and _private_dir(runtime):
+        return runtime
+    d = os.path.join(os.environ.get("TMPDIR") or "/tmp", f"larvling-{os.getuid()}")
+    try:
+        os.mkdir(d, 0o700)
+    except OSError:
+        pass
+    return d if _private_dir(d) else None
+
+
+def socket_path():
+    """Per-project socket path, or None if no private directory is available.
+
+    Keyed by a hash of the project root because AF_UNIX paths are limited to
+    ~100 bytes and project paths often aren't.
+    """
+    # Two zlib checksums make a 64-bit key without loading OpenSSL (hashlib)
+    # into every hook process.
+    import zlib
+
+    d = _socket_dir()
+    if d is None:
+        return None
+    root = os.path.abspath(PROJECT_ROOT).encode("utf-8")
+    digest = f"{zlib.crc32(root):08x}{zlib.adler32(root):08x}"
+    return os.path.join(d, f"larvling-{digest}.sock")
+
+
+def supported():
+    """Unix sockets are required; elsewhere hooks always run in-process."""
+    import socket
+
+    return hasattr(socket, "AF_UNIX") and hasattr(os, "getuid")
+
+
+# ---------------------------------------------------------------------------
+# Client side (kept stdlib-only: this runs in every hook process, so heavier
+# modules are imported only once a daemon is known to be listening)
+# ---------------------------------------------------------------------------
+
+
+def _request(message, timeout=REPLY_TIMEOUT):
+    """Send one JSON request and return the decoded reply.
+
+    Raises ConnectionError if nothing is listening. Any failure after the
+    request was sent raises TimeoutError/OSError/ValueError — the caller
+    must not assume the work was left undone.
+    """
+    if not supported():
+        raise ConnectionError("AF_UNIX not available")
+    import socket
+    import stat
+
+    path = socket_path()
+    if path is None:
+        raise ConnectionError("no private socket directory")
+    try:
+        st = os.lstat(path)
+    except OSError:
+        raise ConnectionError("no daemon socket") from None
+    # Only talk to a socket this user's daemon created: payloads carry prompts
+    # and transcripts, and replies are injected into the session.
+    mode = stat.S_IMODE(st.st_mode)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid() or mode != 0o600:
+        raise ConnectionError("daemon socket has unexpected owner or mode")
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(path)
+        except OSError as e:
+            raise ConnectionError(str(e)) from e
+        sock.settimeout(timeout)
+        try:
+            sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except ConnectionError as e:
+            # A reset or broken pipe mid-request is not "nothing listening".
+            raise OSError(f"connection lost: {e}") from e
+    finally:
+        sock.close()
+    reply = json.loads(b"".join(chunks).decode("utf-8"))
+    if not isinstance(reply, dict):
+        raise ValueError("reply is not an object")
+    return reply
+
+
+def forward(event, raw):
+    """Hand a hook payload to the daemon.
+
+    Returns (stdout, exit_code) when the daemon handled the event, or None
+    when the caller should run the hook in-process (no daemon, or the daemon
+    refused because it is stale). An error after the request was sent is a
+    failed event: (empty stdout, 1), logged and reported on stderr.
+    """
+    try:
+        reply = _request({"event": event, "payload": raw.decode("utf-8")})
+    except ConnectionError:
+        return None
+    except (OSError, ValueError) as e:
+        # The daemon may have acted on the payload, so re-running in-process
+        # could record the exchange twice; fail the event instead.
+        from db import log
+
+        error = str(e) or type(e).__name__
+        log("daemon_error", hook=event, error=error)
+        print(f"larvling: daemon failed on {event}: {error}", file=sys.stderr)
+        return "", 1
+    if not reply.get("ok"):
+        return None
+    return reply.get("stdout", ""), int(reply.get("code") or 0)
+
+
+def spawn():
+    """Start a detached daemon for this project (no-op if one is starting)."""
+    import subprocess
+
+    subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "serve"],
+        cwd=PROJECT_ROOT,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def enabled():
+    """True if the project opted in to the daemon and the platform allows it."""
+    from config import get_config
+
+    return get_config()["daemon"] and supported()
+
+
+def autostart():
+    """Spawn the daemon, ignoring failures (callers check enabled() first)."""
+    try:
+        spawn()
+    except OSError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+
+
+def run_script(path, raw):
+    """Run a hook script as __main__ with *raw* (bytes) on stdin.
+
+    Returns the script's exit code. Used both by the daemon (which captures
+    stdout around it) and by larvling_hook.py's in-process fallback.
+    """
+    import io
+
+    saved_stdin, saved_argv = sys.stdin, sys.argv
+    sys.stdin = io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8")
+    sys.argv = [path]
+    code = 0
+    try:
+        # What runpy.run_path() does for a plain script, minus the import of
+        # runpy/pkgutil/importlib.util on every in-process hook.
+        with open(path, "rb") as f:
+            source = f.read()
+        exec(compile(source, path, "exec"), {"__name__": "__main__", "__file__": path})
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.stdin, sys.argv = saved_stdin, saved_argv
+    return code
+
+
+def _scripts_fingerprint():
+    """Newest mtime across the plugin's scripts and manifest."""
+    newest = 0.0
+    paths = [os.path.join(SCRIPTS_DIR, "..", ".claude-plugin", "plugin.json")]
+    for sub in ("", "hooks"):
+        d = os.path.join(SCRIPTS_DIR, sub)
+        try:
+            paths.extend(os.path.join(d, n) for n in os.listdir(d) if n.endswith(".py"))
+        except OSError:
+            continue
+    for p in paths:
+        try:
+            newest = max(newest, os.stat(p).st_mtime)
+        except OSError:
+            pass
+    return newest
+
+
+class Daemon:
+    """Single-threaded request loop.
+
+    Requests are served one at a time: hook scripts print to the process-wide
+    sys.stdout, which is redirected per request, and SQLite writes serialize
+    anyway.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.served = 0
+        self.fingerprint = _scripts_fingerprint()
+        self.sock = None
+        self.stopping = False
+
+    def handle(self, message):
+        import contextlib
+        import io
+
+        from db import log
+
+        event = message.get("event")
+        if event == "__ping__":
+            return {
+                "ok": True,
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started, 1),
+                "served": self.served,
+            }
+        if event == "__shutdown__":
+            self.stopping = True
+            return {"ok": True}
+        if event not in HOOK_SCRIPTS:
+            return {"ok": False, "error": f"unknown event {event!r}"}
+        if _scripts_fingerprint() != self.fingerprint:
+            # Plugin updated under us — refuse so the client runs the new code,
+            # then exit so the next start picks it up.
+            log("daemon_stale", hook=event)
+            self.stopping = True
+            return {"ok": False, "error": "stale"}
+
+        path = os.path.join(SCRIPTS_DIR, HOOK_SCRIPTS[event])
+        raw = message.get("payload", "").encode("utf-8")
+        out = io.StringIO()
+        t0 = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(out):
+                code = run_script(path, raw)
+        except Exception as e:
+            log("daemon_error", hook=event, error=str(e))
+            code = 1
+        self.served += 1
+        log("daemon_served", hook=event, ms=round((time.perf_counter() - t0) * 1000, 1))
+        return {"ok": True, "stdout": out.getvalue(), "code": code}
+
+    def serve(self):
+        import socket
+
+        import db
+        import eventlog
+
+        # Warm the modules every hook imports so the first request is fast too.
+        import analyze  # noqa: F401
+        import config  # noqa: F401
+        import health  # noqa: F401
+        import hooks_util  # noqa: F401
+        import transcript  # noqa: F401
+        import vectors  # noqa: F401
+        import workers  # noqa: F401
+
+        path = socket_path()
+        if path is None:
+            db.log("daemon_error", error="no private socket directory")
+            return
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)  # created 0600, never briefly wider
+        try:
+            self.sock.bind(path)
+        finally:
+            os.umask(old_umask)
+        os.chmod(path, 0o600)
+        self.sock.listen(8)
+        self.sock.settimeout(IDLE_TIMEOUT)
+        db.log("daemon_start", pid=os.getpid())
+        try:
+            while not self.stopping:
+                try:
+                    conn, _ = self.sock.accept()
+                except socket.timeout:
+                    break
+                try:
+                    conn.settimeout(REPLY_TIMEOUT)
+                    data = b""
+                    while not data.endswith(b"\n"):
+                        chunk = conn.recv(65536)
+                        if not chunk:
+                            break
+                        data += chunk
+                    try:
+                        reply = self.handle(json.loads(data.decode("utf-8")))
+                    except ValueError as e:
+                        reply = {"ok": False, "error": f"bad request: {e}"}
+                    conn.sendall(json.dumps(reply).encode("utf-8"))
+                except OSError:
+                    pass
+                finally:
+                    conn.close()
+                    # Write this request's log entries after the reply is out.
+                    eventlog.flush()
+        finally:
+            self.sock.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            db.close_connection()
+            db.log("daemon_exit", served=self.served)
+
+
+def _acquire_pid_lock():
+    """Hold an exclusive lock on the PID file for the daemon's lifetime.
+
+    Returns the open file (keep a reference), or None if another daemon
+    already holds it.
+    """
+    import fcntl
+
+    os.makedirs(os.path.dirname(PID_PATH), exist_ok=True)
+    f = open(PID_PATH, "a+", encoding="utf-8")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("start", "stop", "status", "serve"):
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    if not supported():
+        print("Unix sockets are not available on this platform.", file=sys.stderr)
+        sys.exit(1)
+
+    cmd = sys.argv[1]
+    if cmd == "serve":
+        lock = _acquire_pid_lock()
+        if lock is None:
+            return  # another daemon owns this project
+        try:
+            Daemon().serve()
+        finally:
+            try:
+                os.unlink(PID_PATH)
+            except OSError:
+                pass
+            lock.close()
+        return
+
+    try:
+        info = _request({"event": "__ping__"}, timeout=2)
+    except ConnectionError:
+        info = None
+    except (OSError, ValueError):
+        info = {}
+
+    if cmd == "status":
+        if info:
+            print(f"larvling daemon pid {info['pid']}, up {info['uptime']}s, served {info['served']}")
+        else:
+            print("larvling daemon not running")
+    elif cmd == "start":
+        if info:
+            print(f"larvling daemon already running (pid {info['pid']})")
+        else:
+            spawn()
+            print("larvling daemon started")
+    elif cmd == "stop":
+        if info is None:
+            print("larvling daemon not running")
+            return
+        try:
+            _request({"event": "__shutdown__"}, timeout=2)
+        except (OSError, ValueError):
+            pass
+        print("larvling daemon stopped")
+
+
+if __name__ == "__main__":
+    main()
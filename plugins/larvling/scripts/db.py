@@ -1,38 +1,24 @@
 """Shared database helpers for Larvling hook scripts.
 
-Schema: sessions, messages, topics, statements, tasks, updates
+Schema: sessions, messages, message_files, topics, statements, tasks, updates,
+transcript_checkpoints, counters, state, analysis_queue, embeddings
+Full-text indexes: messages_fts, statements_fts, topics_fts, tasks_fts (trigger-synced)
+Row counts: counters table + sessions.*_count columns (trigger-maintained)
+File mentions: message_files (written by record_message)
+Vectors: embeddings (float32 BLOBs, filled by vectors.sync, dropped by triggers on edit)
 """
 
 import json
 import os
+import re
 import sqlite3
 import sys
+import threading
 import time
 from contextlib import contextmanager
 
-def _find_project_root():
-    """Discover the project root where .claude/larvling.db lives.
+from config import PROJECT_ROOT
 
-    Priority: CLAUDE_PROJECT_DIR env → walk up from cwd → cwd fallback.
-    """
-    env_root = os.environ.get("CLAUDE_PROJECT_DIR")
-    if env_root:
-        return env_root
-
-    # Walk up from cwd looking for .claude/larvling.db
-    d = os.path.abspath(os.getcwd())
-    for _ in range(20):  # safety bound
-        if os.path.exists(os.path.join(d, ".claude", "larvling.db")):
-            return d
-        parent = os.path.dirname(d)
-        if parent == d:
-            break
-        d = parent
-
-    return os.getcwd()
-
-
-PROJECT_ROOT = _find_project_root()
 DB_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling.db")
 
 
@@ -48,25 +34,93 @@ def get_plugin_version():
         return "?"
 
 
-def get_db():
-    """Open a connection to larvling.db with WAL mode and Row factory."""
-    conn = sqlite3.connect(DB_PATH)
+# PRAGMA profiles, chosen with "db_profile" in larvling.config.json. Every
+# profile runs WAL with foreign keys and a busy timeout (see get_db()).
+# "balanced" trades fsync-per-commit for fsync-per-checkpoint, which WAL keeps
+# safe against process crashes (a power loss can drop the last commits).
+DB_PROFILES = {
+    "safe": {
+        "synchronous": "FULL",
+        "temp_store": "DEFAULT",
+        "cache_size": -2000,  # KiB (SQLite's default)
+        "mmap_size": 0,
+    },
+    "balanced": {
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": -16000,
+        "mmap_size": 64 * 1024 * 1024,
+    },
+    "fast": {
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+    },
+}
+DEFAULT_PROFILE = "balanced"
+STATEMENT_CACHE = 256  # prepared statements kept per connection (sqlite3 LRU)
+
+
+def get_db(path=None, profile=None):
+    """Open a new connection to larvling.db (or *path*) with a PRAGMA profile.
+
+    *profile* defaults to the configured "db_profile". Most callers want
+    open_db(), which reuses one connection per thread.
+    """
+    if profile is None:
+        from config import get_config
+
+        profile = get_config()["db_profile"]
+    pragmas = DB_PROFILES.get(profile) or DB_PROFILES[DEFAULT_PROFILE]
+
+    conn = sqlite3.connect(path or DB_PATH, cached_statements=STATEMENT_CACHE)
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute("PRAGMA foreign_keys=ON")
     conn.execute("PRAGMA busy_timeout=5000")
+    for name, value in pragmas.items():
+        conn.execute(f"PRAGMA {name}={value}")
     conn.row_factory = sqlite3.Row
     return conn
 
 
+# open_db() keeps one connection per thread (sqlite3 connections are bound to
+# the thread that made them) and hands it out again on the next call, so a
+# hook pays for connect + PRAGMAs once per process and the connection's
+# statement cache stays warm across calls — and across requests in the daemon.
+_local = threading.local()
+
+
+def close_connection():
+    """Close this thread's cached connection, if one is open."""
+    conn = getattr(_local, "conn", None)
+    _local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
 @contextmanager
 def open_db():
     """Context manager for database connections.
 
-    Commits on clean exit, rolls back on exception, always closes.
+    Commits on clean exit, rolls back on exception. The thread's cached
+    connection is reused and left open; a nested open_db() (while the cached
+    one is in use) gets a fresh connection that is closed on exit, so inner
+    blocks never commit or roll back the outer block's work.
     Callers may still call conn.commit() explicitly for intermediate
     checkpoints — the final commit on exit is a safe no-op in that case.
     """
-    conn = get_db()
+    cached = not getattr(_local, "busy", False)
+    if cached:
+        conn = getattr(_local, "conn", None)
+        if conn is None:
+            conn = _local.conn = get_db()
+        _local.busy = True
+    else:
+        conn = get_db()
     try:
         yield conn
         conn.commit()
@@ -74,7 +128,10 @@ def open_db():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        if cached:
+            _local.busy = False
+        else:
+            conn.close()
 
 
 def parse_meta(metadata_str):
@@ -92,6 +149,26 @@ def escape_like(query):
     return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
 
+def fts_query(text, prefix=True):
+    """Turn free text into a safe FTS5 MATCH expression.
+
+    Each word becomes a quoted term (prefix-matched by default) and terms are
+    OR-ed, so bm25 ranks rows matching more of them first. Returns None when
+    *text* has no searchable words.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    star = "*" if prefix else ""
+    return " OR ".join(f'"{w}"{star}' for w in dict.fromkeys(words))
+
+
+def fts_phrase(text):
+    """Turn text (e.g. a file name) into an FTS5 phrase query, or None."""
+    words = re.findall(r"\w+", text.lower())
+    return '"' + " ".join(words) + '"' if words else None
+
+
 def reconfigure_stdout():
     """Reconfigure stdout for UTF-8 on Windows."""
     fn = getattr(sys.stdout, "reconfigure", None)
@@ -118,7 +195,7 @@ def has_table(conn, name):
 # Schema creation and versioning
 # ---------------------------------------------------------------------------
 
-SCHEMA_VERSION = 13
+SCHEMA_VERSION = 24
 
 
 def get_schema_version(conn):
@@ -132,12 +209,24 @@ def set_schema_version(conn, version=SCHEMA_VERSION):
 
 
 def get_current_schema(conn):
-    """Read the live schema from sqlite_master."""
+    """Read the live schema from sqlite_master.
+
+    FTS5 shadow tables (``<name>_data``, ``_idx``, ...) are omitted: SQLite
+    creates them with their virtual table.
+    """
     rows = conn.execute(
-        "SELECT sql FROM sqlite_master "
-        "WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'"
+        "SELECT type, name, sql FROM sqlite_master "
+        "WHERE type IN ('table', 'index', 'trigger') AND name NOT LIKE 'sqlite_%'"
     ).fetchall()
-    return "\n".join(row[0] + ";" for row in rows if row[0])
+    virtual = [
+        name for _, name, sql in rows
+        if sql and sql.upper().startswith("CREATE VIRTUAL TABLE")
+    ]
+    return "\n".join(
+        sql + ";"
+        for kind, name, sql in rows
+        if sql and not (kind == "table" and any(name.startswith(v + "_") for v in virtual))
+    )
 
 
 def get_desired_schema():
@@ -150,8 +239,81 @@ def get_desired_schema():
     return schema
 
 
+def add_missing_schema(conn):
+    """Bring an older database far enough forward for the hooks to run
+    before its migration is finalized. Returns the tables and columns added.
+
+    Creates the regular tables (with their indexes) that create_schema()
+    defines and *conn* lacks, and adds every missing column ALTER TABLE can
+    add (nullable, or with a constant default). When the counters table or
+    the sessions counter columns are new, their triggers are created and
+    their values backfilled. FTS tables, the other triggers and
+    message_files rows are left to finalize, which rebuilds derived data.
+    """
+    mem = sqlite3.connect(":memory:")
+    try:
+        create_schema(mem)
+        rows = mem.execute(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master "
+            "WHERE type IN ('table', 'index') AND sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+        virtual = [
+            name for _, name, _, sql in rows if sql.upper().startswith("CREATE VIRTUAL TABLE")
+        ]
+        regular = [
+            name for kind, name, _, _ in rows
+            if kind == "table" and not any(name == v or name.startswith(v + "_") for v in virtual)
+        ]
+        columns = {t: mem.execute(f"PRAGMA table_info({t})").fetchall() for t in regular}
+    finally:
+        mem.close()
+
+    added = [t for t in regular if not has_table(conn, t)]
+    for kind, name, table, sql in rows:
+        if (name if kind == "table" else table) in added:
+            conn.execute(sql)
+    for table in regular:
+        if table in added:
+            continue
+        have = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+        for _, col, col_type, notnull, default, pk in columns[table]:
+            if col in have or pk:
+                continue
+            if (notnull and default is None) or str(default).upper().startswith("CURRENT_"):
+                continue  # ALTER TABLE can't add it; the migration will
+            ddl = f"ALTER TABLE {table} ADD COLUMN {col} {col_type}"
+            if notnull:
+                ddl += " NOT NULL"
+            if default is not None:
+                ddl += f" DEFAULT {default}"
+            conn.execute(ddl)
+            added.append(f"{table}.{col}")
+
+    if "counters" in added or "sessions.message_count" in added:
+        _create_counter_triggers(conn)
+        _backfill_counts(conn)
+    conn.commit()
+    return added
+
+
+# (source table, FTS table, indexed columns). External-content FTS5 tables:
+# the text lives only in the source table; triggers keep the index in sync.
+FTS_TABLES = (
+    ("messages", "messages_fts", ("content",)),
+    ("statements", "statements_fts", ("claim",)),
+    ("topics", "topics_fts", ("title", "tags")),
+    ("tasks", "tasks_fts", ("title",)),
+)
+
+# (embeddings.kind, source table, embedded column) — see vectors.py.
+EMBEDDED = (
+    ("statement", "statements", "claim"),
+    ("topic", "topics", "title"),
+)
+
+
 def create_schema(conn):
-    """Create all tables and indexes (idempotent)."""
+    """Create all tables, indexes and triggers (idempotent)."""
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS sessions (
@@ -165,7 +327,10 @@ def create_schema(conn):
             summary_at TEXT,
             summary_msg_count INTEGER,
             tags TEXT,
-            summary_offered INTEGER DEFAULT 0
+            summary_offered INTEGER DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            user_count INTEGER NOT NULL DEFAULT 0,
+            assistant_count INTEGER NOT NULL DEFAULT 0
         )
     """
     )
@@ -229,6 +394,98 @@ def create_schema(conn):
         )
     """
     )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transcript_checkpoints (
+            session_id TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            prefix_hash TEXT NOT NULL,
+            turn_start INTEGER NOT NULL,
+            turn_end INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER,
+            user_text TEXT,
+            agent_text TEXT,
+            tools TEXT,
+            files TEXT,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analysis_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            turn_start INTEGER NOT NULL,
+            user_text TEXT,
+            agent_text TEXT,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'claimed', 'done', 'skipped', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            claim TEXT,
+            claimed_at REAL,
+            enqueued_at REAL NOT NULL,
+            error TEXT,
+            model_ms INTEGER,
+            UNIQUE (session_id, turn_start)
+        )
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analysis_queue_status "
+        "ON analysis_queue(status, session_id)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created REAL NOT NULL,
+            used REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_analysis_cache_used ON analysis_cache(used)"
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS embeddings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            vec BLOB NOT NULL,
+            UNIQUE (kind, ref_id)
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_files (
+            message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+            session_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            PRIMARY KEY (message_id, path)
+        ) WITHOUT ROWID
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_files_name "
+        "ON message_files(name, session_id)"
+    )
     conn.execute(
         "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id)"
     )
@@ -244,9 +501,163 @@ def create_schema(conn):
     conn.execute(
         "CREATE INDEX IF NOT EXISTS idx_updates_task ON updates(task_id)"
     )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    for table, fts, columns in FTS_TABLES:
+        _create_fts(conn, table, fts, columns)
+    _create_counter_triggers(conn)
+    for kind, table, column in EMBEDDED:
+        # A vector describes the text it was computed from: drop it when the
+        # text changes or the row goes; vectors.sync() re-embeds.
+        forget = f"DELETE FROM embeddings WHERE kind = '{kind}' AND ref_id = old.id;"
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_vec_au AFTER UPDATE OF {column} ON {table} "
+            f"BEGIN {forget} END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_vec_ad AFTER DELETE ON {table} "
+            f"BEGIN {forget} END"
+        )
     conn.commit()
 
 
+def _create_fts(conn, table, fts, columns):
+    """Create an external-content FTS5 index over *table* plus its sync triggers."""
+    cols = ", ".join(columns)
+    new_vals = ", ".join(f"new.{c}" for c in columns)
+    old_vals = ", ".join(f"old.{c}" for c in columns)
+    conn.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END"
+    )
+
+
+# counters.name -> the COUNT(*) it mirrors. Kept current by triggers so hot
+# paths read counts in O(1) instead of scanning.
+COUNTERS = {
+    "topics": "SELECT COUNT(*) FROM topics",
+    "statements": "SELECT COUNT(*) FROM statements",
+    "messages": "SELECT COUNT(*) FROM messages",
+    "open_tasks": "SELECT COUNT(*) FROM tasks WHERE status = 'open'",
+    "embeddings": "SELECT COUNT(*) FROM embeddings",
+}
+
+
+def _create_counter_triggers(conn):
+    """Create the counters rows and the triggers that maintain them.
+
+    Also maintains sessions.message_count/user_count/assistant_count.
+    """
+    for name in COUNTERS:
+        conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (name,))
+
+    for table in ("topics", "statements", "embeddings"):
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_count_ai AFTER INSERT ON {table} BEGIN "
+            f"UPDATE counters SET value = value + 1 WHERE name = '{table}'; END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_count_ad AFTER DELETE ON {table} BEGIN "
+            f"UPDATE counters SET value = value - 1 WHERE name = '{table}'; END"
+        )
+
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS tasks_count_ai AFTER INSERT ON tasks BEGIN "
+        "UPDATE counters SET value = value + (new.status = 'open') WHERE name = 'open_tasks'; END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS tasks_count_ad AFTER DELETE ON tasks BEGIN "
+        "UPDATE counters SET value = value - (old.status = 'open') WHERE name = 'open_tasks'; END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS tasks_count_au AFTER UPDATE OF status ON tasks BEGIN "
+        "UPDATE counters SET value = value + (new.status = 'open') - (old.status = 'open') "
+        "WHERE name = 'open_tasks'; END"
+    )
+
+    add = (
+        "UPDATE sessions SET message_count = message_count + 1, "
+        "user_count = user_count + (new.role = 'user'), "
+        "assistant_count = assistant_count + (new.role = 'assistant') "
+        "WHERE id = new.session_id;"
+    )
+    remove = (
+        "UPDATE sessions SET message_count = message_count - 1, "
+        "user_count = user_count - (old.role = 'user'), "
+        "assistant_count = assistant_count - (old.role = 'assistant') "
+        "WHERE id = old.session_id;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS messages_count_ai AFTER INSERT ON messages BEGIN "
+        f"UPDATE counters SET value = value + 1 WHERE name = 'messages'; {add} END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS messages_count_ad AFTER DELETE ON messages BEGIN "
+        f"UPDATE counters SET value = value - 1 WHERE name = 'messages'; {remove} END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS messages_count_au AFTER UPDATE OF role, session_id ON messages BEGIN "
+        f"{remove} {add} END"
+    )
+
+
+def rebuild_derived(conn):
+    """Recompute every trigger-maintained structure from the base tables.
+
+    Run once after a schema migration, when the triggers did not see the
+    rows written before they existed.
+    """
+    for _, fts, _ in FTS_TABLES:
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    _backfill_counts(conn)
+    rows = conn.execute(
+        "SELECT id, session_id, content FROM messages WHERE role IN ('user', 'assistant')"
+    )
+    for row in rows.fetchall():
+        index_message_files(conn, row[0], row[1], extract_paths(row[2]))
+    conn.commit()
+
+
+def _backfill_counts(conn):
+    """Recompute the counters rows and the sessions.*_count columns."""
+    for name, sql in COUNTERS.items():
+        conn.execute(
+            f"INSERT INTO counters (name, value) VALUES (?, ({sql})) "
+            f"ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name,),
+        )
+    conn.execute(
+        """
+        UPDATE sessions SET
+            message_count = (SELECT COUNT(*) FROM messages m WHERE m.session_id = sessions.id),
+            user_count = (SELECT COUNT(*) FROM messages m
+                          WHERE m.session_id = sessions.id AND m.role = 'user'),
+            assistant_count = (SELECT COUNT(*) FROM messages m
+                               WHERE m.session_id = sessions.id AND m.role = 'assistant')
+        """
+    )
+
+
 # ---------------------------------------------------------------------------
 # Session / Message / Summary CRUD
 # ---------------------------------------------------------------------------
@@ -266,13 +677,69 @@ def ensure_session(conn, session_id):
     )
 
 
-def record_message(conn, session_id, role, content, metadata=None):
-    """Record a conversation turn in the messages table."""
-    conn.execute(
+def record_message(conn, session_id, role, content, metadata=None, files=()):
+    """Record a conversation turn in the messages table.
+
+    For user and assistant turns, every file path mentioned in *content*,
+    plus any in *files* (paths from tool call inputs), goes to message_files.
+    """
+    cur = conn.execute(
         "INSERT INTO messages (session_id, role, content, metadata) "
         "VALUES (?, ?, ?, ?)",
         (session_id, role, content, json.dumps(metadata) if metadata else None),
     )
+    if role in ("user", "assistant"):
+        paths = extract_paths(content)
+        paths.extend(p for p in files if p)
+        index_message_files(conn, cur.lastrowid, session_id, paths)
+
+
+# A candidate path: a run of characters that can't be sentence or code syntax.
+_PATH_TOKEN = re.compile(r"[^\s`'\"()<>\[\]{},;|*=$]+")
+# Bare file names need an extension; anything containing '/' qualifies as is.
+_FILE_NAME = re.compile(r"[\w-][\w.-]*\.[A-Za-z][A-Za-z0-9]{0,5}")
+_LINE_SUFFIX = re.compile(r"(?::\d+)+$")  # "app.py:12:4"
+MAX_MESSAGE_FILES = 100  # paths indexed per message
+MAX_PATH_CHARS = 260
+
+
+def extract_paths(text):
+    """File paths mentioned in *text*, first mention first.
+
+    Matches bare names with an extension (``db.py``) and slash-separated
+    paths (``scripts/hooks/stop.py``, ``src/Makefile``); URLs, e-mail
+    addresses, ``file.py:12`` line suffixes and call syntax are handled.
+    """
+    paths = {}
+    for m in _PATH_TOKEN.finditer(text or ""):
+        tok = m.group()
+        if "://" in tok or "@" in tok or m.end() < len(text) and text[m.end()] == "(":
+            continue
+        tok = _LINE_SUFFIX.sub("", tok.replace("\\", "/").rstrip(".:!?"))
+        name = tok.rstrip("/").rsplit("/", 1)[-1]
+        if not name or len(tok) > MAX_PATH_CHARS:
+            continue
+        if _FILE_NAME.fullmatch(name) or ("/" in tok and re.fullmatch(r"[\w.-]+", name)):
+            paths[tok] = None
+            if len(paths) >= MAX_MESSAGE_FILES:
+                break
+    return list(paths)
+
+
+def index_message_files(conn, message_id, session_id, paths):
+    """Add *paths* to message_files for one message, keyed by lowercase basename."""
+    rows = {}
+    for path in paths:
+        path = path.replace("\\", "/")
+        name = path.rstrip("/").rsplit("/", 1)[-1].lower()
+        if name:
+            rows[path] = (message_id, session_id, name, path)
+    if rows:
+        conn.executemany(
+            "INSERT OR IGNORE INTO message_files (message_id, session_id, name, path) "
+            "VALUES (?, ?, ?, ?)",
+            list(rows.values())[:MAX_MESSAGE_FILES],
+        )
 
 
 def record_summary(
@@ -317,11 +784,294 @@ def finalize_session(conn, session_id):
     )
 
 
+def get_transcript_checkpoint(conn, session_id):
+    """Get the transcript tailing checkpoint for a session. Returns Row or None."""
+    return conn.execute(
+        "SELECT * FROM transcript_checkpoints WHERE session_id = ?",
+        (session_id,),
+    ).fetchone()
+
+
+def save_transcript_checkpoint(
+    conn,
+    session_id,
+    path,
+    byte_offset,
+    prefix_hash,
+    turn_start,
+    turn_end,
+    size,
+    mtime_ns,
+    user_text=None,
+    agent_text=None,
+    tools=None,
+    files=None,
+):
+    """Create or replace the transcript checkpoint for a session.
+
+    Holds both the tailing position (byte_offset, prefix_hash, turn_start)
+    and the last parsed turn, keyed by (path, size, mtime_ns).
+    """
+    conn.execute(
+        """
+        INSERT INTO transcript_checkpoints
+            (session_id, path, byte_offset, prefix_hash, turn_start, turn_end,
+             size, mtime_ns, user_text, agent_text, tools, files)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET
+            path = excluded.path,
+            byte_offset = excluded.byte_offset,
+            prefix_hash = excluded.prefix_hash,
+            turn_start = excluded.turn_start,
+            turn_end = excluded.turn_end,
+            size = excluded.size,
+            mtime_ns = excluded.mtime_ns,
+            user_text = excluded.user_text,
+            agent_text = excluded.agent_text,
+            tools = excluded.tools,
+            files = excluded.files,
+            updated = datetime('now')
+        """,
+        (
+            session_id, path, byte_offset, prefix_hash, turn_start, turn_end,
+            size, mtime_ns, user_text, agent_text, tools, files,
+        ),
+    )
+
+
+def get_state(conn, key, default=None):
+    """Read a JSON value from the per-project state table."""
+    row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return default
+    try:
+        return json.loads(row[0])
+    except (json.JSONDecodeError, ValueError):
+        return default
+
+
+def set_state(conn, key, value):
+    """Store a JSON-serializable value in the per-project state table."""
+    conn.execute(
+        "INSERT INTO state (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated = datetime('now')",
+        (key, json.dumps(value)),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Analysis queue
+#
+# Stop enqueues one row per exchange, keyed by (session_id, turn_start) so a
+# re-fired Stop for the same turn refreshes the pending row instead of adding
+# another. The analysis supervisor (workers.py) claims a session's pending
+# rows with a single UPDATE (atomic, so two claims never share a row); the
+# worker it hands the claim to marks them done in the same transaction that
+# writes the extraction results. Claims older than the stale timeout go back
+# to pending: a crashed worker or supervisor delays its exchanges but never
+# loses them. Exchanges triage.py rates too low to analyze end up 'skipped';
+# done rows keep their share of the batch's model time (model_ms), which is
+# what analysis_stats() reports as saved per skipped exchange.
+# ---------------------------------------------------------------------------
+
+ANALYSIS_MAX_ATTEMPTS = 3
+
+
+def enqueue_analysis(conn, session_id, turn_start, user_text, agent_text):
+    """Queue an exchange for analysis (or refresh it while still pending)."""
+    conn.execute(
+        """
+        INSERT INTO analysis_queue (session_id, turn_start, user_text, agent_text, enqueued_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(session_id, turn_start) DO UPDATE SET
+            user_text = excluded.user_text,
+            agent_text = excluded.agent_text
+        WHERE status = 'pending'
+        """,
+        (session_id, turn_start, user_text, agent_text, time.time()),
+    )
+
+
+def claim_analysis(conn, session_id, limit):
+    """Claim up to *limit* of a session's oldest pending exchanges.
+
+    Returns (claim, rows); rows is empty when nothing was pending.
+    Commits, so the claim is visible to other processes immediately.
+    """
+    import uuid
+
+    claim = uuid.uuid4().hex
+    conn.execute(
+        """
+        UPDATE analysis_queue
+        SET status = 'claimed', claim = ?, claimed_at = ?, attempts = attempts + 1
+        WHERE id IN (
+            SELECT id FROM analysis_queue
+            WHERE session_id = ? AND status = 'pending'
+            ORDER BY id LIMIT ?
+        )
+        """,
+        (claim, time.time(), session_id, limit),
+    )
+    conn.commit()
+    return claim, claimed_analysis(conn, claim)
+
+
+def claimed_analysis(conn, claim):
+    """The exchanges still held by *claim*, oldest first."""
+    return conn.execute(
+        "SELECT id, turn_start, user_text, agent_text FROM analysis_queue "
+        "WHERE claim = ? AND status = 'claimed' ORDER BY id",
+        (claim,),
+    ).fetchall()
+
+
+def ready_analysis(conn, batch_max, max_delay):
+    """Sessions with a full batch, or whose oldest pending exchange has
+    waited *max_delay* seconds. Batches not yet tried come first, so a
+    failing one cannot starve the rest; then longest-waiting first."""
+    return [
+        r[0] for r in conn.execute(
+            "SELECT session_id FROM analysis_queue WHERE status = 'pending' "
+            "GROUP BY session_id HAVING COUNT(*) >= ? OR MIN(enqueued_at) <= ? "
+            "ORDER BY MIN(attempts), MIN(enqueued_at)",
+            (batch_max, time.time() - max_delay),
+        ).fetchall()
+    ]
+
+
+def complete_analysis(conn, claim, model_ms=None):
+    """Mark a claim's exchanges done; returns how many it still held.
+
+    *model_ms* is each exchange's share of the model call's time.
+    Call before writing the results, in the same transaction: if a stale
+    claim was requeued in the meantime the count comes back short and the
+    caller must roll back rather than apply the results a second time.
+    """
+    return conn.execute(
+        "UPDATE analysis_queue SET status = 'done', error = NULL, model_ms = ? "
+        "WHERE claim = ? AND status = 'claimed'",
+        (model_ms, claim),
+    ).rowcount
+
+
+def skip_analysis(conn, claim, ids):
+    """Mark exchanges *ids* of *claim* skipped by triage; returns how many.
+
+    Commits, so a worker that dies in the model call afterwards only
+    requeues the exchanges that still need it.
+    """
+    placeholders = ",".join("?" * len(ids))
+    n = conn.execute(
+        f"UPDATE analysis_queue SET status = 'skipped', error = NULL "
+        f"WHERE claim = ? AND status = 'claimed' AND id IN ({placeholders})",
+        (claim, *ids),
+    ).rowcount
+    conn.commit()
+    return n
+
+
+def analysis_stats(conn):
+    """Triage report over the rows still in the queue (done ones are pruned
+    after a week): {"done", "skipped", "skip_rate", "model_ms", "saved_ms"}.
+
+    saved_ms estimates the model time skipping avoided: skipped exchanges
+    times the mean model time of an analyzed one.
+    """
+    done, skipped, avg_ms, total_ms = conn.execute(
+        "SELECT COALESCE(SUM(status = 'done'), 0), COALESCE(SUM(status = 'skipped'), 0), "
+        "AVG(model_ms), COALESCE(SUM(model_ms), 0) FROM analysis_queue"
+    ).fetchone()
+    seen = done + skipped
+    return {
+        "done": done,
+        "skipped": skipped,
+        "skip_rate": skipped / seen if seen else 0.0,
+        "model_ms": total_ms,
+        "saved_ms": round(skipped * (avg_ms or 0)),
+    }
+
+
+def release_analysis(conn, claim, error):
+    """Return a failed claim to pending; give up after ANALYSIS_MAX_ATTEMPTS."""
+    conn.execute(
+        """
+        UPDATE analysis_queue
+        SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+            claim = NULL, claimed_at = NULL, error = ?
+        WHERE claim = ? AND status = 'claimed'
+        """,
+        (ANALYSIS_MAX_ATTEMPTS, str(error)[:500], claim),
+    )
+    conn.commit()
+
+
+def cached_analysis(conn, key):
+    """The extraction result cached under *key* (a dict), or None.
+
+    A hit counts as a use, moving the entry to the back of the LRU order.
+    """
+    row = conn.execute("SELECT result FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    conn.execute(
+        "UPDATE analysis_cache SET used = ?, hits = hits + 1 WHERE key = ?",
+        (time.time(), key),
+    )
+    return json.loads(row[0])
+
+
+def cache_analysis(conn, key, result, max_entries):
+    """Cache an extraction *result* under *key*, keeping the *max_entries*
+    most recently used entries. Does not commit."""
+    now = time.time()
+    conn.execute(
+        "INSERT INTO analysis_cache (key, result, created, used) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET result = excluded.result, used = excluded.used",
+        (key, json.dumps(result), now, now),
+    )
+    conn.execute(
+        "DELETE FROM analysis_cache WHERE key IN ("
+        "SELECT key FROM analysis_cache ORDER BY used DESC LIMIT -1 OFFSET ?)",
+        (int(max_entries),),
+    )
+
+
+def recover_analysis(conn, stale_after, keep_done_days=7):
+    """Requeue claims older than *stale_after* seconds and prune old done rows.
+
+    Returns the number of exchanges requeued.
+    """
+    now = time.time()
+    n = conn.execute(
+        "UPDATE analysis_queue SET status = 'pending', claim = NULL, claimed_at = NULL "
+        "WHERE status = 'claimed' AND claimed_at < ?",
+        (now - stale_after,),
+    ).rowcount
+    conn.execute(
+        "DELETE FROM analysis_queue WHERE status IN ('done', 'skipped') AND enqueued_at < ?",
+        (now - keep_done_days * 86400,),
+    )
+    conn.commit()
+    return n
+
+
 # ---------------------------------------------------------------------------
 # Query helpers
 # ---------------------------------------------------------------------------
 
 
+def get_counts(conn, *names):
+    """Read trigger-maintained row counts. Returns {name: int} (0 if unknown)."""
+    counts = dict.fromkeys(names, 0)
+    placeholders = ",".join("?" * len(names))
+    for row in conn.execute(
+        f"SELECT name, value FROM counters WHERE name IN ({placeholders})", names
+    ):
+        counts[row[0]] = row[1]
+    return counts
+
+
 def get_summary(conn, session_id):
     """Get the session row (which includes summary fields). Returns Row or None."""
     return conn.execute(
@@ -346,9 +1096,7 @@ def list_sessions(conn, show_summary_status=False):
     query = """
         SELECT s.id, s.started_at, s.duration_min, s.title,
                s.agent_summary, s.summary_msg_count,
-               (SELECT COUNT(*) FROM messages m
-                WHERE m.session_id = s.id
-                AND m.role IN ('user', 'assistant')) AS current_msg_count
+               s.user_count + s.assistant_count AS current_msg_count
         FROM sessions s
         ORDER BY s.started_at DESC
     """ if show_summary_status else """
@@ -403,14 +1151,14 @@ def fetch_session_tags(conn, session_id):
 
 
 def log(event, session_id=None, **data):
-    """Append a JSONL entry to .claude/larvling.jsonl for debugging."""
+    """Queue a JSONL entry for .claude/larvling.jsonl (see eventlog.py)."""
     try:
-        log_path = os.path.join(PROJECT_ROOT, ".claude", "larvling.jsonl")
+        import eventlog
+
         entry = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "event": event}
         if session_id:
             entry["sid"] = session_id[:8]
         entry.update(data)
-        with open(log_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        eventlog.emit(entry)
     except Exception:
         pass
@@ -0,0 +1,161 @@
+"""Larvling event log — buffered, rotating JSONL at .claude/larvling.jsonl.
+
+db.log() hands entries to emit(), which only queues them. flush() writes the
+queue with a single append; it runs after every hook step (larvling_hook.py)
+and daemon request, at interpreter exit, whenever the queue reaches
+MAX_PENDING, and right away for errors, so a hook killed at its timeout
+still leaves the events that explain it.
+
+Before each write the live file is rotated once it would exceed
+``log_max_mb`` or its oldest entry is older than ``log_max_age_days``. The
+rotated file is gzipped next to it as ``larvling-<stamp>.jsonl.gz`` and only
+the newest ``log_archives`` archives are kept, which bounds disk use at
+roughly (1 + log_archives) x log_max_mb before compression. The rotation
+settings are read once per process.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+from db import PROJECT_ROOT
+
+LOG_DIR = os.path.join(PROJECT_ROOT, ".claude")
+LOG_PATH = os.path.join(LOG_DIR, "larvling.jsonl")
+ARCHIVE_PREFIX = "larvling-"
+ARCHIVE_SUFFIX = ".jsonl.gz"
+MAX_PENDING = 100  # entries queued before an early flush
+
+_pending = []
+_lock = threading.Lock()
+_rotation = None  # (max_bytes, max_age_days, archives), read on first use
+_oldest = (None, None)  # (inode, first entry's ts) of the live log
+
+
+def emit(entry):
+    """Queue one log entry (a JSON-serializable dict); errors flush at once."""
+    line = json.dumps(entry, separators=(",", ":")) + "\n"
+    urgent = "error" in entry or str(entry.get("event", "")).endswith("_error")
+    with _lock:
+        _pending.append(line)
+        full = len(_pending) >= MAX_PENDING
+    if full or urgent:
+        flush()
+
+
+def flush():
+    """Write every queued entry in one append, rotating first if due."""
+    global _pending
+    with _lock:
+        if not _pending:
+            return
+        data, _pending = "".join(_pending), []
+        try:
+            _maybe_rotate(len(data.encode("utf-8")))
+            with open(LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(data)
+        except Exception:
+            pass
+
+
+atexit.register(flush)
+
+
+def _rotation_config():
+    global _rotation
+    if _rotation is None:
+        from config import get_config
+
+        cfg = get_config()
+        _rotation = (cfg["log_max_mb"] * 1024 * 1024, cfg["log_max_age_days"], cfg["log_archives"])
+    return _rotation
+
+
+def _oldest_ts(inode):
+    """Timestamp string of the first entry in the live log, or None.
+
+    Read once per live file (*inode*): appends never change the first line.
+    """
+    global _oldest
+    if _oldest[0] != inode:
+        try:
+            with open(LOG_PATH, "r", encoding="utf-8") as f:
+                ts = json.loads(f.readline())["ts"]
+        except (OSError, ValueError, KeyError, TypeError):
+            ts = None
+        _oldest = (inode, ts)
+    return _oldest[1]
+
+
+def _maybe_rotate(incoming):
+    try:
+        st = os.stat(LOG_PATH)
+    except OSError:
+        return
+    if not st.st_size:
+        return
+    max_bytes, max_age_days, keep = _rotation_config()
+    due = bool(max_bytes) and st.st_size + incoming > max_bytes
+    if not due and max_age_days:
+        # "ts" is local ISO time, so string order is time order (and avoids
+        # importing _strptime on every flush).
+        oldest = _oldest_ts(st.st_ino)
+        cutoff = time.strftime(
+            "%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - max_age_days * 86400)
+        )
+        due = isinstance(oldest, str) and oldest < cutoff
+    if due:
+        rotate(keep)
+
+
+def rotate(keep):
+    """Move the live log aside, gzip it, and prune archives beyond *keep*.
+
+    The rename is atomic, so when several hook processes decide to rotate at
+    once only one wins; the rest find no file and simply append to the new one.
+    """
+    import gzip
+    import shutil
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = f"{ARCHIVE_PREFIX}{stamp}-{os.getpid()}"
+    raw = os.path.join(LOG_DIR, name + ".jsonl")
+    try:
+        os.rename(LOG_PATH, raw)
+    except OSError:
+        return
+    if keep:
+        archive = os.path.join(LOG_DIR, name + ARCHIVE_SUFFIX)
+        try:
+            with open(raw, "rb") as src, gzip.open(archive + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(archive + ".tmp", archive)
+        except OSError:
+            return  # keep the uncompressed file rather than lose it
+    os.remove(raw)
+    prune(keep)
+
+
+def archives():
+    """Archive paths, oldest first."""
+    try:
+        names = os.listdir(LOG_DIR)
+    except OSError:
+        return []
+    return [
+        os.path.join(LOG_DIR, n)
+        for n in sorted(names)
+        if n.startswith(ARCHIVE_PREFIX) and n.endswith(ARCHIVE_SUFFIX)
+    ]
+
+
+def prune(keep):
+    """Delete all but the newest *keep* archives."""
+    paths = archives()
+    for path in paths[: max(0, len(paths) - keep)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -1,6 +1,5 @@
 """UserPromptSubmit hook — logs the user's prompt and injects context hints."""
 
-import json
 import os
 import re
 import sys
@@ -8,12 +7,14 @@ import sys
 from config import get_config
 from db import (
     open_db,
+    get_counts,
+    get_state,
     has_table,
     ensure_session,
     record_message,
     record_summary,
     log,
-    PROJECT_ROOT,
+    set_state,
 )
 from health import record_failure, pending_failure, clear_failure
 from hooks_util import read_hook_payload
@@ -29,29 +30,6 @@ def strip_ide_tags(text):
     ).strip()
 
 
-def _last_context_counts():
-    """Read the last context event from the JSONL log and return (topics, stmts)."""
-    try:
-        log_path = os.path.join(PROJECT_ROOT, ".claude", "larvling.jsonl")
-        last = None
-        with open(log_path, "r", encoding="utf-8") as f:
-            for line in f:
-                try:
-                    entry = json.loads(line)
-                except (json.JSONDecodeError, ValueError):
-                    continue
-                if entry.get("event") == "context" and entry.get("injected"):
-                    last = entry
-        if last:
-            for item in last["injected"]:
-                m = re.match(r"(\d+)(?:\s*\([^)]*\))?\s*topics,\s*(\d+)(?:\s*\([^)]*\))?\s*statements", item)
-                if m:
-                    return int(m.group(1)), int(m.group(2))
-    except Exception:
-        pass
-    return None, None
-
-
 def _fmt_delta(current, previous):
     """Format a count with optional delta suffix, e.g. '17 (+2)'."""
     if previous is None or current == previous:
@@ -61,20 +39,16 @@ def _fmt_delta(current, previous):
     return f"{current} ({sign}{diff})"
 
 
-def _recent_extraction(conn):
+def _recent_extraction(conn, cur_topics, cur_stmts, prev_topics, prev_stmts):
     """Build a brief summary of what was learned since the last prompt.
 
-    Compares current topic/statement/task counts against the last context
-    event and, when there's growth, fetches the most recently added items
-    from the database so the agent can mention them naturally.
+    Compares current topic/statement counts against those last injected
+    and, when there's growth, fetches the most recently added items from
+    the database so the agent can mention them naturally.
     """
-    prev_topics, prev_stmts = _last_context_counts()
     if prev_topics is None:
         return None
 
-    cur_topics = conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0] if has_table(conn, "topics") else 0
-    cur_stmts = conn.execute("SELECT COUNT(*) FROM statements").fetchone()[0] if has_table(conn, "statements") else 0
-
     new_topics = cur_topics - (prev_topics or 0)
     new_stmts = cur_stmts - (prev_stmts or 0)
 
@@ -113,12 +87,8 @@ def inject_context(conn, session_id):
     injected = []
 
     if cfg["context_hints"] and has_table(conn, "topics"):
-        topic_count = conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
-        stmt_count = (
-            conn.execute("SELECT COUNT(*) FROM statements").fetchone()[0]
-            if has_table(conn, "statements")
-            else 0
-        )
+        counts = get_counts(conn, "topics", "statements")
+        topic_count, stmt_count = counts["topics"], counts["statements"]
         scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
         query_script = os.path.normpath(os.path.join(scripts_dir, "query.py")).replace(
             "\\", "/"
@@ -142,15 +112,18 @@ def inject_context(conn, session_id):
         print(text)
 
         # Show what was learned from the last exchange (extraction feedback)
-        extraction = _recent_extraction(conn)
+        prev = get_state(conn, "context_counts", {})
+        prev_topics, prev_stmts = prev.get("topics"), prev.get("statements")
+        extraction = _recent_extraction(conn, topic_count, stmt_count, prev_topics, prev_stmts)
         if extraction:
             print(f"Last learned: {extraction}")
             injected.append(f"learned: {extraction}")
 
-        prev_topics, prev_stmts = _last_context_counts()
         t_str = _fmt_delta(topic_count, prev_topics)
         s_str = _fmt_delta(stmt_count, prev_stmts)
         injected.append(f"{t_str} topics, {s_str} statements")
+        set_state(conn, "context_counts", {"topics": topic_count, "statements": stmt_count})
+        conn.commit()
 
     if not cfg["summary_hints"]:
         if injected:
@@ -158,15 +131,12 @@ def inject_context(conn, session_id):
         return
 
     session = conn.execute(
-        "SELECT summary_msg_count, agent_summary, summary_offered FROM sessions WHERE id = ?",
+        "SELECT summary_msg_count, agent_summary, summary_offered, "
+        "user_count + assistant_count AS msg_count FROM sessions WHERE id = ?",
         (session_id,),
     ).fetchone()
     if session:
-        msg_count = conn.execute(
-            "SELECT COUNT(*) FROM messages WHERE session_id = ? "
-            "AND role IN ('user', 'assistant')",
-            (session_id,),
-        ).fetchone()[0]
+        msg_count = session["msg_count"]
         summarized = session["summary_msg_count"] or 0
         already_offered = session["summary_offered"] or 0
 
@@ -225,7 +195,7 @@ def handle(data):
                 count = 0
                 if role == "user":
                     count = conn.execute(
-                        "SELECT COUNT(*) FROM messages WHERE session_id = ? AND role = 'user'",
+                        "SELECT user_count FROM sessions WHERE id = ?",
                         (session_id,),
                     ).fetchone()[0]
                     if count == 1:
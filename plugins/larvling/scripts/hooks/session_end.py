@@ -18,22 +18,19 @@ def handle(data):
     with open_db() as conn:
         # Check if any messages were recorded for this session.
         # If not, it's a ghost session (started but no real exchange happened).
-        msg_count = conn.execute(
-            "SELECT COUNT(*) FROM messages WHERE session_id = ?",
+        counts = conn.execute(
+            "SELECT message_count, user_count FROM sessions WHERE id = ?",
             (session_id,),
-        ).fetchone()[0]
+        ).fetchone()
 
-        if msg_count == 0:
+        if not counts or counts["message_count"] == 0:
             log("session_end", session_id, ghost=True)
             return
 
         ensure_session(conn, session_id)
         finalize_session(conn, session_id)
 
-        exchange_count = conn.execute(
-            "SELECT COUNT(*) FROM messages WHERE session_id = ? AND role = 'user'",
-            (session_id,),
-        ).fetchone()[0]
+        exchange_count = counts["user_count"]
 
         record_summary(
             conn,
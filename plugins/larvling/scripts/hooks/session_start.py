@@ -2,59 +2,27 @@
 
 import json
 import os
-import subprocess
 import sys
+import threading
 import time
-import urllib.request
 
+import cache
+from cache import GITHUB_REPO
 from config import get_config
+from context import ContextBuilder, clip
 from db import (
     SCHEMA_VERSION,
-    escape_like,
+    get_counts,
     get_plugin_version,
     get_summary,
     has_table,
+    log,
     open_db,
     reconfigure_stdout,
     get_schema_version,
 )
 from health import recording_gap, pending_failure, clear_failure
 
-CACHE_PATH = os.path.join(
-    os.environ.get("CLAUDE_PROJECT_DIR") or os.getcwd(),
-    ".claude", "larvling-cache.json",
-)
-CACHE_TTL = 86400  # 24 hours
-
-
-def _read_cache(key):
-    """Read a cached value. Returns None if expired or missing."""
-    try:
-        with open(CACHE_PATH, "r", encoding="utf-8") as f:
-            cache = json.load(f)
-        entry = cache.get(key)
-        if entry and time.time() - entry.get("ts", 0) < CACHE_TTL:
-            return entry.get("data")
-    except Exception:
-        pass
-    return None
-
-
-def _write_cache(key, data):
-    """Write a value to the file-based cache."""
-    try:
-        try:
-            with open(CACHE_PATH, "r", encoding="utf-8") as f:
-                cache = json.load(f)
-        except Exception:
-            cache = {}
-        cache[key] = {"ts": time.time(), "data": data}
-        with open(CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(cache, f)
-    except Exception:
-        pass
-
-
 def format_session_line(started_at, duration_min, summary):
     """Format a session as a markdown bullet line."""
     date = (started_at or "?")[:10]
@@ -89,85 +57,68 @@ def get_recent_summaries(conn, limit=5):
     return summaries, sids
 
 
-def get_git_context():
-    """Get file paths from recent git activity. Returns list of file names."""
-    files = []
+GIT_COMMANDS = (
+    ["git", "diff", "--name-only"],
+    ["git", "diff", "--name-only", "--cached"],
+    ["git", "log", "--pretty=format:", "-5", "--name-only"],
+)
 
-    for cmd in [
-        ["git", "diff", "--name-only"],
-        ["git", "diff", "--name-only", "--cached"],
-    ]:
+
+def get_git_context(timeout=3):
+    """Get file paths from recent git activity. Returns list of file names.
+
+    The git commands run in parallel and share one *timeout*.
+    """
+    import subprocess
+
+    procs = []
+    for cmd in GIT_COMMANDS:
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=3)
-            if result.returncode == 0:
-                files.extend(result.stdout.strip().splitlines())
+            procs.append(subprocess.Popen(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            ))
         except FileNotFoundError:
             return []  # git not installed
-        except (OSError, subprocess.TimeoutExpired):
+        except OSError:
             continue
 
-    try:
-        result = subprocess.run(
-            ["git", "log", "--pretty=format:", "-5", "--name-only"],
-            capture_output=True,
-            text=True,
-            timeout=3,
-        )
-        if result.returncode == 0:
-            for line in result.stdout.strip().splitlines():
-                line = line.strip()
-                if line:
-                    files.append(line)
-    except (subprocess.TimeoutExpired, FileNotFoundError, OSError):
-        pass
+    deadline = time.monotonic() + timeout
+    files = []
+    for proc in procs:
+        try:
+            out, _ = proc.communicate(timeout=max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            continue
+        if proc.returncode == 0:
+            files.extend(out.splitlines())
 
     return list(dict.fromkeys(f.strip() for f in files if f.strip()))
 
 
 def find_relevant_sessions(conn, file_names, exclude_sids, limit=3):
-    """Find sessions that reference any of the given file names.
+    """Find sessions that mention the most of the given files.
 
-    Scopes the LIKE search to the 50 most recent sessions to avoid
-    full table scans on messages.content.
+    Files are matched by basename against the message_files index in one
+    query over all history; ties go to the more recent session.
     """
-    if not file_names:
-        return []
-
-    # Pre-fetch recent session IDs to bound the LIKE scan
-    recent_sids = [
-        r[0] for r in conn.execute(
-            "SELECT id FROM sessions ORDER BY started_at DESC LIMIT 50"
-        ).fetchall()
-    ]
-    if not recent_sids:
-        return []
-
-    placeholders = ",".join("?" * len(recent_sids))
-
-    session_hits = {}
-    for fname in file_names:
-        basename = os.path.basename(fname)
-        if not basename:
-            continue
-        safe_name = escape_like(basename)
-        rows = conn.execute(
-            f"SELECT DISTINCT session_id FROM messages "
-            f"WHERE session_id IN ({placeholders}) "
-            f"AND content LIKE ? ESCAPE '\\' "
-            f"AND role IN ('user', 'assistant')",
-            (*recent_sids, f"%{safe_name}%"),
-        ).fetchall()
-        for row in rows:
-            sid = row["session_id"]
-            if sid not in exclude_sids:
-                session_hits[sid] = session_hits.get(sid, 0) + 1
-
-    if not session_hits:
+    names = list(dict.fromkeys(
+        os.path.basename(f.rstrip("/")).lower() for f in file_names if f.strip()
+    ))
+    if not names:
         return []
 
-    top_sids = sorted(session_hits, key=lambda sid: session_hits[sid], reverse=True)[
-        :limit
-    ]
+    exclude = list(exclude_sids)
+    rows = conn.execute(
+        "SELECT session_id FROM message_files "
+        "WHERE name IN (SELECT value FROM json_each(?)) "
+        "AND session_id NOT IN (SELECT value FROM json_each(?)) "
+        "GROUP BY session_id "
+        "ORDER BY COUNT(DISTINCT name) DESC, MAX(message_id) DESC LIMIT ?",
+        (json.dumps(names), json.dumps(exclude), limit),
+    ).fetchall()
+    top_sids = [r["session_id"] for r in rows]
 
     results = []
     for sid in top_sids:
@@ -184,7 +135,8 @@ def find_relevant_sessions(conn, file_names, exclude_sids, limit=3):
 def get_time_and_location(enable_geo=True):
     """Return a line with local datetime, UTC offset, and approximate location.
 
-    Location comes from a free IP-geolocation API (cached for 24h).
+    Location comes from a free IP-geolocation API via the cache module, which
+    serves the last known value and refreshes it in the background.
     Falls back gracefully — time is always available, location is best-effort.
     Set enable_geo=False to skip the geolocation lookup entirely.
     """
@@ -200,19 +152,9 @@ def get_time_and_location(enable_geo=True):
     if not enable_geo:
         return " — ".join(parts)
 
-    # Best-effort geolocation (cached 24h to avoid repeated API calls)
-    geo = _read_cache("geolocation")
-    if geo is None:
-        try:
-            req = urllib.request.Request(
-                "https://ipinfo.io/json",
-                headers={"User-Agent": "larvling", "Accept": "application/json"},
-            )
-            with urllib.request.urlopen(req, timeout=3) as resp:
-                geo = json.loads(resp.read().decode("utf-8"))
-            _write_cache("geolocation", geo)
-        except Exception:
-            geo = {}
+    # Best-effort geolocation: whatever the cache holds now (refreshed in the
+    # background once it is a day old), never a network wait.
+    geo = cache.get("geolocation") or {}
 
     city = geo.get("city", "")
     region = geo.get("region", "")
@@ -228,170 +170,212 @@ def get_time_and_location(enable_geo=True):
     return " — ".join(parts)
 
 
-def get_session_context():
-    """Build curated session context from summaries and relevant sessions."""
+# Section weights for the context budget: when everything doesn't fit,
+# lines from higher-weighted sections are kept first.
+SECTION_WEIGHTS = {
+    "recent": 1.0,
+    "tasks": 0.9,
+    "relevant": 0.8,
+    "knowledge": 0.7,
+    "activity": 0.6,
+    "maintenance": 0.3,
+}
+ACTIVITY_CHARS = 300  # per raw message in the no-summaries fallback
+
+
+def _rank_score(i, n):
+    """1.0 for the first of n items, falling linearly to 0.5 for the last."""
+    return 1.0 - 0.5 * i / max(1, n - 1)
+
+
+def get_relevant_sessions():
+    """Sessions touching files from recent git activity (excluding the recent ones)."""
+    git_files = get_git_context()
+    if not git_files:
+        return []
     with open_db() as conn:
-        lines = ["# Larvling Session Context", ""]
+        _, recent_sids = get_recent_summaries(conn)
+        return find_relevant_sessions(conn, git_files, recent_sids)
 
-        # Time and location
-        cfg = get_config()
-        try:
-            time_loc = get_time_and_location(enable_geo=cfg["geolocation"])
-            lines.append(f"**Now:** {time_loc}")
-            lines.append("")
-        except Exception:
-            pass
-
-        # Recent session summaries
-        summaries, recent_sids = get_recent_summaries(conn)
-        if summaries:
-            lines.append("## Recent Sessions")
-            lines.extend(summaries)
-            lines.append("")
-
-        # Git-aware relevant sessions
-        git_files = get_git_context()
-        if git_files:
-            relevant = find_relevant_sessions(conn, git_files, recent_sids)
-            if relevant:
-                lines.append("## Relevant Sessions")
-                lines.extend(relevant)
-                lines.append("")
-
-        # Knowledge awareness at session start
-        topic_count = 0
-        stmt_count = 0
-        if has_table(conn, "topics"):
-            topic_count = conn.execute("SELECT COUNT(*) FROM topics").fetchone()[0]
-            stmt_count = conn.execute("SELECT COUNT(*) FROM statements").fetchone()[0] if has_table(conn, "statements") else 0
-            if topic_count:
-                domain_rows = conn.execute(
-                    "SELECT COALESCE(domain, 'unset') as d, COUNT(*) as c "
-                    "FROM topics GROUP BY domain ORDER BY c DESC"
-                ).fetchall()
-                domains = ", ".join(
-                    f"{r['d']} ({r['c']})" for r in domain_rows
-                )
-                recent = conn.execute(
-                    "SELECT t.id, t.title, s.id as sid, s.claim "
-                    "FROM topics t JOIN statements s ON s.topic_id = t.id "
-                    "ORDER BY s.updated DESC, s.created DESC LIMIT 5"
-                ).fetchall()
-                lines.append(f"## Stored Knowledge ({topic_count} topics, {stmt_count} statements)")
-                lines.append(f"Domains: {domains}")
-                for r in recent:
-                    lines.append(f"- {r['sid']}: {r['claim']}")
-                lines.append("")
-
-        # Maintenance hint for large knowledge bases
-        if topic_count >= 50 or stmt_count >= 100:
-            lines.append(f"## Maintenance Suggested")
-            lines.append(
-                f"Knowledge base is large ({topic_count} topics, {stmt_count} statements) "
-                "and may benefit from consolidation."
-            )
-            lines.append("")
 
-        # Open tasks at session start. Keep this a *bounded briefing*, not a dump:
-        # listing every open task floods context and (ironically) nudges the agent to
-        # re-query to filter it, which on a big table trips the query.py refusal. At or
-        # below a threshold, list them all (unchanged for healthy DBs); above it, inject
-        # a rollup + the top slice and point at a scoped query for the rest.
+def load_context_data():
+    """Run the DB queries behind the session context. Returns a dict."""
+    data = {"domains": None, "recent": [], "open_tasks": [], "activity": []}
+    with open_db() as conn:
+        data["summaries"], _ = get_recent_summaries(conn)
+        data["counts"] = get_counts(conn, "topics", "statements", "open_tasks", "messages")
+        if has_table(conn, "topics") and data["counts"]["topics"]:
+            domain_rows = conn.execute(
+                "SELECT COALESCE(domain, 'unset') as d, COUNT(*) as c "
+                "FROM topics GROUP BY domain ORDER BY c DESC"
+            ).fetchall()
+            data["domains"] = ", ".join(
+                f"{r['d']} ({r['c']})" for r in domain_rows
+            )
+            data["recent"] = conn.execute(
+                "SELECT t.id, t.title, s.id as sid, s.claim "
+                "FROM topics t JOIN statements s ON s.topic_id = t.id "
+                "ORDER BY s.updated DESC, s.created DESC LIMIT 5"
+            ).fetchall()
         if has_table(conn, "tasks"):
-            total_open = conn.execute(
-                "SELECT COUNT(*) FROM tasks WHERE status = 'open'"
-            ).fetchone()[0]
-            open_tasks = conn.execute(
+            data["open_tasks"] = conn.execute(
                 "SELECT id, title, priority, horizon FROM tasks "
                 "WHERE status = 'open' "
                 "ORDER BY CASE horizon WHEN 'now' THEN 1 WHEN 'soon' THEN 2 ELSE 3 END, "
                 "CASE priority WHEN 'high' THEN 1 WHEN 'medium' THEN 2 ELSE 3 END"
             ).fetchall()
-            if open_tasks:
-                LIST_ALL_MAX = 30   # at/below this total, show every task (healthy DBs)
-                NOW_LIST_MAX = 40   # ceiling for the 'now' list; only a pathological pile hits it
-                if total_open <= LIST_ALL_MAX:
-                    lines.append(f"## Open Tasks ({total_open})")
-                    for t in open_tasks:
-                        lines.append(f"- [{t['priority']}/{t['horizon']}] {t['title']}")
-                else:
-                    # Too many to list in full. Emit the shape (a rollup -- never capped),
-                    # then list the actionable 'now' horizon COMPLETELY: bounded by urgency,
-                    # not an arbitrary count, so "what's on the agenda" is answerable from
-                    # context without a query. 'soon'/'later' stay rolled up; the agent
-                    # scopes into them on demand. Only a pathologically large 'now' pile
-                    # falls back to a pointer (the "unless excessive" carve-out).
-                    order = ("now", "soon", "later")
-                    buckets = {h: [] for h in order}
-                    for t in open_tasks:
-                        h = t["horizon"] if t["horizon"] in buckets else "later"
-                        buckets[h].append(t)
-                    parts = []
-                    for h in order:
-                        n = len(buckets[h])
-                        if not n:
-                            continue
-                        n_high = sum(1 for t in buckets[h] if t["priority"] == "high")
-                        parts.append(f"{h}: {n}" + (f" ({n_high} high)" if n_high else ""))
-                    lines.append(f"## Open Tasks ({total_open}) - {' | '.join(parts)}")
-                    now_tasks = buckets["now"]
-                    if 0 < len(now_tasks) <= NOW_LIST_MAX:
-                        for t in now_tasks:
-                            lines.append(f"- [{t['priority']}/now] {t['title']}")
-                        lines.append("(now listed in full; query a scope for soon/later detail)")
-                    else:
-                        hint = "horizon='now'" if now_tasks else "horizon='soon'"
-                        lines.append(f"(query a scope for detail, e.g. {hint} or priority='high')")
-                lines.append("")
-
         # Fallback: if no summaries, show recent data
-        if not summaries:
+        if not data["summaries"]:
             try:
-                rows = conn.execute(
+                data["activity"] = conn.execute(
                     "SELECT role, content FROM messages ORDER BY id DESC LIMIT 5"
                 ).fetchall()
-                if rows:
-                    total = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
-                    lines.append(f"## Recent Activity ({total} messages)")
-                    for row in rows:
-                        content = row["content"] or ""
-                        lines.append(f"- **{row['role']}:** {content}")
-                    lines.append("")
             except Exception:
                 pass
+    return data
+
 
-    return "\n".join(lines)
+def build_session_context(data, time_loc=None, relevant=None):
+    """Build curated session context from summaries and relevant sessions.
 
+    *data* is load_context_data() output, or None when it missed the
+    startup deadline (only the header and time are emitted then). Sections
+    are assembled through context.ContextBuilder so the output stays within
+    the "context_budget" config (estimated tokens).
+    """
+    cfg = get_config()
+    ctx = ContextBuilder(cfg["context_budget"])
+    ctx.pin("# Larvling Session Context")
+    ctx.pin("")
+
+    # Time and location
+    if time_loc:
+        ctx.pin(f"**Now:** {time_loc}")
+        ctx.pin("")
+
+    if data is None:
+        text, _ = ctx.render()
+        return text
+
+    # Recent session summaries
+    summaries = data["summaries"]
+    if summaries:
+        sec = ctx.section("## Recent Sessions", SECTION_WEIGHTS["recent"])
+        for i, line in enumerate(summaries):
+            sec.add(line, _rank_score(i, len(summaries)))
+
+    # Git-aware relevant sessions
+    if relevant:
+        sec = ctx.section("## Relevant Sessions", SECTION_WEIGHTS["relevant"])
+        for i, line in enumerate(relevant):
+            sec.add(line, _rank_score(i, len(relevant)))
+
+    # Knowledge awareness at session start
+    counts = data["counts"]
+    topic_count = counts["topics"]
+    stmt_count = counts["statements"]
+    if data["domains"]:
+        recent = data["recent"]
+        sec = ctx.section(
+            f"## Stored Knowledge ({topic_count} topics, {stmt_count} statements)",
+            SECTION_WEIGHTS["knowledge"],
+            name="Stored Knowledge",
+        )
+        sec.add(f"Domains: {data['domains']}")
+        for i, r in enumerate(recent):
+            sec.add(f"- {r['sid']}: {r['claim']}", _rank_score(i, len(recent)) * 0.9)
+
+    # Maintenance hint for large knowledge bases
+    if topic_count >= 50 or stmt_count >= 100:
+        ctx.section("## Maintenance Suggested", SECTION_WEIGHTS["maintenance"]).add(
+            f"Knowledge base is large ({topic_count} topics, {stmt_count} statements) "
+            "and may benefit from consolidation."
+        )
 
-GITHUB_REPO = "athrael-soju/Larvling"
-RELEASES_URL = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
+    # Open tasks at session start. Keep this a *bounded briefing*, not a dump:
+    # listing every open task floods context and (ironically) nudges the agent to
+    # re-query to filter it, which on a big table trips the query.py refusal. At or
+    # below a threshold, list them all (unchanged for healthy DBs); above it, inject
+    # a rollup + the top slice and point at a scoped query for the rest.
+    total_open = counts["open_tasks"]
+    open_tasks = data["open_tasks"]
+    if open_tasks:
+        LIST_ALL_MAX = 30   # at/below this total, show every task (healthy DBs)
+        NOW_LIST_MAX = 40   # ceiling for the 'now' list; only a pathological pile hits it
+        if total_open <= LIST_ALL_MAX:
+            sec = ctx.section(
+                f"## Open Tasks ({total_open})", SECTION_WEIGHTS["tasks"], name="Open Tasks"
+            )
+            for i, t in enumerate(open_tasks):
+                sec.add(
+                    f"- [{t['priority']}/{t['horizon']}] {t['title']}",
+                    _rank_score(i, len(open_tasks)),
+                )
+        else:
+            # Too many to list in full. Emit the shape (a rollup -- never capped),
+            # then list the actionable 'now' horizon COMPLETELY: bounded by urgency,
+            # not an arbitrary count, so "what's on the agenda" is answerable from
+            # context without a query. 'soon'/'later' stay rolled up; the agent
+            # scopes into them on demand. Only a pathologically large 'now' pile
+            # falls back to a pointer (the "unless excessive" carve-out).
+            order = ("now", "soon", "later")
+            buckets = {h: [] for h in order}
+            for t in open_tasks:
+                h = t["horizon"] if t["horizon"] in buckets else "later"
+                buckets[h].append(t)
+            parts = []
+            for h in order:
+                n = len(buckets[h])
+                if not n:
+                    continue
+                n_high = sum(1 for t in buckets[h] if t["priority"] == "high")
+                parts.append(f"{h}: {n}" + (f" ({n_high} high)" if n_high else ""))
+            sec = ctx.section(
+                f"## Open Tasks ({total_open}) - {' | '.join(parts)}",
+                SECTION_WEIGHTS["tasks"],
+                name="Open Tasks",
+            )
+            now_tasks = buckets["now"]
+            if 0 < len(now_tasks) <= NOW_LIST_MAX:
+                for i, t in enumerate(now_tasks):
+                    sec.add(
+                        f"- [{t['priority']}/now] {t['title']}",
+                        _rank_score(i, len(now_tasks)),
+                    )
+                sec.add("(now listed in full; query a scope for soon/later detail)")
+            else:
+                hint = "horizon='now'" if now_tasks else "horizon='soon'"
+                sec.add(f"(query a scope for detail, e.g. {hint} or priority='high')")
+
+    rows = data["activity"]
+    if rows:
+        sec = ctx.section(
+            f"## Recent Activity ({counts['messages']} messages)",
+            SECTION_WEIGHTS["activity"],
+            name="Recent Activity",
+        )
+        for i, row in enumerate(rows):
+            content = clip(row["content"] or "", ACTIVITY_CHARS)
+            sec.add(f"- **{row['role']}:** {content}", _rank_score(i, len(rows)))
+
+    text, report = ctx.render()
+    if report["dropped"]:
+        log("context_budget", **report)
+    return text
 
 
 def check_update():
     """Compare local plugin version against latest GitHub release.
 
     Returns an update notice string, or None if up to date / check fails.
-    Uses a 24h file cache to avoid repeated API calls.
+    The latest release comes from the cache module (refreshed in the
+    background daily), so this never waits on GitHub.
     """
     local_version = get_plugin_version()
     if local_version == "?":
         return None
 
-    latest = _read_cache("update_check")
-    if latest is None:
-        try:
-            req = urllib.request.Request(
-                RELEASES_URL,
-                headers={"Accept": "application/vnd.github+json", "User-Agent": "larvling"},
-            )
-            with urllib.request.urlopen(req, timeout=3) as resp:
-                data = json.loads(resp.read().decode("utf-8"))
-            latest = data.get("tag_name", "").lstrip("v")
-            if latest:
-                _write_cache("update_check", latest)
-        except Exception:
-            return None
-
+    latest = cache.get("update_check")
     if not latest or not local_version:
         return None
 
@@ -409,20 +393,25 @@ def check_update():
     return None
 
 
-def build_health_banner(payload):
+def check_recording_gap(payload):
+    """Count recent sessions Larvling missed (health.recording_gap); 0 on error."""
+    try:
+        with open_db() as conn:
+            return recording_gap(conn, payload)
+    except Exception:
+        return 0
+
+
+def build_health_banner(gap, marker):
     """Build a recording-health warning, or None when recording looks healthy.
 
-    Covers two silent-failure modes: a run of recent sessions Claude Code
-    recorded that Larvling didn't (a broken plugin cache / hooks not running),
-    and a one-shot marker left by a hook whose DB write threw.
+    Covers two silent-failure modes: a run of *gap* recent sessions Claude
+    Code recorded that Larvling didn't (a broken plugin cache / hooks not
+    running), and the one-shot *marker* (pending_failure()) left by a hook
+    whose DB write threw. The caller clears the marker once the banner is out.
     """
     lines = []
 
-    try:
-        with open_db() as conn:
-            gap = recording_gap(conn, payload)
-    except Exception:
-        gap = 0
     if gap:
         lines.append(
             f"> ⚠️ **Larvling recording check:** the last {gap} session(s) in this "
@@ -431,9 +420,7 @@ def build_health_banner(payload):
             f"can reinstall or check the plugin."
         )
 
-    marker = pending_failure()
     if marker:
-        clear_failure()
         stage = marker.get("stage", "a recent exchange")
         err = marker.get("error", "")
         detail = f" ({err})" if err else ""
@@ -445,6 +432,45 @@ def build_health_banner(payload):
     return "\n".join(lines) if lines else None
 
 
+STARTUP_DEADLINE = 5  # seconds for all steps together; the hook's limit is 10
+
+
+def run_concurrently(steps, timeout):
+    """Run {name: fn} on daemon threads and wait at most *timeout* seconds.
+
+    Returns {name: result} for the steps that finished without raising.
+    Daemon threads let the hook exit without joining a step that is still
+    stuck on the network. Per-step timings (ms, or "timeout") are logged.
+    """
+    results, timings, errors = {}, {}, {}
+    t0 = time.perf_counter()
+
+    def run(name, fn):
+        try:
+            results[name] = fn()
+        except Exception as e:
+            errors[name] = str(e) or type(e).__name__
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    threads = [
+        threading.Thread(target=run, args=(name, fn), daemon=True)
+        for name, fn in steps.items()
+    ]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.join(max(0, deadline - time.monotonic()))
+
+    done = dict(timings)  # snapshot: late finishers must not leak in
+    for name in steps:
+        if name not in done:
+            done[name] = "timeout"
+    log("session_start_timing", total=round((time.perf_counter() - t0) * 1000, 1), **done,
+        **({"errors": errors} if errors else {}))
+    return {name: results[name] for name in steps if name in results and done[name] != "timeout"}
+
+
 def main():
     if os.environ.get("LARVLING_INTERNAL"):
         return
@@ -470,18 +496,38 @@ def main():
     if matcher == "compact":
         return
 
+    # The failure marker and the clock are cheap local reads, taken here so a
+    # missed deadline can't drop them.
+    cfg = get_config()
+    marker = pending_failure()
+    time_loc = get_time_and_location(enable_geo=cfg["geolocation"])
+
+    # Every step below is I/O-bound (DB, git, network), so they run side by
+    # side under one deadline; a step that misses it is left out.
+    results = run_concurrently(
+        {
+            "gap": lambda: check_recording_gap(payload),
+            "relevant": get_relevant_sessions,
+            "context": load_context_data,
+            "update": check_update,
+        },
+        STARTUP_DEADLINE,
+    )
+
     # Surface recording-health warnings first so they aren't buried in context.
-    health_banner = build_health_banner(payload)
+    health_banner = build_health_banner(results.get("gap"), marker)
     if health_banner:
         print(health_banner)
         print()
 
-    print(get_session_context())
+    print(build_session_context(results.get("context"), time_loc, results.get("relevant")))
 
-    update_notice = check_update()
+    update_notice = results.get("update")
     if update_notice:
         print(f"\n{update_notice}")
 
+    if marker:
+        clear_failure()  # only now that the banner has been emitted
 
 if __name__ == "__main__":
     main()
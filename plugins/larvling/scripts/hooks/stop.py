@@ -1,14 +1,16 @@
-"""Stop hook — logs the agent's last response."""
+"""Stop hook — logs the agent's last response and queues the exchange for analysis."""
 
+from config import get_config
 from db import (
     open_db,
+    enqueue_analysis,
     ensure_session,
     record_message,
     log,
 )
 from health import record_failure
 from hooks_util import read_hook_payload
-from transcript import parse_last_turn, wait_for_transcript_stable
+from transcript import last_turn, wait_for_transcript_stable
 
 
 def handle(data):
@@ -23,10 +25,10 @@ def handle(data):
 
     wait_for_transcript_stable(transcript_path)
 
-    response, tools = parse_last_turn(transcript_path)
-
     try:
         with open_db() as conn:
+            turn = last_turn(conn, session_id, transcript_path)
+            response, tools = turn["agent_text"], turn["tools"]
             ensure_session(conn, session_id)
 
             # Log the response (if any and not a duplicate)
@@ -41,7 +43,15 @@ def handle(data):
                 is_dup = bool(row and row[0] == response)
                 if not is_dup:
                     meta = {"tool_calls": tools} if tools else None
-                    record_message(conn, session_id, "assistant", response, meta)
+                    record_message(
+                        conn, session_id, "assistant", response, meta, files=turn["files"]
+                    )
+
+            # analyze.py (the next Stop command) wakes the analysis supervisor.
+            if get_config()["analysis"] and (turn["user_text"] or response):
+                enqueue_analysis(
+                    conn, session_id, turn["turn_start"], turn["user_text"], response
+                )
 
             conn.commit()
     except Exception as e:
@@ -0,0 +1,93 @@
+"""
+Larvling hook entry point — runs one Claude Code hook's steps in one process.
+
+Usage (from hooks/run.sh, which picks the interpreter):
+    python larvling_hook.py <hook>    # session_start | prompt | stop | session_end
+    python larvling_hook.py <event>   # a single step: preflight | analyze | ... (debugging)
+
+A hook is a sequence of events (see HOOKS): SessionStart runs preflight then
+session_start, Stop runs stop then the analysis hand-off. The payload is read
+from stdin once and every event gets the same bytes. When the project
+enables the daemon, each event goes to it if one is listening (see
+daemon.py); otherwise its script runs in this process, so modules imported
+by the first step are reused by the next. Output is printed in order.
+"""
+
+import os
+import sys
+
+import daemon
+
+# Hook -> (events in order, whether a failing event stops the rest).
+# SessionStart context depends on a passed preflight; analysis is handed
+# off whether or not the Stop write succeeded.
+HOOKS = {
+    "session_start": (("preflight", "session_start"), True),
+    "prompt": (("prompt",), True),
+    "stop": (("stop", "analyze"), False),
+    "session_end": (("session_end",), True),
+}
+
+
+def run_event(event, raw, use_daemon):
+    """Run one event. Returns (exit code, whether the daemon served it)."""
+    reply = daemon.forward(event, raw) if use_daemon else None
+    if reply is not None:
+        stdout, code = reply
+        if stdout:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(stdout.encode("utf-8"))
+            sys.stdout.flush()
+        return code, True
+
+    path = os.path.join(daemon.SCRIPTS_DIR, daemon.HOOK_SCRIPTS[event])
+    try:
+        code = daemon.run_script(path, raw)
+    except Exception as e:
+        # Separate processes used to isolate the steps; keep later ones running.
+        from db import log
+
+        log("hook_error", hook=event, error=str(e) or type(e).__name__)
+        code = 1
+    sys.stdout.flush()
+    # Put this step's events on disk before the next one can hit the hook's
+    # timeout. Only loaded if the step logged anything.
+    eventlog = sys.modules.get("eventlog")
+    if eventlog is not None:
+        eventlog.flush()
+    return code, False
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else None
+    if name in HOOKS:
+        events, stop_on_error = HOOKS[name]
+    elif name in daemon.HOOK_SCRIPTS:
+        events, stop_on_error = (name,), True
+    else:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    if os.environ.get("LARVLING_INTERNAL"):
+        return
+
+    try:
+        raw = sys.stdin.buffer.read()
+    except Exception:
+        raw = b""
+
+    use_daemon = daemon.enabled()
+    status = 0
+    in_process = False
+    for event in events:
+        code, served = run_event(event, raw, use_daemon)
+        in_process = in_process or not served
+        status = status or code
+        if code and stop_on_error:
+            break
+    if use_daemon and in_process:
+        daemon.autostart()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,111 @@
 """
 Larvling Preflight — schema bootstrap.
 Ensures the database and schema exist before any other hooks run.
+
+    python preflight.py                        # check (skipped while the stamp matches)
+    python preflight.py --force                # check even if the stamp matches
+    python preflight.py --finalize-migration   # after a manual schema migration
+
+A successful check writes .claude/larvling-preflight.json, keyed by the
+plugin version, schema version, interpreter, installed SDK version and the
+database file's identity and PRAGMA user_version. While that key still
+matches, preflight returns before touching the SDK or the schema; any change, a failed check or a
+pending migration runs the full check again.
 """
 
+import json
 import os
-import shutil
 import sys
 
 from db import (
     DB_PATH,
+    PROJECT_ROOT,
     SCHEMA_VERSION,
+    get_plugin_version,
     open_db,
     reconfigure_stdout,
     create_schema,
+    add_missing_schema,
     get_schema_version,
     set_schema_version,
     get_current_schema,
     get_desired_schema,
+    rebuild_derived,
 )
 
 
+STAMP_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling-preflight.json")
+
+
+def _sdk_version():
+    """Installed claude-agent-sdk version without importing it, or None.
+
+    Read from the package's .dist-info directory name; falls back to the
+    package file's mtime when there is none (e.g. a source checkout).
+    """
+    from importlib.util import find_spec
+
+    spec = find_spec("claude_agent_sdk")
+    if spec is None or not spec.origin:
+        return None
+    pkg_dir = os.path.dirname(spec.origin)
+    site = os.path.dirname(pkg_dir)
+    try:
+        for name in os.listdir(site):
+            if name.startswith("claude_agent_sdk-") and name.endswith(".dist-info"):
+                return name[len("claude_agent_sdk-"):-len(".dist-info")]
+        return f"mtime:{os.stat(spec.origin).st_mtime_ns}"
+    except OSError:
+        return None
+
+
+def stamp_key():
+    """Everything a passed check depends on. A DB replaced or recreated gets
+    a new inode, and one restored or migrated in place a new user_version;
+    a DB that is missing yields None and never matches."""
+    try:
+        st = os.stat(DB_PATH)
+    except OSError:
+        db_id = None
+    else:
+        # One PRAGMA on the connection every later step of the hook reuses.
+        with open_db() as conn:
+            db_id = [st.st_dev, st.st_ino, get_schema_version(conn)]
+    return {
+        "plugin": get_plugin_version(),
+        "schema": SCHEMA_VERSION,
+        "python": [sys.executable, sys.version],
+        "sdk": _sdk_version(),
+        "db": db_id,
+    }
+
+
+def stamp_matches(key):
+    try:
+        with open(STAMP_PATH, "r", encoding="utf-8") as f:
+            return json.load(f).get("key") == key
+    except (OSError, ValueError, AttributeError):
+        return False
+
+
+def write_stamp(key):
+    """Record a passed check (atomically: a torn stamp would just mismatch)."""
+    tmp = f"{STAMP_PATH}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": key}, f)
+        os.replace(tmp, STAMP_PATH)
+    except OSError:
+        pass
+
+
+def clear_stamp():
+    try:
+        os.remove(STAMP_PATH)
+    except OSError:
+        pass
+
+
 def ensure_schema():
     """Ensure current schema exists.
 
@@ -44,13 +130,17 @@ def ensure_schema():
         if db_version == SCHEMA_VERSION:
             return "current"
 
-        # Version mismatch - backup DB, then dump both schemas for Claude to handle
+        # Version mismatch - backup DB, then dump both schemas for Claude to
+        # handle. New tables and columns are added right away (the backup is
+        # taken first): hooks need them before the migration is finalized.
+        import shutil
+
+        backup_path = DB_PATH + f".v{db_version}.bak"
+        shutil.copy2(DB_PATH, backup_path)
+        add_missing_schema(conn)
         old_schema = get_current_schema(conn)
         new_schema = get_desired_schema()
 
-    backup_path = DB_PATH + f".v{db_version}.bak"
-    shutil.copy2(DB_PATH, backup_path)
-
     print("# Larvling - Schema Migration Required\n")
     print(
         f"Database schema is version **{db_version}**, expected **{SCHEMA_VERSION}**."
@@ -67,25 +157,44 @@ def ensure_schema():
         + safe_path
         + "` from the current schema to the desired schema."
     )
-    print("Preserve all existing data. After migrating, run:")
     print(
-        f"```bash\n{py} -c \"import sqlite3; c=sqlite3.connect('{safe_path}'); c.execute('PRAGMA user_version={SCHEMA_VERSION}'); c.close()\"\n```"
+        "Preserve all existing data. Virtual tables and triggers are created "
+        "for you in the next step — migrate the regular tables, then run:"
     )
+    script = os.path.abspath(__file__).replace("\\", "/")
+    print(f"```bash\n{py} \"{script}\" --finalize-migration\n```")
 
     return "migrate"
 
 
+def finalize_migration():
+    """Finish a migration: add missing schema objects, rebuild indexes, bump version.
+
+    create_schema() is idempotent, so it only adds what the migrated DB still
+    lacks (FTS tables, triggers, new tables). Derived data is then rebuilt
+    from the base tables, since the triggers did not see rows written
+    before they existed.
+    """
+    clear_stamp()
+    with open_db() as conn:
+        create_schema(conn)
+        rebuild_derived(conn)
+        set_schema_version(conn)
+    print(f"Larvling database finalized at schema version {SCHEMA_VERSION}.")
+
+
 def check_dependencies():
     """Check if required Python packages are installed.
 
     Auto-installs from requirements.txt if missing.
     Returns True if all dependencies are satisfied, False otherwise.
     """
-    try:
-        import claude_agent_sdk  # noqa: F401
+    # find_spec() locates the package without importing it (the SDK and its
+    # MCP dependencies take over a second to import on every session start).
+    from importlib.util import find_spec
+
+    if find_spec("claude_agent_sdk") is not None:
         return True
-    except ImportError:
-        pass
 
     # Auto-install missing dependency
     plugin_root = os.environ.get("CLAUDE_PLUGIN_ROOT", "")
@@ -120,6 +229,9 @@ def check_dependencies():
         return False
 
     # Verify import after install
+    import importlib
+
+    importlib.invalidate_caches()
     try:
         import claude_agent_sdk  # noqa: F401
         return True
@@ -137,7 +249,20 @@ def main():
         return
     reconfigure_stdout()
 
-    check_dependencies()
+    if "--finalize-migration" in sys.argv:
+        try:
+            finalize_migration()
+        except Exception as e:
+            print(f"Migration finalize failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    key = stamp_key()
+    if "--force" not in sys.argv and stamp_matches(key):
+        return
+    clear_stamp()
+
+    deps_ok = check_dependencies()
 
     result = ensure_schema()
 
@@ -145,6 +270,10 @@ def main():
         print("# Larvling - First Run\n")
         print("Database created at `.claude/larvling.db`.")
 
+    if deps_ok and result in ("fresh", "current"):
+        # A fresh DB file did not exist when the key was taken.
+        write_stamp(stamp_key() if result == "fresh" else key)
+
 
 if __name__ == "__main__":
     main()
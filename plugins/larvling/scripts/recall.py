@@ -0,0 +1,253 @@
+"""
+Larvling Recall - ranked full-text search over stored knowledge.
+
+Usage:
+    python recall.py "<terms>"                # bm25-ranked statements, grouped by topic
+    python recall.py "<terms>" --page N       # page N of topic groups (default 1)
+    python recall.py "<terms>" --per-page N   # topic groups per page (default 10)
+    python recall.py "<terms>" --json         # JSON output
+    python recall.py "<text>" --semantic      # rank by vector similarity (finds paraphrases)
+    python recall.py --topics                 # list every topic with its statement count
+
+Matches statement claims and topic titles/tags through the FTS5 indexes.
+Topics are ranked by their best-matching row; a topic matched only by its
+title or tags shows its most recent statements instead. --semantic ranks
+claims and titles by cosine similarity to the whole text (see vectors.py)
+and uses the same grouping and output.
+"""
+
+import json
+import sys
+
+from db import fts_query, open_db, reconfigure_stdout, require_db
+
+PER_PAGE = 10
+MAX_STATEMENTS = 10  # matched statements shown per topic
+TITLE_ONLY_STATEMENTS = 5  # statements shown for a topic matched by title/tags
+SEMANTIC_K = 50  # nearest statements/topics considered by --semantic
+SEMANTIC_MIN_SCORE = 0.25  # cosine below this is noise for hashed n-gram vectors
+
+_HITS = """
+    WITH hits AS (
+        SELECT s.topic_id AS topic_id, bm25(statements_fts) AS score
+        FROM statements_fts JOIN statements s ON s.id = statements_fts.rowid
+        WHERE statements_fts MATCH :q
+        UNION ALL
+        SELECT rowid, bm25(topics_fts) FROM topics_fts WHERE topics_fts MATCH :q
+    )
+"""
+
+
+def search(conn, terms, page=1, per_page=PER_PAGE):
+    """Rank topics against *terms* and return one page of grouped results.
+
+    Returns {"total", "page", "pages", "topics": [...]}, where each topic
+    carries its matching statements ordered by bm25 (best first).
+    """
+    q = fts_query(terms)
+    result = {"total": 0, "page": page, "pages": 0, "topics": []}
+    if not q:
+        return result
+
+    total = conn.execute(
+        _HITS + "SELECT COUNT(DISTINCT topic_id) FROM hits", {"q": q}
+    ).fetchone()[0]
+    result["total"] = total
+    result["pages"] = (total + per_page - 1) // per_page
+    if not total:
+        return result
+
+    topics = conn.execute(
+        _HITS
+        + """
+        SELECT t.id, t.title, t.domain, t.tags, MIN(h.score) AS score
+        FROM hits h JOIN topics t ON t.id = h.topic_id
+        GROUP BY t.id
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+        """,
+        {"q": q, "limit": per_page, "offset": (page - 1) * per_page},
+    ).fetchall()
+    if not topics:
+        return result
+
+    ids = [t["id"] for t in topics]
+    placeholders = ",".join("?" * len(ids))
+    by_topic = {tid: [] for tid in ids}
+    for r in conn.execute(
+        f"SELECT s.id, s.topic_id, s.claim, bm25(statements_fts) AS score "
+        f"FROM statements_fts JOIN statements s ON s.id = statements_fts.rowid "
+        f"WHERE statements_fts MATCH ? AND s.topic_id IN ({placeholders}) "
+        f"ORDER BY score",
+        (q, *ids),
+    ).fetchall():
+        by_topic[r["topic_id"]].append(r)
+
+    for t in topics:
+        matched = by_topic[t["id"]]
+        entry = {
+            "id": t["id"],
+            "title": t["title"],
+            "domain": t["domain"],
+            "tags": t["tags"],
+            "score": round(t["score"], 3),
+            "matched_title": not matched,
+            "more": max(0, len(matched) - MAX_STATEMENTS),
+        }
+        if matched:
+            stmts = matched[:MAX_STATEMENTS]
+        else:
+            stmts = conn.execute(
+                "SELECT id, claim FROM statements WHERE topic_id = ? "
+                "ORDER BY updated DESC, id DESC LIMIT ?",
+                (t["id"], TITLE_ONLY_STATEMENTS),
+            ).fetchall()
+        entry["statements"] = [{"id": s["id"], "claim": s["claim"]} for s in stmts]
+        result["topics"].append(entry)
+
+    return result
+
+
+def semantic_search(conn, text, page=1, per_page=PER_PAGE):
+    """Like search(), but ranked by embedding similarity to *text*.
+
+    Scores are cosine similarities (higher is better); only hits above
+    SEMANTIC_MIN_SCORE count.
+    """
+    import vectors
+
+    vectors.sync(conn)
+    result = {"total": 0, "page": page, "pages": 0, "topics": []}
+    stmt_hits = vectors.search(conn, text, "statement", SEMANTIC_K, SEMANTIC_MIN_SCORE)
+    topic_hits = vectors.search(conn, text, "topic", SEMANTIC_K, SEMANTIC_MIN_SCORE)
+
+    stmts = {}
+    if stmt_hits:
+        ids = [sid for sid, _ in stmt_hits]
+        placeholders = ",".join("?" * len(ids))
+        for r in conn.execute(
+            f"SELECT id, topic_id, claim FROM statements WHERE id IN ({placeholders})", ids
+        ):
+            stmts[r["id"]] = r
+
+    best = {tid: score for tid, score in topic_hits}
+    by_topic = {}
+    for sid, score in stmt_hits:
+        r = stmts.get(sid)
+        if r is None:
+            continue
+        best[r["topic_id"]] = max(best.get(r["topic_id"], score), score)
+        by_topic.setdefault(r["topic_id"], []).append(r)
+
+    ranked = sorted(best, key=best.get, reverse=True)
+    result["total"] = len(ranked)
+    result["pages"] = (len(ranked) + per_page - 1) // per_page
+    for tid in ranked[(page - 1) * per_page : page * per_page]:
+        t = conn.execute(
+            "SELECT id, title, domain, tags FROM topics WHERE id = ?", (tid,)
+        ).fetchone()
+        if t is None:
+            continue
+        matched = by_topic.get(tid, [])
+        if matched:
+            shown = matched[:MAX_STATEMENTS]
+        else:
+            shown = conn.execute(
+                "SELECT id, claim FROM statements WHERE topic_id = ? "
+                "ORDER BY updated DESC, id DESC LIMIT ?",
+                (tid, TITLE_ONLY_STATEMENTS),
+            ).fetchall()
+        result["topics"].append({
+            "id": t["id"],
+            "title": t["title"],
+            "domain": t["domain"],
+            "tags": t["tags"],
+            "score": round(best[tid], 3),
+            "matched_title": not matched,
+            "more": max(0, len(matched) - MAX_STATEMENTS),
+            "statements": [{"id": r["id"], "claim": r["claim"]} for r in shown],
+        })
+    return result
+
+
+def list_topics(conn):
+    """Every topic with its statement count, grouped by domain."""
+    return conn.execute(
+        "SELECT t.id, t.title, t.domain, t.tags, COUNT(s.id) AS statements "
+        "FROM topics t LEFT JOIN statements s ON s.topic_id = t.id "
+        "GROUP BY t.id ORDER BY t.domain, t.title"
+    ).fetchall()
+
+
+def format_results(result, terms):
+    """Render search() output in the /recall skill's topic-grouped format."""
+    if not result["topics"]:
+        if result["total"]:
+            return f"No results on page {result['page']} ({result['pages']} page(s))."
+        return f"No knowledge found matching '{terms}'."
+
+    lines = []
+    for t in result["topics"]:
+        lines.append(f"**Topic: {t['title']}** ({t['domain']}) — tags: {t['tags']}")
+        for s in t["statements"]:
+            lines.append(f"  - [{s['id']}] {s['claim']}")
+        if t["more"]:
+            lines.append(f"  - (+{t['more']} more matching statements)")
+        lines.append("")
+
+    footer = f"Page {result['page']}/{result['pages']} — {result['total']} matching topic(s)."
+    if result["page"] < result["pages"]:
+        footer += f" Next: --page {result['page'] + 1}"
+    lines.append(footer)
+    return "\n".join(lines)
+
+
+def _int_arg(name, default):
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        try:
+            return max(1, int(sys.argv[idx + 1]))
+        except (IndexError, ValueError):
+            print(f"{name} needs a positive integer", file=sys.stderr)
+            sys.exit(1)
+    return default
+
+
+def main():
+    reconfigure_stdout()
+
+    if len(sys.argv) < 2:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+
+    require_db()
+    as_json = "--json" in sys.argv
+
+    with open_db() as conn:
+        if sys.argv[1] == "--topics":
+            rows = list_topics(conn)
+            if as_json:
+                print(json.dumps([dict(r) for r in rows], indent=2))
+            elif not rows:
+                print("No topics stored yet.")
+            else:
+                for r in rows:
+                    print(f"[{r['id']}] {r['title']} ({r['domain']}) — {r['statements']} statement(s) — tags: {r['tags']}")
+            return
+
+        terms = sys.argv[1]
+        page = _int_arg("--page", 1)
+        per_page = _int_arg("--per-page", PER_PAGE)
+        if "--semantic" in sys.argv:
+            result = semantic_search(conn, terms, page, per_page)
+        else:
+            result = search(conn, terms, page, per_page)
+
+    if as_json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_results(result, terms))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,62 @@
 """Claude Agent SDK integration for Larvling.
 
 Provides call_model() — the shared interface for calling Claude via
-the Agent SDK with structured output support, monkey-patched message
-parsing, and LARVLING_INTERNAL guarding.
+the Agent SDK with structured output support, tolerant message parsing,
+and LARVLING_INTERNAL guarding — plus gather_limited() and
+as_completed_limited() to run many calls concurrently in one event loop.
+
+call_model() keeps no per-call global state: the sub-agent's environment
+goes through ClaudeAgentOptions.env (applied to its CLI subprocess only),
+and the tolerant parser is installed once per process rather than swapped
+in and out around each call. Any number of calls can therefore share a
+loop.
 """
 
-import os
+MODEL = "claude-sonnet-4-6"
 
+# Overrides for the sub-agent's CLI process. LARVLING_INTERNAL stops its hooks
+# from recording the analysis session; an empty CLAUDECODE disarms Claude
+# Code's "nested session" guard when the parent is a Claude Code session.
+SUBPROCESS_ENV = {"LARVLING_INTERNAL": "1", "CLAUDECODE": ""}
 
-async def call_model(prompt, allowed_tools=None, max_turns=None, output_format=None):
-    """Call the LLM via Agent SDK and return the response.
+_TESTED_SDK_VERSIONS = ("0.1",)
+_patched = False
 
-    Returns (result, usage_info) tuple where:
-    - result is structured_output (dict) when output_format is set,
-      otherwise response text (str).
-    - usage_info is the usage dict from ResultMessage, or None if
-      not available.
 
-    Sets LARVLING_INTERNAL to prevent sub-agent from triggering hooks.
-    """
+def _load_sdk():
+    """Import the SDK and install the tolerant parser (once per process)."""
+    global _patched
     try:
         from claude_agent_sdk import query, ClaudeAgentOptions, ResultMessage
-        from claude_agent_sdk._internal.message_parser import parse_message  # noqa: PLC2701
-        from claude_agent_sdk._errors import MessageParseError  # noqa: PLC2701
-        import claude_agent_sdk._internal.client as _sdk_client  # noqa: PLC2701
         import claude_agent_sdk as _sdk_pkg  # noqa: PLC2701
     except ImportError:
         raise RuntimeError(
             "claude_agent_sdk is required but not installed. "
             "Install it with: pip install claude-agent-sdk"
         )
+    if not _patched:
+        _install_tolerant_parser(_sdk_pkg)
+        _patched = True
+    return query, ClaudeAgentOptions, ResultMessage
 
-    # Verify the SDK version is compatible with our monkey-patch.
-    # The patch targets _internal.client.parse_message which may move or
-    # change signature in future SDK releases.
-    _TESTED_SDK_VERSIONS = ("0.1",)
+
+def _install_tolerant_parser(_sdk_pkg):
+    """Make the SDK skip unknown message types instead of crashing.
+
+    The SDK (as of 0.1.39) doesn't handle rate_limit_event and other CLI
+    message types, which kills the async generator mid-stream and loses
+    all subsequent messages including the ResultMessage with structured_output.
+    The replacement is a stateless wrapper that is never restored, so it is
+    safe for concurrent calls (swapping it per call was not: one call's
+    restore could land in the middle of another's stream).
+    """
+    from claude_agent_sdk._internal.message_parser import parse_message  # noqa: PLC2701
+    from claude_agent_sdk._errors import MessageParseError  # noqa: PLC2701
+    import claude_agent_sdk._internal.client as _sdk_client  # noqa: PLC2701
+
+    # Verify the SDK version is compatible with our patch. It targets
+    # _internal.client.parse_message, which may move or change signature in
+    # future SDK releases.
     sdk_version = getattr(_sdk_pkg, "__version__", "")
     if sdk_version and not any(sdk_version.startswith(v) for v in _TESTED_SDK_VERSIONS):
         import warnings
@@ -42,61 +64,66 @@ async def call_model(prompt, allowed_tools=None, max_turns=None, output_format=N
             f"claude_agent_sdk {sdk_version} has not been tested with Larvling's "
             f"parse_message patch (tested: {', '.join(_TESTED_SDK_VERSIONS)}.*). "
             "If extraction fails, pin claude-agent-sdk to a tested version.",
-            stacklevel=2,
+            stacklevel=3,
         )
 
-    # Patch parse_message to skip unknown message types instead of crashing.
-    # The SDK (as of 0.1.39) doesn't handle rate_limit_event and other CLI
-    # message types, which kills the async generator mid-stream and loses
-    # all subsequent messages including the ResultMessage with structured_output.
-    # Note: not concurrent-safe — callers use asyncio.run() (one loop at a time).
     def _tolerant_parse(data):
         try:
             return parse_message(data)
         except MessageParseError:
             return None
 
-    opts = {"model": "claude-sonnet-4-6", "allowed_tools": allowed_tools or []}
+    setattr(_sdk_client, "parse_message", _tolerant_parse)
+
+
+async def call_model(prompt, allowed_tools=None, max_turns=None, output_format=None):
+    """Call the LLM via Agent SDK and return the response.
+
+    Returns (result, usage_info) tuple where:
+    - result is structured_output (dict) when output_format is set,
+      otherwise response text (str).
+    - usage_info is the usage dict from ResultMessage, or None if
+      not available.
+
+    Sets LARVLING_INTERNAL in the sub-agent's environment to prevent it from
+    triggering hooks. Safe to run concurrently (see gather_limited()).
+    """
+    query, ClaudeAgentOptions, ResultMessage = _load_sdk()
+
+    opts = {
+        "model": MODEL,
+        "allowed_tools": allowed_tools or [],
+        "env": dict(SUBPROCESS_ENV),
+    }
     if max_turns is not None:
         opts["max_turns"] = max_turns
     if output_format:
         opts["output_format"] = output_format
     options = ClaudeAgentOptions(**opts)
 
-    os.environ["LARVLING_INTERNAL"] = "1"
-    # Remove CLAUDECODE to prevent "nested session" guard in the subprocess
-    saved_claudecode = os.environ.pop("CLAUDECODE", None)
-    setattr(_sdk_client, "parse_message", _tolerant_parse)
-
     response_text = ""
     structured = None
     result_subtype = None
     usage_info = None
-    try:
-        async for msg in query(prompt=prompt, options=options):
-            if msg is None:
-                continue
-            if isinstance(msg, ResultMessage):
-                result_subtype = getattr(msg, "subtype", None)
-                if msg.structured_output:
-                    structured = msg.structured_output
-                # Capture usage from ResultMessage
-                msg_usage = getattr(msg, "usage", None)
-                if msg_usage:
-                    usage_info = msg_usage
-                continue
-            content = getattr(msg, "content", None)
-            if not content:
-                continue
-            for block in content:
-                text = getattr(block, "text", None)
-                if text:
-                    response_text += text
-    finally:
-        os.environ.pop("LARVLING_INTERNAL", None)
-        if saved_claudecode is not None:
-            os.environ["CLAUDECODE"] = saved_claudecode
-        setattr(_sdk_client, "parse_message", parse_message)
+    async for msg in query(prompt=prompt, options=options):
+        if msg is None:
+            continue
+        if isinstance(msg, ResultMessage):
+            result_subtype = getattr(msg, "subtype", None)
+            if msg.structured_output:
+                structured = msg.structured_output
+            # Capture usage from ResultMessage
+            msg_usage = getattr(msg, "usage", None)
+            if msg_usage:
+                usage_info = msg_usage
+            continue
+        content = getattr(msg, "content", None)
+        if not content:
+            continue
+        for block in content:
+            text = getattr(block, "text", None)
+            if text:
+                response_text += text
 
     if structured is not None:
         return structured, usage_info
@@ -107,3 +134,37 @@ async def call_model(prompt, allowed_tools=None, max_turns=None, output_format=N
         )
 
     return response_text.strip(), usage_info
+
+
+def _limited(coros, limit):
+    """Wrap *coros* so that at most *limit* of them run at once."""
+    import asyncio
+
+    sem = asyncio.Semaphore(max(1, int(limit)))
+
+    async def run(coro):
+        async with sem:
+            return await coro
+
+    return [run(c) for c in coros]
+
+
+async def gather_limited(coros, limit):
+    """Await *coros* with at most *limit* running at once.
+
+    Returns their results in order; a coroutine that raised contributes its
+    exception instead (as asyncio.gather(..., return_exceptions=True)).
+    """
+    import asyncio
+
+    return await asyncio.gather(*_limited(coros, limit), return_exceptions=True)
+
+
+def as_completed_limited(coros, limit):
+    """asyncio.as_completed() over *coros*, at most *limit* running at once.
+
+    Must be called inside a running event loop; await each yielded item.
+    """
+    import asyncio
+
+    return asyncio.as_completed(_limited(coros, limit))
@@ -5,6 +5,15 @@ Usage:
     python summarize.py --list                       # list sessions
     python summarize.py <session_id> --get           # get existing session summary
     python summarize.py <session_id> --store "text"  # store/replace session summary
+    python summarize.py --stale [--overwrite] [--workers N] [--dry-run]
+                                                     # summarize every unsummarized session
+
+--stale finds every session without a summary (with --overwrite, also every
+session whose summary covers fewer messages than it now has; review them
+with --dry-run first) and generates the summaries with concurrent SDK calls,
+--workers at a time (default: summary_workers in the config). Results are
+written every STORE_BATCH sessions in one transaction each, with progress
+and throughput printed as they land.
 """
 
 import sys
@@ -12,6 +21,7 @@ import time
 
 from db import (
     get_summary,
+    log,
     open_db,
     record_summary,
     require_db,
@@ -20,6 +30,22 @@ from db import (
     reconfigure_stdout,
 )
 
+STALE_MIN_MESSAGES = 4  # sessions shorter than this are not worth a summary
+STORE_BATCH = 10  # summaries written per transaction
+TRANSCRIPT_MAX_CHARS = 60000  # most recent conversation text sent per session
+MESSAGE_MAX_CHARS = 2000  # longer messages are cut to this
+
+SUMMARY_PROMPT = """\
+Summarize this Claude Code session for a session log. Write 1-3 sentences for \
+a short session and up to a short paragraph for a long one: what was worked on, \
+what was decided or changed, and anything left open. Plain prose, no heading, \
+no preamble.
+{previous}
+## Conversation ({count} messages{clipped})
+
+{transcript}
+"""
+
 
 def get_existing_summary(session_id):
     """Get the existing session summary for a session, if any."""
@@ -41,7 +67,7 @@ def store_summary(session_id, summary_text):
             return None
 
         msg_count = conn.execute(
-            "SELECT COUNT(*) FROM messages WHERE session_id = ? AND role IN ('user', 'assistant')",
+            "SELECT user_count + assistant_count FROM sessions WHERE id = ?",
             (session_id,),
         ).fetchone()[0]
 
@@ -61,6 +87,183 @@ def store_summary(session_id, summary_text):
     return session_id
 
 
+# ---------------------------------------------------------------------------
+# Bulk mode (--stale)
+# ---------------------------------------------------------------------------
+
+
+def stale_sessions(conn, overwrite=False):
+    """Sessions without a summary, oldest first; with *overwrite*, also those
+    whose summary lags their message count.
+
+    Returns rows of (id, msg_count, agent_summary).
+    """
+    summary = "" if overwrite else "AND COALESCE(agent_summary, '') = '' "
+    return conn.execute(
+        "SELECT id, user_count + assistant_count AS msg_count, agent_summary "
+        "FROM sessions WHERE user_count + assistant_count >= ? "
+        "AND user_count + assistant_count > COALESCE(summary_msg_count, 0) "
+        + summary + "ORDER BY started_at",
+        (STALE_MIN_MESSAGES,),
+    ).fetchall()
+
+
+def build_summary_prompt(conn, session):
+    """The summary prompt for a stale_sessions() row: its most recent
+    messages (up to TRANSCRIPT_MAX_CHARS) and the summary being extended."""
+    lines, size = [], 0
+    rows = conn.execute(
+        "SELECT role, content FROM messages WHERE session_id = ? "
+        "AND role IN ('user', 'assistant') ORDER BY id DESC",
+        (session["id"],),
+    )
+    for role, content in rows:
+        text = " ".join((content or "").split())
+        if len(text) > MESSAGE_MAX_CHARS:
+            text = text[: MESSAGE_MAX_CHARS - 3] + "..."
+        line = f"{'USER' if role == 'user' else 'AGENT'}: {text}"
+        if size + len(line) > TRANSCRIPT_MAX_CHARS and lines:
+            break
+        lines.append(line)
+        size += len(line) + 2
+    lines.reverse()
+    previous = ""
+    if session["agent_summary"]:
+        # Clipped transcripts leave this the only record of the early part.
+        previous = (
+            "\nThe previous summary covers an earlier part of the session, which "
+            "may no longer be in the messages below. Extend it: keep what it "
+            "records, correct anything the newer messages change, and add what "
+            f"happened since:\n> {session['agent_summary']}\n"
+        )
+    clipped = f", last {len(lines)} shown" if len(lines) < session["msg_count"] else ""
+    return SUMMARY_PROMPT.format(
+        previous=previous,
+        count=session["msg_count"],
+        clipped=clipped,
+        transcript="\n\n".join(lines),
+    )
+
+
+async def _summarize_one(session):
+    """Generate one summary. Returns (session, summary text, seconds, error)."""
+    from sdk import call_model
+
+    start = time.monotonic()
+    try:
+        with open_db() as conn:
+            prompt = build_summary_prompt(conn, session)
+        text, _ = await call_model(prompt, max_turns=1)
+        if not text:
+            raise RuntimeError("empty summary")
+    except Exception as e:
+        return session, None, time.monotonic() - start, str(e)
+    return session, text, time.monotonic() - start, None
+
+
+def _store_batch(done):
+    """Write (session, summary) pairs in one transaction."""
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    with open_db() as conn:
+        for session, text in done:
+            record_summary(
+                conn,
+                session["id"],
+                agent_summary=text,
+                summary_at=now,
+                summary_msg_count=session["msg_count"],
+            )
+        conn.executemany(
+            "UPDATE sessions SET summary_offered = 0 WHERE id = ?",
+            [(session["id"],) for session, _ in done],
+        )
+        conn.commit()
+
+
+async def _summarize_all(sessions, workers):
+    """Summarize *sessions* concurrently, storing every STORE_BATCH results.
+
+    Returns (stored, failed).
+    """
+    from sdk import as_completed_limited
+
+    total = len(sessions)
+    pending, stored, failed = [], 0, 0
+    start = time.monotonic()
+    coros = [_summarize_one(s) for s in sessions]
+    for n, next_done in enumerate(as_completed_limited(coros, workers), 1):
+        session, text, seconds, error = await next_done
+        if error:
+            failed += 1
+            log("summary_error", session["id"], error=error[:200])
+            print(f"[{n}/{total}] {session['id'][:8]} failed: {error}")
+            continue
+        pending.append((session, text))
+        rate = n / (time.monotonic() - start)
+        print(
+            f"[{n}/{total}] {session['id'][:8]} summarized "
+            f"({session['msg_count']} messages, {seconds:.1f}s; {rate:.2f} sessions/s)"
+        )
+        if len(pending) >= STORE_BATCH:
+            _store_batch(pending)
+            stored += len(pending)
+            pending = []
+    if pending:
+        _store_batch(pending)
+        stored += len(pending)
+    return stored, failed
+
+
+def summarize_stale(workers=None, dry_run=False, overwrite=False):
+    """Summarize every unsummarized session (and, with *overwrite*, every
+    stale one). Returns the number that failed."""
+    import asyncio
+
+    from config import get_config
+
+    workers = max(1, int(workers or get_config()["summary_workers"]))
+    with open_db() as conn:
+        sessions = stale_sessions(conn, overwrite)
+        outdated = 0 if overwrite else len(stale_sessions(conn, True)) - len(sessions)
+    if outdated:
+        print(
+            f"{outdated} sessions have an out-of-date summary; they are kept unless "
+            "you pass --overwrite (preview with --dry-run --overwrite)."
+        )
+    if not sessions:
+        print("No sessions to summarize.")
+        return 0
+    if dry_run:
+        for s in sessions:
+            state = "stale summary" if s["agent_summary"] else "no summary"
+            print(f"{s['id'][:8]}  {s['msg_count']} messages  [{state}]")
+        print(f"{len(sessions)} sessions to summarize.")
+        return 0
+
+    print(f"Summarizing {len(sessions)} sessions with {workers} workers...")
+    start = time.monotonic()
+    stored, failed = asyncio.run(_summarize_all(sessions, workers))
+    elapsed = time.monotonic() - start
+    print(
+        f"Stored {stored} summaries in {elapsed:.1f}s "
+        f"({stored / elapsed if elapsed else 0:.2f} sessions/s)"
+        + (f"; {failed} failed" if failed else "")
+    )
+    log("summarize_stale", sessions=len(sessions), stored=stored, failed=failed,
+        workers=workers, ms=round(elapsed * 1000))
+    return failed
+
+
+def _flag_value(flag):
+    if flag not in sys.argv:
+        return None
+    idx = sys.argv.index(flag)
+    if idx + 1 >= len(sys.argv) or not sys.argv[idx + 1].isdigit():
+        print(f"{flag} needs a number", file=sys.stderr)
+        sys.exit(1)
+    return int(sys.argv[idx + 1])
+
+
 def main():
     reconfigure_stdout()
     require_db()
@@ -73,6 +276,12 @@ def main():
         print_sessions(show_summary_status=True)
         return
 
+    if sys.argv[1] == "--stale":
+        failed = summarize_stale(
+            _flag_value("--workers"), "--dry-run" in sys.argv, "--overwrite" in sys.argv
+        )
+        sys.exit(1 if failed else 0)
+
     session_id = sys.argv[1]
 
     if "--get" in sys.argv:
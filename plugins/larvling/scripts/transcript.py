@@ -1,9 +1,12 @@
 """Transcript parsing utilities for Larvling hook scripts."""
 
+import hashlib
 import json
 import os
 import time
 
+from db import extract_paths, get_transcript_checkpoint, parse_meta, save_transcript_checkpoint
+
 
 def is_real_user_message(entry):
     """Return True if this is a genuine user message, not a tool_result."""
@@ -23,49 +26,50 @@ def is_real_user_message(entry):
     return False
 
 
-def _read_transcript_lines(transcript_path):
-    """Read non-empty stripped lines from a transcript file."""
-    lines = []
-    with open(transcript_path, "r", encoding="utf-8") as f:
-        for raw in f:
-            raw = raw.strip()
-            if raw:
-                lines.append(raw)
-    return lines
+def _user_text(entry):
+    """Extract the text of a real user message entry."""
+    msg = entry.get("message", {})
+    content = msg.get("content", "")
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        parts = [
+            b.get("text", "") if isinstance(b, dict) else str(b)
+            for b in content
+            if not (isinstance(b, dict) and b.get("type") == "tool_result")
+        ]
+        return " ".join(p for p in parts if p).strip()
+    return None
 
 
-def parse_last_turn(transcript_path):
-    """Extract text and tool call counts from the last assistant turn.
+# tool_use input fields that name a file.
+_PATH_INPUTS = ("file_path", "notebook_path", "path")
 
-    Reads the transcript once, finds the boundary after the last real user
-    message, and collects text blocks and tool_use counts from that point
-    forward.
 
-    Returns (text, tools) where text is the concatenated assistant response
-    and tools is a dict of {tool_name: count}.
-    """
-    if not transcript_path or not os.path.exists(transcript_path):
-        return None, {}
+def _tool_paths(tool_input):
+    """File paths named by one tool call's input (path fields, Bash commands)."""
+    if not isinstance(tool_input, dict):
+        return []
+    paths = [tool_input[k] for k in _PATH_INPUTS if isinstance(tool_input.get(k), str)]
+    command = tool_input.get("command")
+    if isinstance(command, str):
+        paths.extend(extract_paths(command))
+    return paths
 
-    lines = _read_transcript_lines(transcript_path)
 
-    # Find where the last turn starts (after the last real user message)
-    turn_start = 0
-    for i in range(len(lines) - 1, -1, -1):
-        try:
-            entry = json.loads(lines[i])
-        except json.JSONDecodeError:
-            continue
-        if is_real_user_message(entry):
-            turn_start = i + 1
-            break
+def _collect_turn(lines):
+    """Collect assistant text, tool_use counts and tool-input paths from lines.
 
+    Returns (text, tools, files) — see parse_last_turn(); *files* lists the
+    paths named in tool call inputs, first mention first.
+    """
     all_text = []
     tools = {}
-    for line in lines[turn_start:]:
+    files = {}
+    for line in lines:
         try:
             entry = json.loads(line)
-        except json.JSONDecodeError:
+        except (json.JSONDecodeError, UnicodeDecodeError):
             continue
         if entry.get("type") != "assistant":
             continue
@@ -82,6 +86,7 @@ def parse_last_turn(transcript_path):
                     elif block.get("type") == "tool_use":
                         name = block.get("name", "unknown")
                         tools[name] = tools.get(name, 0) + 1
+                        files.update(dict.fromkeys(_tool_paths(block.get("input"))))
                 elif isinstance(block, str) and block.strip():
                     parts.append(block.strip())
             if parts:
@@ -91,6 +96,90 @@ def parse_last_turn(transcript_path):
 
     text = "\n\n".join(all_text) if all_text else None
 
+    return text, tools, list(files)
+
+
+# Block size for reading a transcript backwards from EOF.
+_BLOCK_SIZE = 64 * 1024
+
+
+def _reverse_lines(f, end, block_size=_BLOCK_SIZE):
+    """Yield (offset, line) for the lines of *f* before *end*, last first.
+
+    Reads fixed-size blocks backwards from *end*, so stopping early costs
+    only the blocks actually reached. Each *line* is raw bytes including its
+    trailing newline (the file's final line may lack one), and *offset* is
+    where it starts.
+    """
+    pos = end
+    tail = b""  # start of a line whose beginning lies in an earlier block
+    while pos > 0:
+        start = max(0, pos - block_size)
+        f.seek(start)
+        buf = f.read(pos - start) + tail
+        if start > 0:
+            cut = buf.find(b"\n") + 1
+            if not cut:
+                tail, pos = buf, start
+                continue
+            head, body = buf[:cut], buf[cut:]
+        else:
+            head, body = b"", buf
+        base = start + len(head)
+        e = len(body)
+        while e > 0:
+            s = body.rfind(b"\n", 0, e - 1) + 1
+            yield base + s, body[s:e]
+            e = s
+        tail, pos = head, start
+
+
+def read_lines_reverse(transcript_path, block_size=_BLOCK_SIZE):
+    """Yield (offset, line) pairs from the end of a transcript file backwards."""
+    with open(transcript_path, "rb") as f:
+        yield from _reverse_lines(f, os.fstat(f.fileno()).st_size, block_size)
+
+
+def _find_last_user(lines):
+    """Walk (offset, line) pairs until the last real user message.
+
+    Returns (entry, offset, line, skipped) where *skipped* holds the stripped
+    non-empty lines passed on the way, last first. entry is None when the
+    transcript has no real user message.
+    """
+    skipped = []
+    for offset, raw in lines:
+        line = raw.strip()
+        if not line:
+            continue
+        # Only user-typed lines can end the search; skip parsing the rest.
+        if b'"user"' in line:
+            try:
+                entry = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                entry = None
+            if entry and is_real_user_message(entry):
+                return entry, offset, raw, skipped
+        skipped.append(line)
+    return None, None, None, skipped
+
+
+def parse_last_turn(transcript_path):
+    """Extract text and tool call counts from the last assistant turn.
+
+    Reads the transcript backwards from EOF up to the last real user
+    message, then collects text blocks and tool_use counts from that point
+    forward. Cost scales with the last turn, not the whole transcript.
+
+    Returns (text, tools) where text is the concatenated assistant response
+    and tools is a dict of {tool_name: count}.
+    """
+    if not transcript_path or not os.path.exists(transcript_path):
+        return None, {}
+
+    _, _, _, turn_lines = _find_last_user(read_lines_reverse(transcript_path))
+    turn_lines.reverse()
+    text, tools, _ = _collect_turn(turn_lines)
     return text, tools
 
 
@@ -99,27 +188,173 @@ def parse_last_user_text(transcript_path):
     if not transcript_path or not os.path.exists(transcript_path):
         return None
 
-    lines = _read_transcript_lines(transcript_path)
+    entry, _, _, _ = _find_last_user(read_lines_reverse(transcript_path))
+    return _user_text(entry) if entry else None
 
-    for i in range(len(lines) - 1, -1, -1):
-        try:
-            entry = json.loads(lines[i])
-        except json.JSONDecodeError:
-            continue
-        if is_real_user_message(entry):
-            msg = entry.get("message", {})
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                return content
-            if isinstance(content, list):
-                parts = [
-                    b.get("text", "") if isinstance(b, dict) else str(b)
-                    for b in content
-                    if not (isinstance(b, dict) and b.get("type") == "tool_result")
-                ]
-                return " ".join(p for p in parts if p).strip()
 
-    return None
+# ---------------------------------------------------------------------------
+# Incremental tailing
+# ---------------------------------------------------------------------------
+
+# Bytes hashed at each end of the consumed prefix to detect a rewritten file.
+_CHECK_BYTES = 4096
+
+
+def _prefix_hash(f, offset):
+    """Hash the head and the tail of the first *offset* bytes of *f*.
+
+    Cheap stand-in for hashing the whole prefix: a truncated, replaced or
+    rewritten transcript changes one end or the other.
+    """
+    h = hashlib.sha1()
+    f.seek(0)
+    h.update(f.read(min(offset, _CHECK_BYTES)))
+    start = max(0, offset - _CHECK_BYTES)
+    f.seek(start)
+    h.update(f.read(offset - start))
+    return h.hexdigest()
+
+
+def _turn_from_checkpoint(cp):
+    """Build a parsed-turn dict from a checkpoint row."""
+    return {
+        "user_text": cp["user_text"],
+        "agent_text": cp["agent_text"],
+        "tools": parse_meta(cp["tools"]),
+        "files": json.loads(cp["files"]) if cp["files"] else [],
+        "turn_start": cp["turn_start"],
+        "turn_end": cp["turn_end"],
+    }
+
+
+def cached_turn(conn, session_id, transcript_path):
+    """Return the stored parsed turn if the transcript is unchanged since.
+
+    The artifact is keyed by transcript path, size and mtime, so a hit
+    needs only an ``os.stat()`` — the file itself is not opened. Returns
+    None on a miss.
+    """
+    if not session_id or not transcript_path:
+        return None
+    cp = get_transcript_checkpoint(conn, session_id)
+    if not cp or cp["path"] != transcript_path or cp["mtime_ns"] is None:
+        return None
+    try:
+        st = os.stat(transcript_path)
+    except OSError:
+        return None
+    if st.st_size != cp["size"] or st.st_mtime_ns != cp["mtime_ns"]:
+        return None
+    return _turn_from_checkpoint(cp)
+
+
+def last_turn(conn, session_id, transcript_path):
+    """Parse the last exchange of a transcript, once per transcript state.
+
+    Returns a dict with ``user_text``, ``agent_text``, ``tools`` (as in
+    parse_last_turn()), ``files`` (paths named in tool call inputs) and the
+    turn's byte range ``turn_start``/``turn_end``.
+
+    Every consumer in a Stop cycle (stop.py, analyze.py) calls this; the
+    first call parses and stores the result in ``transcript_checkpoints``,
+    later calls get it back via cached_turn() while the file is unchanged.
+
+    Parsing itself is incremental: only the bytes appended since the
+    previous checkpoint are scanned for user messages, using the consumed
+    offset, a hash of the consumed prefix, and where the current turn
+    starts. A missing, moved, truncated or rewritten transcript falls back
+    to reading backwards from EOF to the last real user message. The offset
+    advances only over complete lines, so a line still being written is
+    picked up on the next call.
+    """
+    empty = {
+        "user_text": None, "agent_text": None, "tools": {}, "files": [],
+        "turn_start": 0, "turn_end": 0,
+    }
+    if not transcript_path or not os.path.exists(transcript_path):
+        return empty
+
+    turn = cached_turn(conn, session_id, transcript_path)
+    if turn is not None:
+        return turn
+
+    with open(transcript_path, "rb") as f:
+        st = os.fstat(f.fileno())
+
+        offset = turn_start = 0
+        user_text = None
+        cp = get_transcript_checkpoint(conn, session_id) if session_id else None
+        if (
+            cp
+            and cp["path"] == transcript_path
+            and cp["byte_offset"] <= st.st_size
+            and _prefix_hash(f, cp["byte_offset"]) == cp["prefix_hash"]
+        ):
+            offset, turn_start, user_text = cp["byte_offset"], cp["turn_start"], cp["user_text"]
+        else:
+            # No usable checkpoint: seek back from EOF to the last complete
+            # real user message instead of scanning the whole file forward.
+            complete = (
+                (off, raw)
+                for off, raw in _reverse_lines(f, st.st_size)
+                if raw.endswith(b"\n")
+            )
+            entry, off, raw, _ = _find_last_user(complete)
+            if entry is not None:
+                offset = turn_start = off + len(raw)
+                user_text = _user_text(entry)
+
+        # Scan the new complete lines for real user messages
+        f.seek(offset)
+        pos = offset
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break  # partial line — leave it for the next call
+            line_end = pos + len(raw)
+            line = raw.strip()
+            if line and b'"user"' in line:
+                try:
+                    entry = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    entry = None
+                if entry and is_real_user_message(entry):
+                    turn_start = line_end
+                    user_text = _user_text(entry)
+            pos = line_end
+
+        # Parse the turn itself: everything after the last real user message
+        f.seek(turn_start)
+        agent_text, tools, files = _collect_turn(raw.strip() for raw in f if raw.strip())
+        turn_end = f.tell()
+
+        if session_id:
+            # Only key the artifact by (size, mtime) if that is what we read;
+            # a file that grew mid-read must be parsed again next time.
+            grew = turn_end != st.st_size
+            save_transcript_checkpoint(
+                conn,
+                session_id,
+                transcript_path,
+                byte_offset=pos,
+                prefix_hash=_prefix_hash(f, pos),
+                turn_start=turn_start,
+                turn_end=turn_end,
+                size=turn_end,
+                mtime_ns=None if grew else st.st_mtime_ns,
+                user_text=user_text,
+                agent_text=agent_text,
+                tools=json.dumps(tools) if tools else None,
+                files=json.dumps(files) if files else None,
+            )
+
+    return {
+        "user_text": user_text,
+        "agent_text": agent_text,
+        "tools": tools,
+        "files": files,
+        "turn_start": turn_start,
+        "turn_end": turn_end,
+    }
 
 
 def wait_for_transcript_stable(transcript_path, interval=0.1, max_wait=2):
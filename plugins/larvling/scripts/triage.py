@@ -0,0 +1,95 @@
+"""Larvling triage — cheap local scoring that spares low-value exchanges a model call.
+
+score() rates one queued exchange in [0, 1] from four signals:
+
+* **length** — words in the user text plus the response, saturating at
+  LENGTH_WORDS. "thanks" and one-line confirmations score near zero.
+* **novelty** — 1 minus the exchange's best cosine similarity to an existing
+  statement (vectors.py), scaled by length so a short text's accidental
+  dissimilarity counts for little. Restating what is already known scores low.
+* **commitment** — preference, decision or standing-instruction phrasing
+  ("I prefer", "we decided", "from now on", "remember that").
+* **task** — task vocabulary ("todo", "fix", "deadline", "follow up").
+
+analyze_batch() skips exchanges scoring below ``analysis_triage_threshold``
+(0 disables triage): they are marked 'skipped' in analysis_queue and logged
+with the reason, and a batch with nothing left makes no model call at all.
+"""
+
+import re
+
+LENGTH_WORDS = 120  # words at which the length signal saturates
+WEIGHTS = {"length": 0.3, "novelty": 0.3, "commitment": 0.25, "task": 0.15}
+
+_WORD = re.compile(r"\w+")
+_COMMITMENT = re.compile(
+    r"\b(?:i|we)(?:'m| am| are)? (?:always|never|usually|prefer|like|love|hate|"
+    r"want|need|decided|chose|agreed|will|won't|going to|should|must)\b"
+    r"|\b(?:i|we)'ll\b|\bmy (?:name|role|job|team|preference|goal)\b"
+    r"|\bfrom now on\b|\bgoing forward\b|\bremember (?:that|to)\b"
+    r"|\bdon't (?:ever|use|do)\b|\blet's\b",
+    re.IGNORECASE,
+)
+_TASK = re.compile(
+    r"\b(?:todo|to-do|task|tasks|fix|bug|implement|deadline|due|follow[- ]up|"
+    r"next steps?|blocked|remind|later|tomorrow|ship|release|backlog)\b",
+    re.IGNORECASE,
+)
+
+
+def _text(exchange):
+    return f"{exchange['user_text'] or ''}\n{exchange['agent_text'] or ''}"
+
+
+def score(conn, exchange):
+    """Return (score, signals) for one queued exchange.
+
+    *signals* maps each signal name to its unweighted value in [0, 1].
+    """
+    import vectors
+
+    text = _text(exchange)
+    length = min(1.0, len(_WORD.findall(text)) / LENGTH_WORDS)
+    novelty = 1.0
+    if length:
+        hits = vectors.search(conn, text, "statement", k=1)
+        if hits:
+            novelty = max(0.0, 1.0 - hits[0][1])
+    signals = {
+        "length": length,
+        "novelty": novelty * length,
+        "commitment": 1.0 if _COMMITMENT.search(text) else 0.0,
+        "task": 1.0 if _TASK.search(text) else 0.0,
+    }
+    return sum(WEIGHTS[k] * v for k, v in signals.items()), signals
+
+
+def reason(signals):
+    """Describe why an exchange scored low, e.g. "12 words, novelty 0.41"."""
+    words = round(signals["length"] * LENGTH_WORDS)
+    parts = [f"{words}{'+' if signals['length'] >= 1 else ''} words"]
+    if signals["length"]:
+        parts.append(f"novelty {signals['novelty'] / signals['length']:.2f}")
+    if not signals["commitment"] and not signals["task"]:
+        parts.append("no commitment or task phrasing")
+    return ", ".join(parts)
+
+
+def triage(conn, rows, threshold):
+    """Split queued exchanges into (keep, skipped).
+
+    *skipped* is a list of (row, score, reason). A *threshold* of 0 keeps all.
+    """
+    if not threshold:
+        return list(rows), []
+    import vectors
+
+    vectors.sync(conn)
+    keep, skipped = [], []
+    for row in rows:
+        s, signals = score(conn, row)
+        if s < threshold:
+            skipped.append((row, s, reason(signals)))
+        else:
+            keep.append(row)
+    return keep, skipped
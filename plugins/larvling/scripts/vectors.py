@@ -0,0 +1,151 @@
+"""Larvling vectors — offline embeddings for semantic recall and dedup.
+
+embed() maps text to a DIM-dimensional vector of signed, hashed word and
+character-trigram features (sublinear tf, L2-normalized). No model and no
+network: paraphrases that share word stems score high, and results are
+stable across runs. Vectors for statements.claim and topics.title live in
+the embeddings table as float32 BLOBs; triggers drop a row's vector when its
+text changes, and sync() embeds whatever is missing.
+
+search_many() scores a batch of queries against every vector of a kind with
+one matrix product when NumPy is installed. The matrix is cached per process
+until the table changes, so a warm process (the daemon, the analysis worker)
+answers in milliseconds at 100k statements. Without NumPy a sparse
+pure-Python dot product gives the same results, slower.
+"""
+
+import heapq
+import math
+import re
+import zlib
+from array import array
+
+from db import EMBEDDED, get_counts
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DIM = 256
+KINDS = {kind: (table, column) for kind, table, column in EMBEDDED}
+
+# kind -> ((row count, max id), ids, matrix); see _matrix().
+_cache = {}
+
+
+def _features(text):
+    """Word and character-trigram counts of normalized *text*."""
+    text = " ".join((text or "").lower().split())
+    feats = {}
+    for w in re.findall(r"\w+", text):
+        feats["w:" + w] = feats.get("w:" + w, 0) + 1
+    padded = f" {text} "
+    for i in range(len(padded) - 2):
+        g = "c:" + padded[i : i + 3]
+        feats[g] = feats.get(g, 0) + 1
+    return feats
+
+
+def embed(text):
+    """Embed *text* as a unit-length float32 array('f') of DIM values."""
+    vec = [0.0] * DIM
+    for feat, tf in _features(text).items():
+        h = zlib.crc32(feat.encode("utf-8"))
+        w = 1.0 + math.log(tf)
+        vec[h % DIM] += -w if h & 0x80000000 else w
+    norm = math.sqrt(sum(v * v for v in vec))
+    if norm:
+        vec = [v / norm for v in vec]
+    return array("f", vec)
+
+
+def sync(conn):
+    """Embed every statement/topic that has no vector yet. Returns the count."""
+    total = 0
+    for kind, (table, column) in KINDS.items():
+        rows = conn.execute(
+            f"SELECT t.id, t.{column} FROM {table} t "
+            f"LEFT JOIN embeddings e ON e.kind = ? AND e.ref_id = t.id "
+            f"WHERE e.ref_id IS NULL",
+            (kind,),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (kind, ref_id, vec) VALUES (?, ?, ?)",
+                ((kind, r[0], embed(r[1]).tobytes()) for r in rows),
+            )
+            total += len(rows)
+    if total:
+        conn.commit()
+    return total
+
+
+def _matrix(conn, kind):
+    """(ids, vectors) for *kind*, cached until the embeddings table changes.
+
+    Ids are AUTOINCREMENT, so any insert raises MAX(id) and any delete
+    lowers the row count: the (trigger-maintained count, MAX(id)) pair
+    identifies the table's contents and costs two O(1) lookups.
+    """
+    key = (
+        get_counts(conn, "embeddings")["embeddings"],
+        conn.execute("SELECT MAX(id) FROM embeddings").fetchone()[0],
+    )
+    hit = _cache.get(kind)
+    if hit and hit[0] == key:
+        return hit[1], hit[2]
+
+    rows = conn.execute(
+        "SELECT ref_id, vec FROM embeddings WHERE kind = ?", (kind,)
+    ).fetchall()
+    ids = [r[0] for r in rows]
+    if np is not None:
+        mat = np.frombuffer(b"".join(r[1] for r in rows), dtype=np.float32)
+        mat = mat.reshape(len(rows), DIM)
+    else:
+        mat = []
+        for r in rows:
+            v = array("f")
+            v.frombytes(r[1])
+            mat.append(v)
+    _cache[kind] = (key, ids, mat)
+    return ids, mat
+
+
+def search_many(conn, texts, kind="statement", k=10, min_score=0.0):
+    """Cosine top-k for each of *texts*. Returns one [(ref_id, score)] per text.
+
+    Scores are cosine similarities in [-1, 1], best first; hits at or below
+    *min_score* are dropped.
+    """
+    if not texts:
+        return []
+    ids, mat = _matrix(conn, kind)
+    if not ids:
+        return [[] for _ in texts]
+    queries = [embed(t) for t in texts]
+
+    if np is not None:
+        q = np.frombuffer(b"".join(v.tobytes() for v in queries), dtype=np.float32)
+        scores = q.reshape(len(queries), DIM) @ mat.T  # (queries, rows)
+        out = []
+        for row in scores:
+            top = np.argpartition(row, -k)[-k:] if k < len(ids) else np.arange(len(ids))
+            top = top[np.argsort(-row[top])]
+            out.append([(ids[i], float(row[i])) for i in top if row[i] > min_score])
+        return out
+
+    out = []
+    for qv in queries:
+        nz = [(i, v) for i, v in enumerate(qv) if v]
+        best = heapq.nlargest(
+            k, ((sum(row[i] * v for i, v in nz), rid) for rid, row in zip(ids, mat))
+        )
+        out.append([(rid, score) for score, rid in best if score > min_score])
+    return out
+
+
+def search(conn, text, kind="statement", k=10, min_score=0.0):
+    """Cosine top-k [(ref_id, score)] for one query text."""
+    return search_many(conn, [text], kind, k, min_score)[0]
@@ -0,0 +1,292 @@
+"""
+Larvling workers — supervised, bounded pool for queued exchange analysis.
+
+Usage:
+    python workers.py supervise            # run the supervisor in the foreground
+    python workers.py status               # supervisor PID, queue counts, triage savings
+    python workers.py run SESSION CLAIM    # analyze one claimed batch (what the supervisor spawns)
+
+The Stop hook queues each exchange in analysis_queue and then calls
+ensure_supervisor(), which starts one detached supervisor per project unless
+one already holds the PID file lock. The supervisor polls the queue, claims
+each session's batch once it is full (analysis_batch_max) or due
+(analysis_max_delay), and runs it in a worker process. It runs at most
+``analysis_workers`` workers at a time, at most one per session, and kills a
+worker's whole process group (the SDK's CLI child included) once it has run
+for ``analysis_job_timeout`` seconds.
+
+A worker that crashes, exits non-zero or times out has its claim released
+back to the queue (up to ANALYSIS_MAX_ATTEMPTS tries). Claims left behind
+by a supervisor that died are requeued once stale. The supervisor exits
+after IDLE_EXIT seconds with nothing queued or running.
+"""
+
+import os
+import sys
+import time
+
+from config import get_config
+from db import (
+    PROJECT_ROOT,
+    analysis_stats,
+    claim_analysis,
+    claimed_analysis,
+    log,
+    open_db,
+    ready_analysis,
+    recover_analysis,
+    release_analysis,
+)
+
+PID_PATH = os.path.join(PROJECT_ROOT, ".claude", "larvling-analysis.pid")
+POLL_INTERVAL = 2  # seconds between queue scans
+IDLE_EXIT = 60  # seconds with an empty queue and no workers before exiting
+CLAIM_TIMEOUT = 900  # seconds before an orphaned claim is requeued (at least)
+KILL_GRACE = 60  # seconds past the job timeout before its claim counts as stale
+_LOCK_OFFSET = 1 << 16  # Windows locks this byte, leaving the PID readable
+
+
+def _try_lock(f):
+    """Take a non-blocking exclusive lock on open file *f*; False if held."""
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(_LOCK_OFFSET)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _acquire_pid_lock():
+    """Hold the PID file lock for the supervisor's lifetime.
+
+    Returns the open file (keep a reference), or None if another supervisor
+    already holds it.
+    """
+    os.makedirs(os.path.dirname(PID_PATH), exist_ok=True)
+    f = open(PID_PATH, "a+", encoding="utf-8")
+    if not _try_lock(f):
+        f.close()
+        return None
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+def supervisor_pid():
+    """PID of the running supervisor, or None."""
+    try:
+        f = open(PID_PATH, "r", encoding="utf-8")
+    except OSError:
+        return None
+    with f:
+        if _try_lock(f):
+            return None  # nobody holds it; closing the file releases ours
+        f.seek(0)
+        try:
+            return int(f.read().strip() or 0) or None
+        except ValueError:
+            return None
+
+
+def ensure_supervisor():
+    """Start a detached supervisor unless one is already running."""
+    if supervisor_pid() is not None:
+        return
+    from hooks_util import spawn_background
+
+    try:
+        spawn_background([os.path.abspath(__file__), "supervise"])
+    except OSError as e:
+        log("analysis_supervisor", error=f"spawn failed: {e}")
+
+
+# ---------------------------------------------------------------------------
+# Supervisor
+# ---------------------------------------------------------------------------
+
+
+class Job:
+    """One worker process analyzing one claimed batch."""
+
+    def __init__(self, session_id, claim, size):
+        import subprocess
+
+        self.session_id = session_id
+        self.claim = claim
+        self.size = size
+        self.started = time.monotonic()
+        creation = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run", session_id, claim],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            creationflags=creation,
+            start_new_session=(os.name != "nt"),  # own group: kill() reaches the SDK's CLI
+        )
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def kill(self):
+        if os.name == "nt":
+            self.proc.kill()
+        else:
+            import signal
+
+            try:
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.proc.wait()
+
+
+def _reap(jobs, timeout):
+    """Collect finished and overdue workers; release the claims they left."""
+    for sid, job in list(jobs.items()):
+        code = job.proc.poll()
+        if code is None and timeout and job.elapsed() > timeout:
+            job.kill()
+            code, error = "timeout", f"timed out after {timeout}s"
+        elif code is None:
+            continue
+        else:
+            error = f"worker exited with {code}"
+        del jobs[sid]
+        ms = round(job.elapsed() * 1000)
+        log("analysis_job", sid, exchanges=job.size, code=code, ms=ms)
+        if code != 0:
+            # No-op when the worker already released or completed its claim.
+            with open_db() as conn:
+                release_analysis(conn, job.claim, error)
+
+
+def _schedule(conn, jobs, cfg):
+    """Claim ready batches for free worker slots. Returns jobs started."""
+    slots = max(1, int(cfg["analysis_workers"])) - len(jobs)
+    if slots <= 0:
+        return 0
+    batch_max = max(1, int(cfg["analysis_batch_max"]))
+    started = 0
+    for sid in ready_analysis(conn, batch_max, cfg["analysis_max_delay"]):
+        if sid in jobs:
+            continue  # one batch per session at a time keeps results in order
+        claim, rows = claim_analysis(conn, sid, batch_max)
+        if not rows:
+            continue
+        try:
+            jobs[sid] = Job(sid, claim, len(rows))
+        except OSError as e:
+            release_analysis(conn, claim, f"spawn failed: {e}")
+            continue
+        started += 1
+        if started >= slots:
+            break
+    return started
+
+
+def supervise():
+    """Run the scheduling loop until the queue has been idle for IDLE_EXIT."""
+    import eventlog
+
+    lock = _acquire_pid_lock()
+    if lock is None:
+        return  # another supervisor owns this project
+    jobs = {}
+    idle_since = time.monotonic()
+    log("analysis_supervisor", started=True)
+    try:
+        while True:
+            cfg = get_config()
+            timeout = cfg["analysis_job_timeout"]
+            _reap(jobs, timeout)
+            with open_db() as conn:
+                stale = max(CLAIM_TIMEOUT, timeout + KILL_GRACE) if timeout else CLAIM_TIMEOUT
+                requeued = recover_analysis(conn, stale)
+                if requeued:
+                    log("analysis_requeued", exchanges=requeued)
+                if cfg["analysis"]:
+                    _schedule(conn, jobs, cfg)
+                queued = conn.execute(
+                    "SELECT COUNT(*) FROM analysis_queue WHERE status IN ('pending', 'claimed')"
+                ).fetchone()[0]
+            eventlog.flush()
+            if jobs or (queued and cfg["analysis"]):
+                idle_since = time.monotonic()
+            elif time.monotonic() - idle_since > IDLE_EXIT:
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        for job in jobs.values():
+            job.kill()  # only reached on an error; their claims go stale
+        log("analysis_supervisor", stopped=True)
+        # The file stays: unlinking it would let a new supervisor lock a
+        # fresh inode while this one still holds the old lock.
+        lock.close()
+    # A Stop hook that queued work after the last scan saw this supervisor
+    # alive and didn't spawn one; pick that work up now the lock is free.
+    with open_db() as conn:
+        pending = conn.execute(
+            "SELECT 1 FROM analysis_queue WHERE status = 'pending' LIMIT 1"
+        ).fetchone()
+    if pending and get_config()["analysis"]:
+        ensure_supervisor()
+
+
+# ---------------------------------------------------------------------------
+# Worker
+# ---------------------------------------------------------------------------
+
+
+def run_job(session_id, claim):
+    """Analyze the batch held by *claim*. Returns the process exit code."""
+    from analyze import analyze_batch
+
+    with open_db() as conn:
+        rows = claimed_analysis(conn, claim)
+    if not rows:
+        return 0  # requeued as stale and picked up elsewhere
+    return 0 if analyze_batch(session_id, claim, rows, get_config()) else 1
+
+
+def status():
+    pid = supervisor_pid()
+    print(f"supervisor: {'pid ' + str(pid) if pid else 'not running'}")
+    with open_db() as conn:
+        for r in conn.execute(
+            "SELECT status, COUNT(*) FROM analysis_queue GROUP BY status ORDER BY status"
+        ):
+            print(f"{r[0]}: {r[1]}")
+        stats = analysis_stats(conn)
+    if stats["done"] or stats["skipped"]:
+        print(
+            f"triage: skipped {stats['skipped']} of {stats['done'] + stats['skipped']} "
+            f"exchanges ({stats['skip_rate']:.0%}), ~{stats['saved_ms'] / 1000:.0f}s of "
+            f"model time saved ({stats['model_ms'] / 1000:.0f}s spent)"
+        )
+
+
+def main():
+    cmd = sys.argv[1] if len(sys.argv) > 1 else None
+    if cmd == "supervise":
+        supervise()
+    elif cmd == "status":
+        status()
+    elif cmd == "run" and len(sys.argv) == 4:
+        sys.exit(run_job(sys.argv[2], sys.argv[3]))
+    else:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+"""Put scripts/ on the import path and point the project root at a scratch
+directory, so event-log writes from the code under test stay out of the tree."""
+
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+os.environ["CLAUDE_PROJECT_DIR"] = tempfile.mkdtemp(prefix="larvling-tests-")
+sys.path.insert(0, os.path.join(HERE, "..", "scripts"))
+sys.path.insert(0, HERE)
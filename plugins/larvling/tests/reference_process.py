@@ -0,0 +1,316 @@
+"""Reference implementation for test_process.py: process_knowledge() and
+process_tasks() as they were before the set-based rewrite, applying each
+extracted item with its own queries, one at a time.
+
+Kept verbatim (apart from these imports) as the behavior the bulk version
+in scripts/analyze.py must reproduce. Do not optimize.
+"""
+
+import json
+
+from analyze import VALID_DOMAINS, VALID_HORIZON, VALID_PRIORITY, VALID_STATUS
+from db import has_table, log
+
+
+def _skip(session_id, action, reason, **extra):
+    """Log a skipped extraction item."""
+    log("extraction_skipped", session_id, action=action, reason=reason, **extra)
+
+
+def _parse_id(value, field_name, action, session_id):
+    """Parse an integer ID field. Returns int or None (with logging)."""
+    if value is None:
+        _skip(session_id, action, f"missing {field_name}")
+        return None
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        _skip(session_id, action, f"invalid {field_name}", value=str(value))
+        return None
+
+
+def process_knowledge(conn, knowledge_list, session_id=None):
+    """Process extracted knowledge into topics+statements tables.
+
+    Handles 4 actions: add_topic, add_statement, update_statement, update_topic.
+    Never deletes data — retirement is done via updates, not removal.
+    Returns (topics_inserted, stmts_inserted, stmts_updated, topics_updated).
+    """
+    if not knowledge_list or not has_table(conn, "topics"):
+        return 0, 0, 0, 0
+
+    topics_inserted = 0
+    stmts_inserted = 0
+    stmts_updated = 0
+    topics_updated = 0
+
+    for item in knowledge_list:
+        action = item.get("action", "").strip().lower()
+        if action not in (
+            "add_topic",
+            "add_statement",
+            "update_statement",
+            "update_topic",
+        ):
+            continue
+
+        if action == "update_topic":
+            topic_id = _parse_id(item.get("topic_id"), "topic_id", action, session_id)
+            if topic_id is None:
+                continue
+            if not conn.execute(
+                "SELECT 1 FROM topics WHERE id = ?", (topic_id,)
+            ).fetchone():
+                _skip(session_id, action, "topic not found", topic_id=topic_id)
+                continue
+            title = item.get("topic_title", "").strip()
+            domain = item.get("domain", "").strip().lower()
+            if domain and domain not in VALID_DOMAINS:
+                _skip(session_id, action, "invalid domain", domain=domain)
+                continue
+            tags = item.get("tags", "").strip()
+            if title:
+                conn.execute(
+                    "UPDATE topics SET title = ?, domain = COALESCE(?, domain), "
+                    "tags = COALESCE(?, tags), updated = datetime('now') WHERE id = ?",
+                    (title, domain or None, tags or None, topic_id),
+                )
+                topics_updated += 1
+            continue
+
+        if action == "update_statement":
+            stmt_id = _parse_id(
+                item.get("statement_id"), "statement_id", action, session_id
+            )
+            if stmt_id is None:
+                continue
+            claim = item.get("claim", "").strip()
+            if not claim:
+                _skip(session_id, action, "missing claim")
+                continue
+            if not conn.execute(
+                "SELECT 1 FROM statements WHERE id = ?", (stmt_id,)
+            ).fetchone():
+                _skip(session_id, action, "statement not found", statement_id=stmt_id)
+                continue
+            conn.execute(
+                "UPDATE statements SET claim = ?, updated = datetime('now') WHERE id = ?",
+                (claim, stmt_id),
+            )
+            stmts_updated += 1
+            continue
+
+        if action == "add_statement":
+            topic_id = _parse_id(item.get("topic_id"), "topic_id", action, session_id)
+            if topic_id is None:
+                continue
+            claim = item.get("claim", "").strip()
+            if not claim:
+                _skip(session_id, action, "missing claim")
+                continue
+            if not conn.execute(
+                "SELECT 1 FROM topics WHERE id = ?", (topic_id,)
+            ).fetchone():
+                _skip(session_id, action, "topic not found", topic_id=topic_id)
+                continue
+            # Exact-match dedup safety net
+            if conn.execute(
+                "SELECT 1 FROM statements WHERE topic_id = ? AND claim = ?",
+                (topic_id, claim),
+            ).fetchone():
+                continue
+            conn.execute(
+                "INSERT INTO statements (topic_id, claim) VALUES (?, ?)",
+                (topic_id, claim),
+            )
+            stmts_inserted += 1
+            continue
+
+        # add_topic: new topic + first statement
+        claim = item.get("claim", "").strip()
+        if not claim:
+            _skip(session_id, action, "missing claim")
+            continue
+        topic_title = item.get("topic_title", "").strip()
+        if not topic_title:
+            _skip(session_id, action, "missing topic_title")
+            continue
+        domain = item.get("domain", "").strip().lower()
+        if not domain or domain not in VALID_DOMAINS:
+            _skip(session_id, action, "invalid domain", domain=domain)
+            continue
+        tags = item.get("tags", "").strip()
+        if not tags:
+            _skip(session_id, action, "missing tags")
+            continue
+
+        # Exact-match dedup on claim
+        if conn.execute(
+            "SELECT 1 FROM statements WHERE claim = ?", (claim,)
+        ).fetchone():
+            continue
+
+        cur = conn.execute(
+            "INSERT INTO topics (title, domain, tags) VALUES (?, ?, ?)",
+            (topic_title, domain, tags),
+        )
+        topic_id = cur.lastrowid
+        conn.execute(
+            "INSERT INTO statements (topic_id, claim) VALUES (?, ?)",
+            (topic_id, claim),
+        )
+        topics_inserted += 1
+        stmts_inserted += 1
+
+    return topics_inserted, stmts_inserted, stmts_updated, topics_updated
+
+
+def process_tasks(conn, tasks_list, session_id=None):
+    """Process extracted tasks into tasks+updates tables.
+
+    Handles 3 actions: add_task, add_update, update_task.
+    Returns (tasks_inserted, updates_inserted, tasks_updated).
+    """
+    if not tasks_list or not has_table(conn, "tasks"):
+        return 0, 0, 0
+
+    tasks_inserted = 0
+    updates_inserted = 0
+    tasks_updated = 0
+
+    for task in tasks_list:
+        action = task.get("action", "").strip().lower()
+        if action not in ("add_task", "add_update", "update_task"):
+            continue
+
+        if action == "add_update":
+            task_id = _parse_id(task.get("task_id"), "task_id", action, session_id)
+            if task_id is None:
+                continue
+            content = task.get("content", "").strip()
+            if not content:
+                _skip(session_id, action, "missing content")
+                continue
+            if not conn.execute(
+                "SELECT 1 FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone():
+                _skip(session_id, action, "task not found", task_id=task_id)
+                continue
+            # Exact-match dedup safety net
+            if conn.execute(
+                "SELECT 1 FROM updates WHERE task_id = ? AND content = ?",
+                (task_id, content),
+            ).fetchone():
+                continue
+            conn.execute(
+                "INSERT INTO updates (task_id, content) VALUES (?, ?)",
+                (task_id, content),
+            )
+            updates_inserted += 1
+            continue
+
+        if action == "update_task":
+            task_id = _parse_id(task.get("task_id"), "task_id", action, session_id)
+            if task_id is None:
+                continue
+            content = task.get("content", "").strip()
+            if not conn.execute(
+                "SELECT 1 FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone():
+                _skip(session_id, action, "task not found", task_id=task_id)
+                continue
+
+            # Build SET clause — skip invalid enum values
+            sets = []
+            params = []
+            status = task.get("status", "").strip().lower()
+            if status:
+                if status not in VALID_STATUS:
+                    _skip(session_id, action, "invalid status", status=status)
+                    continue
+                sets.append("status = ?")
+                params.append(status)
+            priority = task.get("priority", "").strip().lower()
+            if priority:
+                if priority not in VALID_PRIORITY:
+                    _skip(session_id, action, "invalid priority", priority=priority)
+                    continue
+                sets.append("priority = ?")
+                params.append(priority)
+            horizon = task.get("horizon", "").strip().lower()
+            if horizon:
+                if horizon not in VALID_HORIZON:
+                    _skip(session_id, action, "invalid horizon", horizon=horizon)
+                    continue
+                sets.append("horizon = ?")
+                params.append(horizon)
+            title = task.get("title", "").strip()
+            if title:
+                sets.append("title = ?")
+                params.append(title)
+
+            if sets:
+                sets.append("updated = datetime('now')")
+                params.append(task_id)
+                conn.execute(
+                    f"UPDATE tasks SET {', '.join(sets)} WHERE id = ?",
+                    params,
+                )
+                tasks_updated += 1
+
+            # Record the reason as an update entry
+            if content:
+                # Exact-match dedup safety net
+                if not conn.execute(
+                    "SELECT 1 FROM updates WHERE task_id = ? AND content = ?",
+                    (task_id, content),
+                ).fetchone():
+                    conn.execute(
+                        "INSERT INTO updates (task_id, content) VALUES (?, ?)",
+                        (task_id, content),
+                    )
+                    updates_inserted += 1
+            continue
+
+        # add_task: new task
+        title = task.get("title", "").strip()
+        if not title:
+            _skip(session_id, action, "missing title")
+            continue
+        domain = task.get("domain", "").strip().lower()
+        if not domain or domain not in VALID_DOMAINS:
+            _skip(session_id, action, "invalid domain", domain=domain)
+            continue
+        priority = task.get("priority", "").strip().lower()
+        if not priority or priority not in VALID_PRIORITY:
+            _skip(session_id, action, "invalid priority", priority=priority)
+            continue
+        horizon = task.get("horizon", "").strip().lower()
+        if not horizon or horizon not in VALID_HORIZON:
+            _skip(session_id, action, "invalid horizon", horizon=horizon)
+            continue
+
+        # Dedup: skip if a task with this title exists in ANY status. An open match
+        # is a duplicate; a 'dropped' or 'done' match is a tombstone — re-adding it
+        # would resurrect retired work. Reopening must go through update_task, never
+        # an automatic insert. (Prompt enforces this fuzzily; this is the hard floor.)
+        if conn.execute(
+            "SELECT 1 FROM tasks WHERE title = ? AND status IN ('open', 'dropped', 'done')",
+            (title,),
+        ).fetchone():
+            continue
+
+        if session_id:
+            metadata = json.dumps({"source_session_id": session_id})
+            conn.execute(
+                "INSERT INTO tasks (title, domain, priority, horizon, metadata) VALUES (?, ?, ?, ?, ?)",
+                (title, domain, priority, horizon, metadata),
+            )
+        else:
+            conn.execute(
+                "INSERT INTO tasks (title, domain, priority, horizon) VALUES (?, ?, ?, ?)",
+                (title, domain, priority, horizon),
+            )
+        tasks_inserted += 1
+
+    return tasks_inserted, updates_inserted, tasks_updated
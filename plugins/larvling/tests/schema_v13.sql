@@ -0,0 +1,60 @@
+-- Schema version 13, as databases created before the analysis queue,
+-- counters and FTS indexes have it. test_migration.py starts from it.
+CREATE TABLE sessions (
+            id TEXT PRIMARY KEY,
+            started_at TEXT NOT NULL,
+            ended_at TEXT,
+            duration_min REAL,
+            title TEXT,
+            agent_summary TEXT,
+            exchange_count INTEGER,
+            summary_at TEXT,
+            summary_msg_count INTEGER,
+            tags TEXT,
+            summary_offered INTEGER DEFAULT 0
+        );
+CREATE TABLE messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL REFERENCES sessions(id),
+            timestamp TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            role TEXT NOT NULL,
+            content TEXT,
+            metadata TEXT
+        );
+CREATE TABLE topics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            domain TEXT NOT NULL CHECK(domain IN ('personal', 'professional', 'preferences', 'interests', 'knowledge', 'technical', 'workflow')),
+            tags TEXT NOT NULL,
+            created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+CREATE TABLE statements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL REFERENCES topics(id),
+            claim TEXT NOT NULL,
+            created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+CREATE TABLE tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            domain TEXT NOT NULL CHECK(domain IN ('personal', 'professional', 'preferences', 'interests', 'knowledge', 'technical', 'workflow')),
+            status TEXT NOT NULL DEFAULT 'open' CHECK(status IN ('open', 'done', 'dropped')),
+            priority TEXT NOT NULL DEFAULT 'medium' CHECK(priority IN ('low', 'medium', 'high')),
+            horizon TEXT NOT NULL DEFAULT 'later' CHECK(horizon IN ('now', 'soon', 'later')),
+            metadata TEXT,
+            created TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+CREATE TABLE updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL REFERENCES tasks(id),
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+CREATE INDEX idx_messages_session ON messages(session_id);
+CREATE INDEX idx_messages_session_role ON messages(session_id, role);
+CREATE INDEX idx_statements_topic ON statements(topic_id);
+CREATE INDEX idx_tasks_status ON tasks(status);
+CREATE INDEX idx_updates_task ON updates(task_id);
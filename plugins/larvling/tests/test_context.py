@@ -0,0 +1,24 @@
+"""ContextBuilder: lines are ranked and dropped to fit the budget, never rewritten."""
+
+from context import ContextBuilder
+
+SUMMARY = "Reworked the importer.\n\nOpen: " + "retry policy " * 60
+
+
+def test_unlimited_budget_keeps_lines_verbatim():
+    ctx = ContextBuilder(0)
+    ctx.section("## Recent Sessions").add(SUMMARY)
+    text, report = ctx.render()
+    assert SUMMARY in text
+    assert report["dropped"] == {}
+
+
+def test_budget_drops_whole_lines():
+    ctx = ContextBuilder(60)
+    sec = ctx.section("## Recent Sessions")
+    sec.add("- short, high score", 1.0)
+    sec.add(SUMMARY, 0.5)
+    text, report = ctx.render()
+    assert "- short, high score" in text
+    assert "retry policy" not in text
+    assert report["dropped"] == {"Recent Sessions": 1}
@@ -0,0 +1,105 @@
+"""A version 13 database through preflight and --finalize-migration:
+preflight adds the new tables and columns right away, the hooks must run
+cleanly (with correct counts) before finalize, and finalize must then
+complete the schema.
+"""
+
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from db import SCHEMA_VERSION
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = os.path.join(HERE, "..", "scripts")
+
+
+@pytest.fixture
+def project(tmp_path):
+    claude = tmp_path / ".claude"
+    claude.mkdir()
+    # No supervisor or network refresh spawned from a test run.
+    (claude / "larvling.config.json").write_text(json.dumps({"analysis": False}))
+    conn = sqlite3.connect(claude / "larvling.db")
+    with open(os.path.join(HERE, "schema_v13.sql"), encoding="utf-8") as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO sessions (id, started_at) VALUES ('old', '2026-01-01')")
+    for role in ("user", "assistant", "user", "assistant"):
+        conn.execute(
+            "INSERT INTO messages (session_id, role, content) VALUES ('old', ?, 'see scripts/db.py')",
+            (role,),
+        )
+    conn.execute("PRAGMA user_version = 13")
+    conn.commit()
+    conn.close()
+    return tmp_path
+
+
+def run(project, script, *args, payload=None):
+    env = dict(os.environ, CLAUDE_PROJECT_DIR=str(project), PYTHONPATH=SCRIPTS)
+    env.pop("LARVLING_INTERNAL", None)
+    return subprocess.run(
+        [sys.executable, os.path.join(SCRIPTS, script), *args],
+        input=json.dumps(payload or {}).encode(), env=env, cwd=project,
+        capture_output=True, timeout=60,
+    )
+
+
+def events(project):
+    path = project / ".claude" / "larvling.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_preflight_adds_tables_and_columns(project):
+    out = run(project, "preflight.py")
+    assert b"Schema Migration Required" in out.stdout
+
+    conn = sqlite3.connect(project / ".claude" / "larvling.db")
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 13
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"analysis_queue", "counters", "state", "embeddings"} <= tables
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(sessions)")}
+    assert {"message_count", "user_count", "assistant_count"} <= columns
+    conn.close()
+
+
+def test_hooks_run_before_finalize(project):
+    out = run(project, "preflight.py")
+    assert b"Schema Migration Required" in out.stdout
+
+    payload = {
+        "session_id": "new", "prompt": "fix the bug in scripts/db.py",
+        "transcript_path": str(project / "missing.jsonl"), "matcher": "startup",
+    }
+    for hook in ("session_start", "prompt", "stop", "session_end"):
+        result = run(project, "larvling_hook.py", hook, payload=payload)
+        assert result.returncode == 0, (hook, result.stderr)
+    assert [e for e in events(project) if "error" in e or e["event"].endswith("_error")] == []
+    assert not (project / ".claude" / "larvling-health.json").exists()
+
+    conn = sqlite3.connect(project / ".claude" / "larvling.db")
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 13
+    counts = dict(conn.execute("SELECT id, user_count FROM sessions").fetchall())
+    assert counts == {"old": 2, "new": 1}
+    assert dict(conn.execute("SELECT name, value FROM counters"))["messages"] == 5
+    conn.close()
+
+
+def test_finalize_after_preflight(project):
+    run(project, "preflight.py")
+    result = run(project, "preflight.py", "--finalize-migration")
+    assert result.returncode == 0, result.stderr
+
+    conn = sqlite3.connect(project / ".claude" / "larvling.db")
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT message_count FROM sessions").fetchone()[0] == 4
+    assert conn.execute(
+        "SELECT COUNT(*) FROM messages_fts WHERE messages_fts MATCH 'scripts'"
+    ).fetchone()[0] == 4
+    conn.close()
@@ -0,0 +1,259 @@
+"""process_knowledge() / process_tasks(): the set-based versions in analyze.py
+against the row-by-row reference (reference_process.py) on the same fixture.
+
+Each case compares the return values, every affected table (ids included)
+and the extraction_skipped entries in the order they were logged.
+"""
+
+import random
+import sqlite3
+
+import pytest
+
+import analyze
+import reference_process
+from db import create_schema
+
+
+def make_db():
+    """Small knowledge base with every task status and id gaps to skip over."""
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    create_schema(conn)
+    for title in ("Editors", "Python", "Deploys", "Scratch"):
+        conn.execute(
+            "INSERT INTO topics (title, domain, tags) VALUES (?, 'technical', 't')", (title,)
+        )
+    for topic_id, claim in (
+        (1, "Uses vim"),
+        (1, "Prefers tabs"),
+        (2, "Targets Python 3.11"),
+        (3, "Deploys with docker"),
+        (3, "Uses vim"),  # same claim under another topic
+        (4, "Throwaway"),
+    ):
+        conn.execute("INSERT INTO statements (topic_id, claim) VALUES (?, ?)", (topic_id, claim))
+    for title, status in (
+        ("Write docs", "open"),
+        ("Fix login bug", "done"),
+        ("Port to Rust", "dropped"),
+        ("Release 2.0", "open"),
+        ("Scratch task", "open"),
+    ):
+        conn.execute(
+            "INSERT INTO tasks (title, domain, status) VALUES (?, 'technical', ?)", (title, status)
+        )
+    for task_id, content in ((1, "Outline done"), (2, "Shipped in 1.4"), (4, "Blocked on CI")):
+        conn.execute("INSERT INTO updates (task_id, content) VALUES (?, ?)", (task_id, content))
+    # Deleted rows: their ids are missing, and AUTOINCREMENT won't reuse them.
+    conn.execute("DELETE FROM statements WHERE id = 6")
+    conn.execute("DELETE FROM topics WHERE id = 4")
+    conn.execute("DELETE FROM tasks WHERE id = 5")
+    conn.commit()
+    return conn
+
+
+def dump(conn):
+    tables = (
+        ("topics", "id, title, domain, tags"),
+        ("statements", "id, topic_id, claim"),
+        ("tasks", "id, title, domain, status, priority, horizon, metadata"),
+        ("updates", "id, task_id, content"),
+        ("counters", "*"),
+    )
+    return {
+        table: [tuple(r) for r in conn.execute(f"SELECT {cols} FROM {table} ORDER BY 1")]
+        for table, cols in tables
+    }
+
+
+def run(module, knowledge, tasks, session_id, monkeypatch):
+    skips = []
+    monkeypatch.setattr(
+        module, "_skip",
+        lambda sid, action, reason, **extra: skips.append((action, reason, extra)),
+    )
+    conn = make_db()
+    returned = (
+        module.process_knowledge(conn, [dict(i) for i in knowledge], session_id),
+        module.process_tasks(conn, [dict(t) for t in tasks], session_id),
+    )
+    return returned, dump(conn), skips
+
+
+def assert_same(knowledge, tasks, monkeypatch, session_id="s1"):
+    expected = run(reference_process, knowledge, tasks, session_id, monkeypatch)
+    actual = run(analyze, knowledge, tasks, session_id, monkeypatch)
+    assert actual[0] == expected[0], "return values"
+    assert actual[1] == expected[1], "table contents"
+    assert actual[2] == expected[2], "skip log"
+    return actual
+
+
+def topic(claim, title="New topic", **fields):
+    return {"action": "add_topic", "topic_title": title, "claim": claim,
+            "domain": "technical", "tags": "x", **fields}
+
+
+def task(title, **fields):
+    return {"action": "add_task", "title": title, "domain": "technical",
+            "priority": "low", "horizon": "soon", **fields}
+
+
+def test_duplicates_within_one_batch(monkeypatch):
+    knowledge = [
+        topic("Likes fish shell"),
+        topic("Likes fish shell", title="Shells"),  # same claim again
+        topic("Uses vim"),  # claim already stored
+        dict(action="add_statement", topic_id=2, claim="Uses uv"),
+        dict(action="add_statement", topic_id=2, claim="Uses uv"),
+        dict(action="add_statement", topic_id=1, claim="Uses vim"),  # stored pair
+        dict(action="add_statement", topic_id=2, claim="Uses vim"),  # claim elsewhere: new pair
+    ]
+    tasks = [
+        task("Add CI"),
+        task("Add CI"),
+        task("Fix login bug"),  # done: a tombstone
+        task("Port to Rust"),  # dropped: a tombstone
+        dict(action="add_update", task_id=1, content="Intro written"),
+        dict(action="add_update", task_id=1, content="Intro written"),
+        dict(action="add_update", task_id=1, content="Outline done"),  # stored
+        dict(action="update_task", task_id=4, status="done", content="Intro written"),
+    ]
+    (k, t), tables, _ = assert_same(knowledge, tasks, monkeypatch)
+    assert k == (1, 3, 0, 0)
+    assert t == (1, 2, 1)
+
+
+def test_updates_to_rows_created_in_the_same_batch(monkeypatch):
+    # Existing max ids are 3 topics (4 deleted), 5 statements, 4 tasks (5 deleted).
+    knowledge = [
+        topic("Reads Rust docs", title="Rust"),  # topic 5, statement 7
+        dict(action="add_statement", topic_id=5, claim="Learning ownership"),  # statement 8
+        dict(action="update_topic", topic_id=5, topic_title="Rust language", tags="rust"),
+        dict(action="update_statement", statement_id=8, claim="Learning borrowing"),
+        dict(action="update_statement", statement_id=7, claim="Uses vim"),  # now a dup claim
+        topic("Reads Rust docs", title="Again"),  # its old claim is free again
+        topic("Uses vim", title="Again"),
+    ]
+    tasks = [
+        task("Set up fuzzing"),  # task 6
+        dict(action="add_update", task_id=6, content="Picked a fuzzer"),
+        dict(action="update_task", task_id=6, title="Set up fuzz CI", horizon="now",
+             content="Renamed"),
+        task("Set up fuzzing"),  # the title was freed by the rename
+        task("Set up fuzz CI"),
+        dict(action="update_task", task_id=1, status="dropped"),
+        task("Write docs"),  # still counted: a dropped task is a tombstone
+    ]
+    (k, t), tables, _ = assert_same(knowledge, tasks, monkeypatch)
+    assert k == (2, 3, 2, 1)
+    assert [r[0] for r in tables["topics"]] == [1, 2, 3, 5, 6]
+    assert t == (2, 2, 2)
+
+
+def test_missing_and_invalid_ids(monkeypatch):
+    knowledge = [
+        dict(action="add_statement", topic_id=4, claim="Deleted topic"),
+        dict(action="add_statement", topic_id=999, claim="No such topic"),
+        dict(action="update_statement", statement_id=6, claim="Deleted statement"),
+        dict(action="update_statement", statement_id="six", claim="Bad id"),
+        dict(action="update_topic", topic_title="No id"),
+        dict(action="update_topic", topic_id=1, domain="nonsense"),
+        dict(action="add_statement", topic_id=6, claim="Topic made later in the batch"),
+        topic("Made later"),
+    ]
+    tasks = [
+        dict(action="add_update", task_id=5, content="Deleted task"),
+        dict(action="update_task", task_id=999, status="done"),
+        dict(action="update_task", task_id=None),
+        dict(action="add_update", task_id=7, content="Task made later in the batch"),
+        task("Made later"),
+    ]
+    (k, t), _, skips = assert_same(knowledge, tasks, monkeypatch)
+    assert k == (1, 1, 0, 0)
+    assert t == (1, 0, 0)
+    assert [reason for _, reason, _ in skips] == [
+        "topic not found",
+        "topic not found",
+        "statement not found",
+        "invalid statement_id",
+        "missing topic_id",
+        "invalid domain",
+        "topic not found",
+        "task not found",
+        "task not found",
+        "missing task_id",
+        "task not found",
+    ]
+
+
+def test_validation_skips_keep_item_order(monkeypatch):
+    knowledge = [
+        dict(action="add_statement", topic_id=999, claim="Looked up first"),
+        topic(""),  # missing claim: caught before any lookup
+        dict(action="update_statement", statement_id=999, claim="Looked up last"),
+        dict(topic_title="no action"),
+    ]
+    tasks = [
+        dict(action="add_update", task_id=999, content="Looked up"),
+        task("Bad", priority="urgent"),
+        dict(action="update_task", task_id=1, status="finished"),
+        task(""),
+    ]
+    _, _, skips = assert_same(knowledge, tasks, monkeypatch)
+    assert [(action, reason) for action, reason, _ in skips] == [
+        ("add_statement", "topic not found"),
+        ("add_topic", "missing claim"),
+        ("update_statement", "statement not found"),
+        ("add_update", "task not found"),
+        ("add_task", "invalid priority"),
+        ("update_task", "invalid status"),
+        ("add_task", "missing title"),
+    ]
+
+
+@pytest.mark.parametrize("session_id", [None, "s1"])
+def test_random_batches(monkeypatch, session_id):
+    rnd = random.Random(25)
+
+    def pick(options, p=0.85):
+        return rnd.choice(options) if rnd.random() < p else None
+
+    def knowledge_item():
+        item = {"action": rnd.choice(
+            ["add_topic", "add_statement", "update_statement", "update_topic", "bogus"]
+        )}
+        for field, options in (
+            ("topic_id", [1, 2, 3, 4, 5, 6, "x", -1]),
+            ("statement_id", [1, 4, 6, 7, 8, 9, "y"]),
+            ("claim", ["Uses vim", "Uses uv", "Prefers tabs", "New claim", "", " Uses uv "]),
+            ("topic_title", ["Editors", "Shells", ""]),
+            ("domain", ["technical", "nonsense", "", "Technical"]),
+            ("tags", ["a", ""]),
+        ):
+            value = pick(options)
+            if value is not None:
+                item[field] = value
+        return item
+
+    def task_item():
+        item = {"action": rnd.choice(["add_task", "add_update", "update_task", "bogus"])}
+        for field, options in (
+            ("task_id", [1, 2, 3, 5, 6, 7, "z"]),
+            ("content", ["Outline done", "Intro written", "", "New note"]),
+            ("title", ["Write docs", "Fix login bug", "Add CI", "Set up fuzzing", ""]),
+            ("domain", ["technical", "nonsense"]),
+            ("priority", ["low", "high", "urgent", ""]),
+            ("horizon", ["now", "later", "someday", ""]),
+            ("status", ["open", "done", "dropped", "finished", ""]),
+        ):
+            value = pick(options, 0.7)
+            if value is not None:
+                item[field] = value
+        return item
+
+    for _ in range(200):
+        knowledge = [knowledge_item() for _ in range(rnd.randint(0, 12))]
+        tasks = [task_item() for _ in range(rnd.randint(0, 12))]
+        assert_same(knowledge, tasks, monkeypatch, session_id)
@@ -0,0 +1,46 @@
+"""hooks/run.sh: a cached interpreter name is used only while it is one of
+the probed names; anything else is replaced by a fresh probe."""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RUN_SH = os.path.join(HERE, "..", "hooks", "run.sh")
+
+pytestmark = pytest.mark.skipif(shutil.which("sh") is None, reason="needs a POSIX sh")
+
+
+def launch(data_dir):
+    # LARVLING_INTERNAL makes larvling_hook.py exit 0 right after parsing
+    # its argument, so only the launcher is exercised.
+    env = dict(os.environ, CLAUDE_PLUGIN_DATA=str(data_dir), LARVLING_INTERNAL="1")
+    env.pop("CLAUDE_PLUGIN_ROOT", None)
+    return subprocess.run(["sh", RUN_SH, "prompt"], env=env, capture_output=True, timeout=30)
+
+
+def test_probes_and_caches_a_name(tmp_path):
+    result = launch(tmp_path)
+    assert result.returncode == 0, result.stderr
+    name = (tmp_path / "python").read_text().strip()
+    assert name.startswith("python") and os.sep not in name
+
+
+def test_planted_cache_is_replaced(tmp_path):
+    marker = tmp_path / "ran"
+    evil = tmp_path / "evil"
+    evil.write_text(f"#!/bin/sh\ntouch {marker}\n")
+    evil.chmod(0o755)
+    (tmp_path / "python").write_text(f"{evil}\n")
+    result = launch(tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert not marker.exists()
+    assert (tmp_path / "python").read_text().strip().startswith("python")
+
+
+def test_unknown_hook_fails(tmp_path):
+    env = dict(os.environ, CLAUDE_PLUGIN_DATA=str(tmp_path))
+    result = subprocess.run(["sh", RUN_SH, "nope"], env=env, capture_output=True, timeout=30)
+    assert result.returncode == 1